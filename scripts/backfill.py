@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Resumable backfill: reprocess the raw files of a date range through silver
+and gold in checkpointed units.
+  data/_backfill_state.json : {"from", "to", "days_in_flight", "units": [[day, ...]], "done", "current",
+                               "started_at", "updated_at"}
+The range is cut into units of at most --days-in-flight consecutive raw days,
+which bounds the files cleaned at once (to_silver workers) and the silver batch
+the gold upsert holds in memory. A unit is cleaned whether or not the silver
+manifest says it changed, upserted into gold (to_gold --files), then
+checkpointed. Re-running the same command after a crash skips committed units
+and redoes the interrupted one: every file is written to a temp name and
+renamed, the CDC run of a dead to_gold is never committed, and the nk index
+is checked against gold first (a crash between a partition rewrite and the
+index save leaves it stale).
+
+  python scripts/backfill.py --from 20261012 --to 20261018 [--days-in-flight 4] [--workers 2]
+  python scripts/backfill.py --from 20261012 --to 20261018 --restart   # ignore the checkpoint
+  python scripts/backfill.py --status
+"""
+from __future__ import annotations
+import argparse, json, os
+from datetime import datetime
+from pathlib import Path
+import gold_store, nk_index, perf, to_gold, to_silver
+from manifest import Manifest
+
+STATE_PATH = Path("data/_backfill_state.json")
+DAYS_IN_FLIGHT = 4
+
+def _day(s: str) -> str:
+    try:
+        datetime.strptime(s, "%Y%m%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a YYYYMMDD date: {s!r}")
+    return s
+
+def raw_files(start: str, end: str) -> dict[str, Path]:
+    """day → raw file for the days in [start, end] that have one"""
+    out = {}
+    for p in sorted(to_silver.RAW.glob("sales_*.csv")):
+        m = to_silver.F.search(p.name)
+        if m and start <= m.group(1) <= end:
+            out[m.group(1)] = p
+    return out
+
+def load_state() -> dict | None:
+    if not STATE_PATH.exists():
+        return None
+    return json.loads(STATE_PATH.read_text(encoding="utf-8"))
+
+def save_state(st: dict) -> None:
+    st["updated_at"] = datetime.now().isoformat(timespec="seconds")
+    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_PATH.with_name(STATE_PATH.name + ".tmp")
+    tmp.write_text(json.dumps(st, indent=1), encoding="utf-8")
+    os.replace(tmp, STATE_PATH)
+
+def new_state(start: str, end: str, days, size: int) -> dict:
+    return {"from": start, "to": end, "days_in_flight": size,
+            "units": [days[i:i + size] for i in range(0, len(days), size)], "done": 0, "current": None,
+            "started_at": datetime.now().isoformat(timespec="seconds")}
+
+def repair_index() -> None:
+    """Rebuild the nk index if an interrupted to_gold left it out of step with gold"""
+    if gold_store.exists() and nk_index.check():
+        print("[backfill] nk index out of step with gold after the interrupted unit; rebuilding")
+        nk_index.rebuild().save()
+
+def run_unit(days, files: dict[str, Path], a) -> None:
+    """Clean the unit's raw days (forced), then upsert their silver files into gold"""
+    man = Manifest(to_silver.MANIFEST)
+    with perf.span("silver", rows_in=len(days)):
+        done, failed = to_silver.process([files[d] for d in days], man, min(a.workers, len(days)),
+                                         chunk_rows=a.chunk_rows, memory_mb=a.memory_mb)
+        man.save()
+    if failed:
+        raise SystemExit(f"[backfill] silver failed for {', '.join(failed)}; fix them and re-run to resume")
+    silver = [str(r["outputs"][0]) for r in done.values() if Path(r["outputs"][0]).exists()]
+    if silver:
+        with perf.span("gold", rows_in=len(silver)):
+            to_gold.main(["--engine", a.engine, "--shards", str(a.shards), "--files", *silver])
+
+def status() -> None:
+    st = load_state()
+    if st is None:
+        print("No backfill recorded."); return
+    n = len(st["units"])
+    print(f"backfill {st['from']}..{st['to']}: {st['done']}/{n} units committed "
+          f"({st['days_in_flight']} days each, started {st['started_at']}, updated {st.get('updated_at', '-')})")
+    if st["current"] is not None:
+        print(f"  interrupted in unit {st['current'] + 1}: {', '.join(st['units'][st['current']])}")
+    elif st["done"] < n:
+        print(f"  next: {', '.join(st['units'][st['done']])}")
+
+@perf.timed("backfill", run=True)
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--from", dest="start", type=_day, help="first raw day (YYYYMMDD)")
+    ap.add_argument("--to", dest="end", type=_day, help="last raw day (YYYYMMDD)")
+    ap.add_argument("--days-in-flight", type=int, default=DAYS_IN_FLIGHT,
+                    help="raw days per checkpointed unit (bounds workers and the gold batch)")
+    ap.add_argument("--workers", type=int, default=1, help="to_silver processes (at most --days-in-flight)")
+    ap.add_argument("--chunk-rows", type=int, help="stream each raw file in chunks of N rows")
+    ap.add_argument("--memory-mb", type=float, help="stream with chunks sized to this per-worker memory budget")
+    ap.add_argument("--engine", choices=["pandas", "duckdb"], default="pandas")
+    ap.add_argument("--shards", type=int, default=1, help="gold upsert shards (pandas engine)")
+    ap.add_argument("--restart", action="store_true", help="ignore the checkpoint and start the range over")
+    ap.add_argument("--status", action="store_true", help="show the recorded checkpoint and exit")
+    a = ap.parse_args(argv)
+    if a.status:
+        status(); return
+    if not (a.start and a.end):
+        ap.error("--from and --to are required")
+    if a.start > a.end or a.days_in_flight < 1:
+        ap.error("need --from <= --to and --days-in-flight >= 1")
+
+    st = None if a.restart else load_state()
+    if st is not None and st["done"] < len(st["units"]) and (st["from"], st["to"]) != (a.start, a.end):
+        raise SystemExit(f"[backfill] Unfinished backfill {st['from']}..{st['to']} ({st['done']}/{len(st['units'])} units); "
+                         "re-run it to resume or pass --restart")
+    if st is not None and (st["from"], st["to"]) == (a.start, a.end) and st["done"] == len(st["units"]):
+        print(f"[backfill] {a.start}..{a.end} already complete ({st['updated_at']}); --restart to run it again")
+        return
+    files = raw_files(a.start, a.end)
+    if st is None or (st["from"], st["to"]) != (a.start, a.end):
+        if not files:
+            raise SystemExit(f"[backfill] No raw files for {a.start}..{a.end} under {to_silver.RAW}/")
+        st = new_state(a.start, a.end, sorted(files), a.days_in_flight)
+        save_state(st)
+    else:
+        print(f"[backfill] Resuming {a.start}..{a.end} at unit {st['done'] + 1}/{len(st['units'])}")
+
+    n = len(st["units"])
+    for i in range(st["done"], n):
+        days = st["units"][i]
+        if missing := [d for d in days if d not in files]:
+            raise SystemExit(f"[backfill] Raw files gone for {', '.join(missing)}; restore them or --restart")
+        if st["current"] == i:
+            repair_index()
+        st["current"] = i; save_state(st)
+        print(f"[backfill] Unit {i + 1}/{n}: {', '.join(days)}")
+        with perf.span("unit", rows_in=len(days)):
+            run_unit(days, files, a)
+        st["done"], st["current"] = i + 1, None; save_state(st)
+        print(f"[backfill] Unit {i + 1}/{n} committed")
+    print(f"[backfill] {a.start}..{a.end} complete: {sum(map(len, st['units']))} days in {n} units "
+          "(make run refreshes validation, exports and reports)")
+
+if __name__ == "__main__":
+    main()
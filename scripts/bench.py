@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks for pipeline hot paths.
+  python scripts/bench.py silver --rows 200000
+  python scripts/bench.py storage --rows 10000000
+  python scripts/bench.py engines --rows 100000,1000000,5000000
+  python scripts/bench.py pipeline --scales 10000,1000000 --days 3   # → reports/bench_pipeline.json
+  python scripts/bench.py memory --rows 5000000                      # → reports/bench_memory.json
+  python scripts/bench.py compare old.json new.json
+"""
+from __future__ import annotations
+import argparse, json, os, platform, subprocess, sys, tempfile, time
+from datetime import datetime
+from pathlib import Path
+import numpy as np, pandas as pd
+
+GEO_POOL = ["GEO01","GEO02","GEO03","GEO04","GEO05"]
+PRODUCT_POOL = [f"P{i:03d}" for i in range(1,9)]
+
+def synth_raw(rows: int, seed: int = 42, bad_ratio: float = 0.05) -> pd.DataFrame:
+    """Raw-day shaped frame (all str, like to_silver's read_csv(dtype=str))"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "order_id": pd.Series(np.arange(rows)).astype(str).str.zfill(8),
+        "order_date": "20251012",
+        "geo_id": rng.choice(GEO_POOL, rows),
+        "product_id": rng.choice(PRODUCT_POOL, rows),
+        "quantity": rng.integers(1, 6, rows).astype(str),
+        "unit_price": rng.choice(["100.0","150.0","200.0","500.0","1000.0"], rows),
+    })
+    bad = np.flatnonzero(rng.random(rows) < bad_ratio)
+    kind = rng.integers(0, 4, len(bad))
+    df.loc[bad[kind == 0], "quantity"] = "-2"
+    df.loc[bad[kind == 1], "unit_price"] = "0.0"
+    df.loc[bad[kind == 2], "geo_id"] = np.nan
+    df.loc[bad[kind == 3], "order_date"] = "20251535"
+    return df.astype(str).replace("nan", np.nan)
+
+def _timed(fn, *args):
+    t0 = time.perf_counter(); out = fn(*args); return out, time.perf_counter() - t0
+
+def bench_silver(a):
+    import to_silver
+    df = synth_raw(a.rows, a.seed)
+    fast, t_fast = _timed(to_silver.reason_codes, df)
+    print(f"rows={len(df):,}")
+    print(f"  vectorized : {t_fast:8.3f}s  {len(df)/t_fast:>14,.0f} rows/s")
+    if a.skip_rowwise:
+        return
+    slow, t_slow = _timed(to_silver.row_reasons, df)
+    same = list(to_silver.REASON_TEXT[fast]) == slow
+    print(f"  row-wise   : {t_slow:8.3f}s  {len(df)/t_slow:>14,.0f} rows/s")
+    print(f"  speedup    : {t_slow/t_fast:8.1f}x  identical={same}")
+    if not same:
+        raise SystemExit(1)
+
+def synth_gold(rows: int, seed: int = 42, days: int = 365) -> pd.DataFrame:
+    """Gold-shaped frame sorted by order_date"""
+    rng = np.random.default_rng(seed)
+    day = np.sort(rng.integers(0, days, rows))
+    dates = pd.to_datetime("2025-01-01") + pd.to_timedelta(day, unit="D")
+    order_date = dates.strftime("%Y%m%d").astype(int)
+    q = rng.integers(1, 6, rows)
+    p = rng.choice([100.0,150.0,200.0,250.0,300.0,500.0,800.0,1000.0], rows)
+    return pd.DataFrame({
+        "order_id": pd.Series(order_date).astype(str) + "-" + pd.Series(np.arange(rows)).astype(str).str.zfill(8),
+        "order_date": order_date,
+        "geo_id": rng.choice(GEO_POOL, rows),
+        "product_id": rng.choice(PRODUCT_POOL, rows),
+        "quantity": q,
+        "unit_price": p,
+        "revenue_jpy": q * p,
+        "processed_at": order_date,
+    })
+
+def bench_storage(a):
+    import storage
+    df = synth_gold(a.rows, a.seed)
+    day = int(df["order_date"].iloc[len(df) // 2])
+    print(f"rows={len(df):,}  (projection: geo_id,revenue_jpy  predicate: order_date == {day})")
+    print(f"{'format':8} {'write s':>9} {'size MB':>9} {'read s':>9} {'proj+pred s':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in storage.FORMATS:
+            _, t_w = _timed(storage.write_frame, df, Path(tmp) / "fact_sales", fmt)
+            path = storage.path_for(Path(tmp) / "fact_sales", fmt)
+            size = os.path.getsize(path) / 1e6
+            full, t_r = _timed(storage.read_frame, path)
+            sel, t_s = _timed(storage.read_frame, path, ["geo_id", "revenue_jpy"], [("order_date", "==", day)])
+            assert len(full) == len(df)
+            print(f"{fmt:8} {t_w:9.2f} {size:9.1f} {t_r:9.2f} {t_s:12.3f}  ({len(sel):,} rows selected)")
+            del full, sel
+
+def bench_engines(a):
+    """to_gold full build from day files: pandas vs duckdb engine, growing input"""
+    import contextlib, io, shutil
+    import to_gold
+    cwd = os.getcwd()
+    print(f"{'rows':>12} {'days':>5} {'pandas s':>9} {'duckdb s':>9} {'speedup':>8}  identical")
+    for rows in (int(r) for r in a.rows.split(",")):
+        df = synth_gold(rows, a.seed, a.days)
+        df["order_id"] = "O" + df["order_id"].str[9:]
+        with tempfile.TemporaryDirectory() as tmp:
+            src = Path(tmp) / "silver"; src.mkdir()
+            for day, g in df.groupby("order_date"):
+                g.to_csv(src / f"sales_clean_{day}.csv", index=False)
+            times, trees = {}, {}
+            for engine in ("pandas", "duckdb"):
+                root = Path(tmp) / engine
+                shutil.copytree(src, root / "data" / "silver")
+                os.chdir(root)
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        _, times[engine] = _timed(to_gold.main, ["--engine", engine, *(["--threads", str(a.threads)] if a.threads else [])])
+                finally:
+                    os.chdir(cwd)
+                trees[engine] = {p.relative_to(root): p.read_bytes() for p in sorted(root.glob("data/gold/fact_sales/*/part-*"))}
+        same = trees["pandas"] == trees["duckdb"]
+        print(f"{rows:>12,} {a.days:>5} {times['pandas']:9.2f} {times['duckdb']:9.2f} "
+              f"{times['pandas']/times['duckdb']:7.1f}x  {same}")
+        if not same:
+            raise SystemExit(1)
+
+SCRIPTS = Path(__file__).resolve().parent
+PIPELINE_STAGES = [   # (stage, commands, files whose rows the stage consumes)
+    ("ingest",   [["generate_sales.py"]],                         None),
+    ("silver",   [["to_silver.py"]],                              ["data/raw/sales_*"]),
+    ("gold",     [["to_gold.py"]],                                ["data/silver/sales_clean_*"]),
+    ("validate", [["validate_silver.py"], ["validate_gold.py"]], ["data/silver/sales_clean_*", "data/gold/fact_sales/*/part-*"]),
+]
+
+def _run_stage(cmds, cwd):
+    """Run stage commands; (wall seconds, peak RSS MB of the largest child)"""
+    t0, peak = time.perf_counter(), 0
+    for cmd in cmds:
+        p = subprocess.Popen([sys.executable, str(SCRIPTS / cmd[0]), *cmd[1:]], cwd=cwd,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        _, status, ru = os.wait4(p.pid, 0)
+        err = p.stderr.read().decode(errors="replace"); p.stderr.close()
+        if os.waitstatus_to_exitcode(status) not in (0, 2):   # validate_* 有違規時回傳 2
+            raise SystemExit(f"{cmd[0]} failed:\n{err}")
+        peak = max(peak, ru.ru_maxrss / 1024)
+    return time.perf_counter() - t0, peak
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPTS, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_pipeline(a):
+    """ingest → silver → gold → validate in a scratch workspace per scale"""
+    import storage
+    results = []
+    print(f"{'rows/day':>12} {'stage':9} {'rows':>12} {'wall s':>8} {'rows/s':>12} {'peak MB':>8}")
+    for scale in (int(s) for s in a.scales.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.symlink(SCRIPTS.parent / "schemas", Path(tmp) / "schemas")
+            for stage, cmds, inputs in PIPELINE_STAGES:
+                if stage == "ingest":
+                    cmds = [[*cmds[0], "--days", str(a.days), "--seed", str(a.seed), "--rows-per-day", str(scale)]]
+                wall, peak = _run_stage(cmds, tmp)
+                pats = inputs or ["data/raw/sales_*"]
+                rows = sum(storage.count_rows(p) for pat in pats for p in storage.glob_frames(os.path.join(tmp, pat)))
+                results.append({"rows_per_day": scale, "days": a.days, "stage": stage, "rows": rows,
+                                "wall_s": round(wall, 3), "rows_per_s": round(rows / wall, 1),
+                                "peak_rss_mb": round(peak, 1)})
+                print(f"{scale:>12,} {stage:9} {rows:>12,} {wall:8.2f} {rows / wall:>12,.0f} {peak:8.0f}")
+    out = {
+        "commit": _git_rev(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "format": os.environ.get("PIPELINE_FORMAT", "csv"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    Path(a.out).parent.mkdir(parents=True, exist_ok=True)
+    Path(a.out).write_text(json.dumps(out, indent=1), encoding="utf-8")
+    print(f"→ {a.out}")
+
+def bench_compare(a):
+    """Per stage/scale ratios between two bench_pipeline result files (new / old)"""
+    old, new = (json.loads(Path(p).read_text(encoding="utf-8")) for p in (a.old, a.new))
+    key = lambda r: (r["rows_per_day"], r["stage"])
+    base = {key(r): r for r in old["results"]}
+    print(f"{old.get('commit')} → {new.get('commit')}")
+    print(f"{'rows/day':>12} {'stage':9} {'wall old':>9} {'wall new':>9} {'ratio':>7} {'RSS ratio':>10}")
+    worse = False
+    for r in new["results"]:
+        b = base.get(key(r))
+        if b is None:
+            continue
+        ratio, mem = r["wall_s"] / b["wall_s"], r["peak_rss_mb"] / b["peak_rss_mb"]
+        flag = "  ⚠" if ratio > 1 + a.tolerance or mem > 1 + a.tolerance else ""
+        worse |= bool(flag)
+        print(f"{r['rows_per_day']:>12,} {r['stage']:9} {b['wall_s']:9.2f} {r['wall_s']:9.2f} {ratio:7.2f} {mem:10.2f}{flag}")
+    if worse and a.fail:
+        raise SystemExit(1)
+
+MEMORY_MODES = ("plain", "typed")
+
+def memory_probe(a):
+    """(child process) read a gold file, validate it and roll it up; prints frame MB as JSON"""
+    import rollups, storage, typed_frames
+    from validate_utils import load_schema, validate_df
+    df = typed_frames.read(a.path, "gold") if a.mode == "typed" else storage.read_frame(a.path)
+    t0 = time.perf_counter()
+    rep = validate_df(df, load_schema(typed_frames.SCHEMA_DIR / typed_frames.SCHEMAS["gold"]))
+    roll = rollups.day_rollup(df)
+    status = Path("/proc/self/status")   # VmHWM 只計本行程的峰值（不含 fork 來源的部分）
+    hwm = next((int(l.split()[1]) for l in status.read_text().splitlines() if l.startswith("VmHWM:")), None) if status.exists() else None
+    print(json.dumps({"frame_mb": round(df.memory_usage(deep=True).sum() / 2**20, 1),
+                      "peak_kb": hwm,
+                      "work_s": round(time.perf_counter() - t0, 3), "errors": len(rep["errors"]),
+                      "rollup_rows": len(roll), "dtypes": df.dtypes.astype(str).to_dict()}))
+
+def bench_memory(a):
+    """Peak RSS of read + validate + rollup on one gold table: plain vs typed_frames dtypes"""
+    import storage
+    results = []
+    print(f"rows={a.rows:,}")
+    print(f"{'format':8} {'mode':6} {'frame MB':>9} {'peak MB':>8} {'wall s':>7} {'work s':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        df = synth_gold(a.rows, a.seed)
+        paths = {fmt: storage.write_frame(df, Path(tmp) / fmt / "fact_sales", fmt) for fmt in a.formats.split(",")}
+        del df
+        for fmt, path in paths.items():
+            out = {}
+            for mode in MEMORY_MODES:
+                t0 = time.perf_counter()
+                p = subprocess.Popen([sys.executable, str(SCRIPTS / "bench.py"), "memory-probe", str(path), mode],
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                _, status, ru = os.wait4(p.pid, 0)
+                stdout, err = p.stdout.read(), p.stderr.read(); p.stdout.close(); p.stderr.close()
+                if os.waitstatus_to_exitcode(status):
+                    raise SystemExit(f"memory-probe {mode} failed:\n{err.decode(errors='replace')}")
+                r = json.loads(stdout)
+                peak = r.pop("peak_kb") or ru.ru_maxrss
+                out[mode] = {**r, "format": fmt, "mode": mode, "rows": a.rows,
+                             "peak_rss_mb": round(peak / 1024, 1), "wall_s": round(time.perf_counter() - t0, 3)}
+                r = out[mode]
+                print(f"{fmt:8} {mode:6} {r['frame_mb']:9.1f} {r['peak_rss_mb']:8.0f} {r['wall_s']:7.2f} {r['work_s']:7.2f}")
+            if (out["plain"]["errors"], out["plain"]["rollup_rows"]) != (out["typed"]["errors"], out["typed"]["rollup_rows"]):
+                raise SystemExit(f"{fmt}: typed result differs from plain")
+            print(f"{fmt:8} typed/plain: frame {out['typed']['frame_mb'] / out['plain']['frame_mb']:.2f}  "
+                  f"peak {out['typed']['peak_rss_mb'] / out['plain']['peak_rss_mb']:.2f}")
+            results += out.values()
+    doc = {"commit": _git_rev(), "created_at": datetime.now().isoformat(timespec="seconds"),
+           "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+           "results": results}
+    Path(a.out).parent.mkdir(parents=True, exist_ok=True)
+    Path(a.out).write_text(json.dumps(doc, indent=1), encoding="utf-8")
+    print(f"→ {a.out}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("silver", help="to_silver rule engine: vectorized vs row-wise")
+    s.add_argument("--rows", type=int, default=200_000)
+    s.add_argument("--seed", type=int, default=42)
+    s.add_argument("--skip-rowwise", action="store_true")
+    s.set_defaults(fn=bench_silver)
+    s = sub.add_parser("storage", help="gold table: csv vs parquet write/read/size")
+    s.add_argument("--rows", type=int, default=10_000_000)
+    s.add_argument("--seed", type=int, default=42)
+    s.set_defaults(fn=bench_storage)
+    s = sub.add_parser("engines", help="to_gold: pandas vs duckdb engine as input grows")
+    s.add_argument("--rows", default="100000,1000000,5000000", help="comma-separated sizes")
+    s.add_argument("--days", type=int, default=30)
+    s.add_argument("--threads", type=int, default=None)
+    s.add_argument("--seed", type=int, default=42)
+    s.set_defaults(fn=bench_engines)
+    s = sub.add_parser("pipeline", help="ingest/silver/gold/validate: wall time, rows/s, peak RSS per stage")
+    s.add_argument("--scales", default="10000,100000,1000000", help="comma-separated good rows per day")
+    s.add_argument("--days", type=int, default=3)
+    s.add_argument("--seed", type=int, default=42)
+    s.add_argument("--out", default="reports/bench_pipeline.json")
+    s.set_defaults(fn=bench_pipeline)
+    s = sub.add_parser("memory", help="gold read + validate + rollup: peak RSS, plain vs typed dtypes")
+    s.add_argument("--rows", type=int, default=5_000_000)
+    s.add_argument("--formats", default="csv,parquet")
+    s.add_argument("--seed", type=int, default=42)
+    s.add_argument("--out", default="reports/bench_memory.json")
+    s.set_defaults(fn=bench_memory)
+    s = sub.add_parser("memory-probe")   # 由 bench_memory 在子行程中呼叫
+    s.add_argument("path"); s.add_argument("mode", choices=MEMORY_MODES)
+    s.set_defaults(fn=memory_probe)
+    s = sub.add_parser("compare", help="compare two pipeline result files")
+    s.add_argument("old"); s.add_argument("new")
+    s.add_argument("--tolerance", type=float, default=0.10, help="flag stages slower/larger by more than this")
+    s.add_argument("--fail", action="store_true", help="exit 1 if any stage is flagged")
+    s.set_defaults(fn=bench_compare)
+    a = ap.parse_args()
+    a.fn(a)
+
+if __name__ == "__main__":
+    main()
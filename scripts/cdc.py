@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Change-data-capture log for gold: one numbered delta per to_gold run.
+  data/gold/_cdc/_log.json               : {"nk": [...], "runs": [{"seq", "finished_at", "engine", "inserted", "updated", "partitions"}]}
+  data/gold/_cdc/run-NNNNNN/after.parquet  : _seq | _op (insert/update) | _part | gold columns, in apply order
+  data/gold/_cdc/run-NNNNNN/before.parquet : _seq | _part | gold columns of the rows that were replaced
+Both images use one fixed schema whatever the engine (see conform()).
+A run is visible once it is in _log.json (written after the gold partitions).
+Applying each run's after-images with the same natural-key upsert as to_gold
+(replace the key, append in order) rebuilds gold exactly; the first run on a
+store that predates the log is a snapshot of the existing rows. "update"
+means the key was rewritten by the run; its values may equal the before-image.
+
+  python scripts/cdc.py show
+  python scripts/cdc.py verify                 # replay all runs, compare with gold
+  python scripts/cdc.py replay --out replay.csv
+"""
+from __future__ import annotations
+import argparse, json, os, shutil, sys
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import gold_store, nk_index, storage, typed_frames
+
+CDC_DIR = Path("data/gold/_cdc")
+LOG_PATH = CDC_DIR / "_log.json"
+
+def load_log() -> dict:
+    if not LOG_PATH.exists():
+        return {"nk": None, "runs": []}
+    return json.loads(LOG_PATH.read_text(encoding="utf-8"))
+
+def run_dir(seq: int) -> Path:
+    return CDC_DIR / f"run-{seq:06d}"
+
+def begin() -> tuple[int, Path]:
+    """Next sequence number and an empty directory for its files (leftovers of an uncommitted run are dropped)"""
+    runs = load_log()["runs"]
+    seq = runs[-1]["seq"] + 1 if runs else 1
+    d = run_dir(seq)
+    shutil.rmtree(d, ignore_errors=True); d.mkdir(parents=True)
+    return seq, d
+
+def commit(seq: int, nk, engine: str, inserted: int, updated: int, partitions) -> dict:
+    """Append the run to the log (the run becomes visible); returns its log entry"""
+    log = load_log()
+    log["nk"] = list(nk)
+    run = {"seq": seq, "finished_at": datetime.now().isoformat(timespec="seconds"), "engine": engine,
+           "inserted": int(inserted), "updated": int(updated), "partitions": sorted(map(str, partitions))}
+    log["runs"].append(run)
+    tmp = LOG_PATH.with_name(LOG_PATH.name + ".tmp")
+    tmp.write_text(json.dumps(log, indent=1), encoding="utf-8")
+    os.replace(tmp, LOG_PATH)
+    return run
+
+def partition_delta(key: str, old_df, old_h, new_df: pd.DataFrame, new_h: np.ndarray):
+    """(after, before) images of one partition upsert, same dedup as to_gold.upsert_partition"""
+    keep = np.flatnonzero(~pd.Series(new_h).duplicated(keep="last").to_numpy())
+    hit = np.isin(new_h[keep], old_h) if old_h is not None else np.zeros(len(keep), dtype=bool)
+    gone = np.isin(old_h, new_h) if old_df is not None else None
+    return delta_frames(key, new_df.iloc[keep], hit, old_df, gone, new_df.columns)
+
+def delta_frames(key: str, kept: pd.DataFrame, hit: np.ndarray, old_df, gone, columns):
+    """(after, before) images from the surviving new rows, their update flags and the replaced-row mask of old_df"""
+    after = kept.reset_index(drop=True)
+    after.insert(0, "_part", key); after.insert(0, "_op", np.where(hit, "update", "insert"))
+    before = old_df.loc[gone].reset_index(drop=True) if old_df is not None else pd.DataFrame(columns=columns)
+    before.insert(0, "_part", key)
+    return after, before
+
+def conform(table, image: str):
+    """
+    Arrow table cast to the fixed file schema of an after/before image, whichever
+    engine produced it: _seq int64, (_op,) _part string, then the gold columns
+    typed from the gold schema (strings, int32 YYYYMMDD dates, int64, float64).
+    A frame without data columns (empty before image) gets all of them as nulls.
+    """
+    import pyarrow as pa
+    fixed = {"string": pa.string(), "category": pa.string(), "date8": pa.int32(), "int": pa.int64(), "float": pa.float64()}
+    kinds = typed_frames.kinds("gold")
+    head = {"_seq": pa.int64(), "_op": pa.string(), "_part": pa.string()}
+    if image != "after":
+        del head["_op"]
+    names = [c for c in table.column_names if c not in head] or list(kinds)
+    schema = pa.schema([*head.items()] + [(c, fixed[kinds[c]] if c in kinds else table.schema.field(c).type) for c in names])
+    return pa.Table.from_arrays([table.column(f.name).cast(f.type) if f.name in table.column_names
+                                 else pa.nulls(len(table), f.type) for f in schema], schema=schema)
+
+def write_image(table, path: Path, image: str) -> None:
+    import pyarrow.parquet as pq
+    pq.write_table(conform(table, image), path)
+
+def _write(df: pd.DataFrame, path: Path, seq: int, image: str) -> None:
+    import pyarrow as pa
+    df = storage.plain(df)
+    df.insert(0, "_seq", np.full(len(df), seq, dtype=np.int64))
+    write_image(pa.Table.from_pandas(df, preserve_index=False), path, image)
+
+def record(nk, engine: str, afters, befores) -> dict:
+    """Write one run from partition_delta() frames and commit it; returns its log entry"""
+    seq, d = begin()
+    after = pd.concat(afters, ignore_index=True) if afters else pd.DataFrame(columns=["_op", "_part"])
+    before = pd.concat(befores, ignore_index=True) if befores else pd.DataFrame(columns=["_part"])
+    _write(after, d / "after.parquet", seq, "after"); _write(before, d / "before.parquet", seq, "before")
+    ins = int((after["_op"] == "insert").sum())
+    return commit(seq, nk, engine, ins, len(after) - ins, after["_part"].unique())
+
+def snapshot_if_missing(nk) -> int | None:
+    """Gold written before the log existed → record its rows as run 1 so replays start from it"""
+    if load_log()["runs"] or not gold_store.exists():
+        return None
+    afters = []
+    for d in gold_store.list_partitions():
+        df = gold_store.storage.read_frame(gold_store.part_file(d))
+        afters.append(partition_delta(d.name.split("=", 1)[1], None, None, df, nk_index.nk_hash(df, nk))[0])
+    seq = record(nk, "snapshot", afters, [])["seq"]
+    print(f"[cdc] Recorded existing gold as snapshot run {seq}")
+    return seq
+
+def changes(since: int = 0, image: str = "after") -> pd.DataFrame:
+    """after (or before) images of committed runs with seq > since, in apply order"""
+    frames = [pd.read_parquet(run_dir(r["seq"]) / f"{image}.parquet") for r in load_log()["runs"] if r["seq"] > since]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["_seq", "_part"])
+
+def replay(upto: int | None = None) -> pd.DataFrame:
+    """Apply committed runs (≤ upto) to an empty table; gold row order"""
+    from to_gold import upsert_partition   # to_gold 也 import 本模組，故延遲載入
+    log = load_log()
+    parts: dict[str, tuple[pd.DataFrame, np.ndarray]] = {}
+    for r in log["runs"]:
+        if upto is not None and r["seq"] > upto:
+            break
+        after = pd.read_parquet(run_dir(r["seq"]) / "after.parquet")
+        for key, rows in after.groupby("_part", sort=False).indices.items():
+            new = after.iloc[rows].drop(columns=["_seq", "_op", "_part"]).reset_index(drop=True)
+            old_df, old_h = parts.get(key, (None, None))
+            parts[key] = upsert_partition(old_df, old_h, new, nk_index.nk_hash(new, log["nk"]))
+    frames = [parts[k][0] for k in sorted(parts, key=gold_store.key_order)]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def verify() -> list[str]:
+    """Differences between the replayed log and gold (empty list = consistent)"""
+    if not load_log()["runs"]:
+        return [f"{LOG_PATH} has no runs"]
+    a = replay().to_csv(index=False).splitlines()
+    b = gold_store.read_gold(typed=False).to_csv(index=False).splitlines()
+    if a == b:
+        return []
+    errs = [f"replay has {len(a) - 1:,} rows, gold {len(b) - 1:,}"] if len(a) != len(b) else []
+    errs += [f"line {i}: replay {x!r} != gold {y!r}" for i, (x, y) in enumerate(zip(a, b), 1) if x != y]
+    return errs
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("show", help="list committed runs")
+    sub.add_parser("verify", help="exit 1 if replaying the log does not reproduce gold")
+    r = sub.add_parser("replay", help="write the replayed table as one CSV")
+    r.add_argument("--out", required=True)
+    r.add_argument("--upto", type=int, default=None, help="last seq to apply")
+    a = ap.parse_args()
+    if a.cmd == "show":
+        runs = load_log()["runs"]
+        print(pd.DataFrame(runs, columns=["seq", "finished_at", "engine", "inserted", "updated", "partitions"])
+              .assign(partitions=lambda d: d["partitions"].map(len)).to_string(index=False))
+    elif a.cmd == "verify":
+        errs = verify()
+        for e in errs[:20]:
+            print(f"  ❌ {e}")
+        print("  ✅ cdc replay matches gold" if not errs else f"  {len(errs)} problem(s)")
+        sys.exit(1 if errs else 0)
+    else:
+        df = replay(a.upto); df.to_csv(a.out, index=False)
+        print(f"[cdc] Replayed {len(df):,} rows → {a.out}")
+
+if __name__ == "__main__":
+    main()
@@ -2,26 +2,19 @@
 set -euo pipefail
 
 echo "== Idempotency =="
-[[ -f data/gold/fact_sales.csv ]] || python scripts/to_gold.py >/dev/null
-r1=$(( $(wc -l < data/gold/fact_sales.csv) - 1 ))
-python scripts/to_gold.py >/dev/null
-r2=$(( $(wc -l < data/gold/fact_sales.csv) - 1 ))
-if [[ "$r1" == "$r2" ]]; then
-  echo "  ✅ idempotent (rows=$r2)"
-else
-  echo "  ❌ not idempotent (before=$r1 after=$r2)"; exit 1
-fi
+python scripts/gold_store.py count >/dev/null 2>&1 || python scripts/to_gold.py >/dev/null
+# 不重跑全部歷史，只在另一個目錄重新執行抽樣的日期並比對摘要
+python scripts/digests.py verify --sample "${VERIFY_SAMPLE:-2}"
+
+echo; echo "== NK index =="
+python scripts/nk_index.py check
 
 echo; echo "== Tests =="
 pytest -q tests/
 
 echo; echo "== Quarantine < 25% =="
-bad=0; shopt -s nullglob
-for f in data/silver/quarantine/*.csv; do
-  n=$(( $(wc -l < "$f") - 1 ))
-  (( n>0 )) && bad=$((bad+n))
-done
-gold=$(( $(wc -l < data/gold/fact_sales.csv) - 1 ))
+bad=$(python scripts/quarantine_store.py count)
+gold=$(python scripts/gold_store.py count)
 total=$((gold+bad))
 pct=$(awk -v b="$bad" -v t="$total" 'BEGIN{ if(t==0){print 0}else{ printf "%.1f",(b/t)*100 }}')
 echo "  bad=$bad, gold=$gold, total=$total, pct=${pct}%"
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Content digests per partition and per layer, for cheap idempotency / drift checks.
+  data/_digests.json : {"layers": {layer: {key: {"rows", "digest", "size", "mtime_ns"[, "parts"]}}},
+                        "totals": {layer: {"rows", "digest", "partitions"}}}
+Layers: silver (key = day), quarantine (key = day), gold (key = partition value).
+A digest is the sum mod 2**64 of per-row hashes (nk_index normalisation, columns
+in name order) plus a hash of the column names, so it does not depend on row
+order and a layer total is the sum of its partition digests. Files whose size
+and mtime are unchanged keep their recorded digest. Silver entries list the
+gold partitions their rows land in ("parts").
+
+verify re-runs to_silver / to_gold for a few raw days in a scratch directory
+and compares the silver / quarantine digests of those days and the gold
+digests of the partitions they feed (all silver days feeding such a partition
+are re-run too), starting from copies of the seen order_id and sketch stores
+so cross-day duplicates and outliers are judged as in the real run. Digests
+are comparable within one storage format, so the re-run uses the format of
+the stored silver files.
+
+  python scripts/digests.py update
+  python scripts/digests.py show
+  python scripts/digests.py verify --sample 2      # or --days 20261012 20261013
+"""
+from __future__ import annotations
+import argparse, hashlib, json, os, random, shutil, subprocess, sys, tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import gold_store, nk_index, seen_ids, sketches, storage
+
+DIGEST_PATH = Path("data/_digests.json")
+RAW_GLOB = "data/raw/sales_*.csv"
+LAYERS = {
+    "silver": "data/silver/sales_clean_*",
+    "quarantine": "data/silver/quarantine/sales_bad_*",
+    "gold": "data/gold/fact_sales/*/part-*",
+}
+SCRIPTS = Path(__file__).resolve().parent
+MASK = (1 << 64) - 1
+
+def _key(layer: str, path: str) -> str:
+    if layer == "gold":
+        return Path(path).parent.name.split("=", 1)[1]
+    return Path(path).stem.rsplit("_", 1)[1]
+
+def frame_digest(df: pd.DataFrame) -> int:
+    """Order-independent content hash of a frame (int in [0, 2**64))"""
+    cols = sorted(df.columns)
+    head = int.from_bytes(hashlib.sha256("\0".join(cols).encode()).digest()[:8], "little")
+    if df.empty:
+        return head
+    rows = nk_index.nk_hash(df, cols)
+    return (int(rows.sum(dtype=np.uint64)) + head) & MASK   # uint64 的和在 2**64 處回繞
+
+def _parts(df: pd.DataFrame) -> list[str]:
+    from to_gold import pick_natural_key
+    nk = pick_natural_key(list(df.columns))
+    return sorted(gold_store.partition_keys(df[nk[0]]).unique(), key=gold_store.key_order) if nk else []
+
+def file_entry(layer: str, path: str) -> dict:
+    st = os.stat(path)
+    df = storage.read_frame(path)
+    e = {"rows": len(df), "digest": f"{frame_digest(df):016x}", "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if layer == "silver":
+        e["parts"] = _parts(df)
+    return e
+
+def scan(root: str | Path = ".", prev: dict | None = None) -> dict:
+    """Digests of every layer under root; entries of unchanged files are reused from prev"""
+    root = Path(root)
+    doc = {"layers": {}, "totals": {}}
+    for layer, pattern in LAYERS.items():
+        old = (prev or {}).get("layers", {}).get(layer, {})
+        cur = {}
+        for p in storage.glob_frames(str(root / pattern)):
+            k, st = _key(layer, p), os.stat(p)
+            e = old.get(k)
+            if not (e and e["size"] == st.st_size and e["mtime_ns"] == st.st_mtime_ns):
+                e = file_entry(layer, p)
+            cur[k] = e
+        doc["layers"][layer] = dict(sorted(cur.items(), key=lambda kv: gold_store.key_order(kv[0])))
+        total = sum(int(e["digest"], 16) for e in cur.values()) & MASK
+        doc["totals"][layer] = {"rows": sum(e["rows"] for e in cur.values()),
+                                "digest": f"{total:016x}", "partitions": len(cur)}
+    return doc
+
+def load() -> dict | None:
+    return json.loads(DIGEST_PATH.read_text(encoding="utf-8")) if DIGEST_PATH.exists() else None
+
+def update() -> dict:
+    """Refresh data/_digests.json (only changed files are read)"""
+    doc = scan(prev=load())
+    DIGEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = DIGEST_PATH.with_name(DIGEST_PATH.name + ".tmp")
+    tmp.write_text(json.dumps(doc, indent=1), encoding="utf-8")
+    os.replace(tmp, DIGEST_PATH)
+    return doc
+
+def raw_days() -> list[str]:
+    return sorted(p.stem.rsplit("_", 1)[1] for p in Path().glob(RAW_GLOB))
+
+def select(doc: dict, days=None, sample: int | None = None, seed=None) -> tuple[list[str], list[str]]:
+    """(raw days to re-run, gold partitions to compare) for the chosen days"""
+    avail = raw_days()
+    if days:
+        missing = sorted(set(map(str, days)) - set(avail))
+        if missing:
+            raise SystemExit(f"no raw file for day(s): {', '.join(missing)}")
+        chosen = sorted(set(map(str, days)))
+    elif sample:
+        chosen = sorted(random.Random(seed).sample(avail, min(sample, len(avail))))
+    else:
+        chosen = avail
+    silver = doc["layers"]["silver"]
+    parts = sorted({k for d in chosen for k in silver.get(d, {}).get("parts", [])}, key=gold_store.key_order)
+    feeders = {d for d, e in silver.items() if set(e.get("parts", [])) & set(parts)}
+    return sorted(set(chosen) | (feeders & set(avail))), parts
+
+def _rerun(days, workdir: Path, engine: str) -> None:
+    (workdir / "data/raw").mkdir(parents=True)
+    for d in days:
+        shutil.copy2(f"data/raw/sales_{d}.csv", workdir / f"data/raw/sales_{d}.csv")
+    for store in (seen_ids.STORE, sketches.STORE):   # 沒有其他日期的紀錄就無法判定跨日重複與離群值
+        if store.exists():
+            shutil.copytree(store, workdir / store)
+    files = storage.glob_frames(LAYERS["silver"])   # 以與已儲存檔案相同的格式重新執行
+    fmt = next((f for f, ext in storage.EXT.items() if files and files[0].endswith(ext)), storage.current_format())
+    for cmd in (["to_silver.py"], ["to_gold.py", "--engine", engine]):
+        subprocess.run([sys.executable, str(SCRIPTS / cmd[0]), *cmd[1:]], cwd=workdir, check=True,
+                       stdout=subprocess.DEVNULL, env={**os.environ, "PIPELINE_FORMAT": fmt})
+
+def _diff(layer: str, keys, want: dict, got: dict) -> list[str]:
+    errs = []
+    for k in keys:
+        a, b = want.get(k), got.get(k)
+        if (a is None) != (b is None):
+            errs.append(f"{layer} {k}: {'missing' if a is None else 'present'} in the store, "
+                        f"{'missing' if b is None else 'present'} on re-run")
+        elif a and (a["rows"], a["digest"]) != (b["rows"], b["digest"]):
+            errs.append(f"{layer} {k}: stored {a['rows']:,} rows / {a['digest']}, re-run {b['rows']:,} rows / {b['digest']}")
+    return errs
+
+def verify(days=None, sample: int | None = None, seed=None, engine: str = "pandas") -> list[str]:
+    """Differences between the stored digests and a scratch re-run of the chosen days (empty list = idempotent)"""
+    doc = update()
+    run_days, parts = select(doc, days, sample, seed)
+    missing = [k for k in parts if not {d for d, e in doc["layers"]["silver"].items() if k in e["parts"]} <= set(run_days)]
+    if missing:
+        print(f"[digests] skipping gold {', '.join(missing)}: fed by silver days without a raw file")
+        parts = [k for k in parts if k not in missing]
+    print(f"[digests] re-running {len(run_days)} day(s) {', '.join(run_days)}; comparing {len(parts)} gold partition(s)")
+    with tempfile.TemporaryDirectory(prefix="digests-") as tmp:
+        _rerun(run_days, Path(tmp), engine)
+        fresh = scan(tmp)
+    errs = []
+    for layer in ("silver", "quarantine"):
+        errs += _diff(layer, run_days, doc["layers"][layer], fresh["layers"][layer])
+    return errs + _diff("gold", parts, doc["layers"]["gold"], fresh["layers"]["gold"])
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("update", help=f"refresh {DIGEST_PATH}")
+    sub.add_parser("show", help="layer totals")
+    v = sub.add_parser("verify", help="exit 1 if re-running the chosen days gives different digests")
+    v.add_argument("--days", nargs="+", help="raw days (YYYYMMDD); default: all, or --sample")
+    v.add_argument("--sample", type=int, default=None, help="re-run N randomly chosen days")
+    v.add_argument("--seed", type=int, default=None)
+    v.add_argument("--engine", choices=["pandas", "duckdb"], default="pandas")
+    a = ap.parse_args()
+    if a.cmd == "update":
+        doc = update()
+        print(f"[digests] {sum(t['partitions'] for t in doc['totals'].values())} partitions → {DIGEST_PATH}")
+    elif a.cmd == "show":
+        doc = load() or update()
+        print(pd.DataFrame(doc["totals"]).T.rename_axis("layer").to_string())
+    else:
+        errs = verify(a.days, a.sample, a.seed, a.engine)
+        for e in errs[:20]:
+            print(f"  ❌ {e}")
+        print("  ✅ re-run digests match" if not errs else f"  {len(errs)} problem(s)")
+        sys.exit(1 if errs else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,18 @@
 #!/usr/bin/env python3
 """Data Quality Dashboard - Comprehensive metrics"""
 import pandas as pd
-import glob
 from pathlib import Path
+import dq_metrics, sketches
 
-def main():
-    # Load data
-    gold = pd.read_csv('data/gold/fact_sales.csv')
-    quar_files = glob.glob('data/silver/quarantine/*.csv')
-    quarantine = pd.concat([pd.read_csv(f) for f in quar_files]) if quar_files else pd.DataFrame()
+def _dim(tot, layer, dim):
+    return tot[(tot["layer"] == layer) & (tot["dim"] == dim)]
+
+def main(tot=None):
+    # Load counters (dq_metrics keeps them up to date; no gold/quarantine scan)
+    if tot is None:
+        tot = dq_metrics.load_totals()
+    n_gold = int(_dim(tot, "gold", "total")["rows"].sum())
+    n_quar = int(_dim(tot, "quarantine", "total")["rows"].sum())
     
     print("=" * 60)
     print("           DATA QUALITY DASHBOARD")
@@ -16,43 +20,63 @@ def main():
     
     # 1. Overall Metrics
     print("\n--- Overall Metrics ---")
-    total_records = len(gold) + len(quarantine)
-    pass_rate = (len(gold) / total_records * 100) if total_records > 0 else 0
-    print(f"Total Gold Records:     {len(gold):,}")
-    print(f"Quarantined Records:    {len(quarantine):,}")
+    total_records = n_gold + n_quar
+    pass_rate = (n_gold / total_records * 100) if total_records > 0 else 0
+    print(f"Total Gold Records:     {n_gold:,}")
+    print(f"Quarantined Records:    {n_quar:,}")
     print(f"Pass Rate:              {pass_rate:.2f}%")
     
     # 2. Top Revenue Products
     print("\n--- Top Revenue Products ---")
-    top_products = gold.groupby('product_id').agg({
-        'revenue_jpy': ['sum', 'count', 'mean']
-    }).round(2)
-    top_products.columns = ['Total Revenue', 'Order Count', 'Avg Revenue']
+    p = _dim(tot, "gold", "product").set_index("key")
+    top_products = pd.DataFrame({
+        'Total Revenue': p["revenue_jpy"],
+        'Order Count': p["rows"],
+        'Avg Revenue': p["revenue_jpy"] / p["rows"],
+    }).rename_axis('product_id').round(2)
     top_products = top_products.sort_values('Total Revenue', ascending=False).head(5)
     print(top_products.to_string())
     
     # 3. Geographic Performance
     print("\n--- Geographic Performance ---")
-    geo_perf = gold.groupby('geo_id').agg({
-        'order_date': 'nunique',
-        'order_id': 'count',
-        'revenue_jpy': 'sum'
-    }).round(2)
-    geo_perf.columns = ['Active Days', 'Total Orders', 'Total Revenue']
+    g = _dim(tot, "gold", "geo").set_index("key")
+    geo_perf = pd.DataFrame({
+        'Active Days': g["days"],
+        'Total Orders': g["rows"],
+        'Total Revenue': g["revenue_jpy"],
+    }).rename_axis('geo_id').round(2)
     geo_perf = geo_perf.sort_values('Total Revenue', ascending=False)
     print(geo_perf.to_string())
     
     # 4. Quality Issues by Product
-    if not quarantine.empty:
+    if n_quar:
         print("\n--- Quality Issues by Product ---")
-        issues = quarantine.groupby('product_id').agg({
-            '_bad_reason': ['count', lambda x: ', '.join(x.unique())]
-        })
-        issues.columns = ['Issue Count', 'Issue Types']
+        q = _dim(tot, "quarantine", "product").sort_values("first", kind="stable")
+        issues = q.groupby('key').agg(**{
+            'Issue Count': ('rows', 'sum'),
+            'Issue Types': ('reason', ', '.join),   # 依首次出現順序（與原本的 x.unique() 相同）
+        }).rename_axis('product_id')
         issues = issues.sort_values('Issue Count', ascending=False)
         print(issues.to_string())
     
-    # 5. Returns Analysis
+    # 5. Distribution Drift (day sketches vs all earlier days; no row scan)
+    drift = sketches.drift(last=7)
+    if not drift.empty:
+        print("\n--- Distribution Drift (vs earlier days) ---")
+        ks_cols = [c for c in drift.columns if c.startswith("ks_")]
+        day = drift[drift["dim"] == "all"].set_index("day")
+        flagged = drift[drift["drift"] & (drift["dim"] != "all")].groupby("day")["key"].agg(", ".join)
+        print(pd.DataFrame({
+            'Rows': day["rows"],
+            'Distinct Orders': day["orders"],
+            'Avg Revenue': day["mean_revenue"],
+            'Max KS': day[ks_cols].max(axis=1),
+            'Revenue Shift (z)': day["mean_z"],
+            'Drift': day["drift"].map({True: "⚠", False: ""}),
+            'Drifting Keys': flagged.reindex(day.index).fillna(""),
+        }).round(3).to_string())
+
+    # 6. Returns Analysis
     returns_file = Path('data/gold/fact_returns.csv')
     if returns_file.exists():
         returns = pd.read_csv(returns_file)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+DQ metrics store: per-day counters for gold and quarantine, kept up to date by
+to_silver / to_gold for the days they touch.
+  data/gold/_dq_metrics/days.parquet   : layer | day | dim | key | reason | rows | revenue_jpy | first
+  data/gold/_dq_metrics/totals.parquet : same counters summed over days (+ days)
+dq_dashboard / update_trends read totals.parquet only, so their cost does not
+grow with history.
+
+  python scripts/dq_metrics.py rebuild   # from the gold store and quarantine files
+  python scripts/dq_metrics.py show
+"""
+from __future__ import annotations
+import os, sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import gold_store, storage, typed_frames
+
+STORE = Path("data/gold/_dq_metrics")
+DAYS_PATH = STORE / "days.parquet"
+TOTALS_PATH = STORE / "totals.parquet"
+QUAR_GLOB = "data/silver/quarantine/sales_bad_*"
+GROUP = ["layer", "dim", "key", "reason"]
+COLS = ["layer", "day", *GROUP[1:], "rows", "revenue_jpy", "first"]
+
+def _frame(layer, day, dim, key, reason, rows, revenue=0.0, first=0) -> pd.DataFrame:
+    n = len(rows)
+    return pd.DataFrame({
+        "layer": layer, "day": day, "dim": dim,
+        "key": pd.Series(key, dtype="string").to_numpy() if n else [],
+        "reason": reason, "rows": np.asarray(rows, dtype=np.int64),
+        "revenue_jpy": np.broadcast_to(np.asarray(revenue, dtype=float), (n,)),
+        "first": np.broadcast_to(np.asarray(first, dtype=np.int64), (n,)),
+    }, columns=COLS)
+
+def gold_counts(df: pd.DataFrame, part_col: str = "order_date") -> pd.DataFrame:
+    """Counters for gold rows, one day per partition value"""
+    days = gold_store.partition_keys(df[part_col])
+    rev = df["revenue_jpy"].astype(float)
+    out = []
+    for day, rows in df.groupby(days, sort=True).indices.items():
+        sub, r = df.iloc[rows], rev.iloc[rows]
+        out.append(_frame("gold", day, "total", [""], "", [len(sub)], [r.sum()]))
+        for dim, col in (("geo", "geo_id"), ("product", "product_id")):
+            g = r.groupby(sub[col], sort=True, dropna=True).agg(["size", "sum"])
+            out.append(_frame("gold", day, dim, g.index.astype(str), "", g["size"], g["sum"]))
+    return pd.concat(out, ignore_index=True) if out else _frame("gold", "", "", [], "", [])
+
+def quarantine_counts(bad: pd.DataFrame, day: str, offset: int = 0) -> pd.DataFrame:
+    """Counters for one day's quarantine rows; offset = rows already counted (streaming)"""
+    if bad.empty:
+        return _frame("quarantine", day, "total", [""], "", [0])
+    pos = np.arange(offset, offset + len(bad), dtype=np.int64) + int(day) * 10**9
+    reason = bad["_bad_reason"].astype("string").fillna("")
+    out = [_frame("quarantine", day, "total", [""], "", [len(bad)], first=pos[:1])]
+    g = pd.DataFrame({"r": reason.to_numpy(), "p": pos}).groupby("r", sort=True)["p"].agg(["size", "min"])
+    out.append(_frame("quarantine", day, "reason", g.index, "", g["size"], first=g["min"]))
+    prod = bad["product_id"].astype("string")
+    g = (pd.DataFrame({"k": prod.to_numpy(), "r": reason.to_numpy(), "p": pos})
+         .groupby(["k", "r"], sort=True, dropna=True)["p"].agg(["size", "min"]))
+    out.append(_frame("quarantine", day, "product", g.index.get_level_values(0),
+                      g.index.get_level_values(1).to_numpy(), g["size"], first=g["min"]))
+    return pd.concat(out, ignore_index=True)
+
+def combine(frames) -> pd.DataFrame:
+    """Sum counters of the same (layer, day, dim, key, reason), e.g. streamed chunks"""
+    df = pd.concat(frames, ignore_index=True)
+    g = df.groupby(["layer", "day", *GROUP[1:]], sort=False, dropna=False)
+    return g.agg(rows=("rows", "sum"), revenue_jpy=("revenue_jpy", "sum"), first=("first", "min")).reset_index()[COLS]
+
+def totals(days: pd.DataFrame) -> pd.DataFrame:
+    g = days.groupby(GROUP, sort=True, dropna=False)
+    out = g.agg(rows=("rows", "sum"), revenue_jpy=("revenue_jpy", "sum"), first=("first", "min")).reset_index()
+    real = days["day"] != gold_store.NULL_PART
+    out["days"] = (days[real].groupby(GROUP, sort=True, dropna=False)["day"].nunique()
+                   .reindex(pd.MultiIndex.from_frame(out[GROUP])).fillna(0).astype(np.int64).to_numpy())
+    return out
+
+def _write(df: pd.DataFrame, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+def save(days: pd.DataFrame) -> pd.DataFrame:
+    days = (days.astype({c: "str" for c in ["layer", "day", *GROUP[1:]]})
+            .sort_values(["layer", "day"], kind="stable").reset_index(drop=True))
+    tot = totals(days)
+    _write(days, DAYS_PATH); _write(tot, TOTALS_PATH)
+    return tot
+
+def update(layer: str, counts: pd.DataFrame, days) -> None:
+    """Replace the counters of layer for the given days (days with no rows just drop out)"""
+    if not DAYS_PATH.exists():
+        rebuild()   # 首次：由既有輸出（含本次）建立
+        return
+    old = pd.read_parquet(DAYS_PATH)
+    drop = (old["layer"] == layer) & old["day"].isin([str(d) for d in days])
+    save(pd.concat([old.loc[~drop], counts], ignore_index=True))
+
+def rebuild() -> pd.DataFrame:
+    out = [_frame("gold", "", "", [], "", [])]
+    for d in gold_store.list_partitions():
+        df = typed_frames.read(gold_store.part_file(d), "gold")
+        out.append(gold_counts(df, d.name.split("=", 1)[0]))
+    for p in storage.glob_frames(QUAR_GLOB):
+        day = Path(p).stem.rsplit("_", 1)[1]
+        out.append(quarantine_counts(storage.read_frame(p), day))
+    return save(pd.concat(out, ignore_index=True))
+
+def load_totals() -> pd.DataFrame:
+    """Totals, rebuilt from the data files the first time"""
+    if TOTALS_PATH.exists():
+        return pd.read_parquet(TOTALS_PATH)
+    return rebuild()
+
+def main():
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "rebuild":
+        tot = rebuild()
+        print(f"[dq_metrics] Rebuilt {len(pd.read_parquet(DAYS_PATH)):,} day counters ({len(tot):,} totals) → {STORE}/")
+    elif cmd == "show":
+        print(load_totals().to_string(index=False))
+    else:
+        print("Usage: python scripts/dq_metrics.py rebuild|show"); sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@
 Generate raw daily sales CSVs for N days with fixed randomness.
 - data/raw/sales_YYYYMMDD.csv
 - columns: order_id, order_date, geo_id, product_id, quantity, unit_price
+- --rows-per-day scales a day up (tens of millions of rows, written in chunks)
 """
 from __future__ import annotations
 from pathlib import Path
@@ -17,54 +18,95 @@ PRODUCT_POOL = [f"P{i:03d}" for i in range(1,9)]
 
 def ymd(dt): return dt.strftime("%Y%m%d")
 
-def gen_one_day(rng, d):
-    n = int(rng.integers(80, 141))
+PRICES = np.array([100,150,200,250,300,500,800,1000], dtype=float)
+BAD_KINDS = np.array(["neg_qty","zero_price","missing_geo","bad_date"])
+COLS = ["order_id","order_date","geo_id","product_id","quantity","unit_price"]
+
+def _ids(prefix, start, n, width):
+    import pyarrow as pa, pyarrow.compute as pc
+    num = pc.utf8_lpad(pa.array(np.arange(start, start+n)).cast(pa.string()), width, "0")
+    return pd.Series(pc.binary_join_element_wise(prefix, num, ""), dtype="str")
+
+def _pick(rng, pool, n):
+    """rng.choice(pool, n) as a categorical (no per-row Python strings)"""
+    return pd.Categorical.from_codes(rng.integers(0, len(pool), n), pool)
+
+def gen_one_day(rng, d, rows=None, dup_ratio=0.02, bad_ratio=0.05, id_start=0, bad_start=0, width=4):
+    """
+    One day (or one chunk of a day) of raw rows: rows good orders (default
+    80–140), ~dup_ratio exact duplicates and ~bad_ratio bad rows, shuffled.
+    All columns are drawn as arrays, so cost is linear in rows.
+    """
+    n = int(rng.integers(80, 141)) if rows is None else int(rows)
+    day = ymd(d)
     df = pd.DataFrame({
-        "order_id": [f"{ymd(d)}-{i:04d}" for i in range(n)],
-        "order_date": ymd(d),
-        "geo_id": rng.choice(GEO_POOL, n),
-        "product_id": rng.choice(PRODUCT_POOL, n),
+        "order_id": _ids(f"{day}-", id_start, n, width),
+        "order_date": day,
+        "geo_id": _pick(rng, GEO_POOL, n),
+        "product_id": _pick(rng, PRODUCT_POOL, n),
         "quantity": rng.integers(1, 6, n),
-        "unit_price": rng.choice([100,150,200,250,300,500,800,1000], n).astype(float),
+        "unit_price": rng.choice(PRICES, n),
     })
     # ~2% 重複
-    dup = max(1, int(round(n*0.02)))
-    df = pd.concat([df, df.sample(dup, random_state=int(rng.integers(0,2**31)))], ignore_index=True)
-    # ~5% 壞列
-    badc = max(1, int(round(len(df)*0.05)))
-    bad=[]
-    for i in range(badc):
-        kind = rng.choice(["neg_qty","zero_price","missing_geo","bad_date"])
-        row = {
-            "order_id": f"{ymd(d)}-BAD{i:03d}",
-            "order_date": ymd(d),
-            "geo_id": rng.choice(GEO_POOL),
-            "product_id": rng.choice(PRODUCT_POOL),
-            "quantity": int(rng.integers(1,6)),
-            "unit_price": float(rng.choice([100,150,200,250,300,500,800,1000])),
-        }
-        if kind=="neg_qty": row["quantity"] = -int(rng.integers(1,5))
-        elif kind=="zero_price": row["unit_price"] = 0.0
-        elif kind=="missing_geo": row["geo_id"] = ""
-        elif kind=="bad_date": row["order_date"] = f"2025{rng.integers(13,20)}{rng.integers(32,40)}"
-        bad.append(row)
-    df = pd.concat([df, pd.DataFrame(bad)], ignore_index=True)
-    return df.sample(frac=1.0, random_state=int(rng.integers(0,2**31))).reset_index(drop=True)[
-        ["order_id","order_date","geo_id","product_id","quantity","unit_price"]
-    ]
+    dup = max(1, int(round(n*dup_ratio))) if dup_ratio > 0 else 0
+    df = pd.concat([df, df.iloc[rng.choice(n, dup, replace=False)]], ignore_index=True)
+    # ~5% 壞列（依種類以遮罩一次注入）
+    badc = max(1, int(round(len(df)*bad_ratio))) if bad_ratio > 0 else 0
+    kind = BAD_KINDS[rng.integers(0, len(BAD_KINDS), badc)]
+    bad = pd.DataFrame({
+        "order_id": _ids(f"{day}-BAD", bad_start, badc, 3),
+        "order_date": day,
+        "geo_id": rng.choice(GEO_POOL, badc),
+        "product_id": rng.choice(PRODUCT_POOL, badc),
+        "quantity": rng.integers(1, 6, badc),
+        "unit_price": rng.choice(PRICES, badc),
+    })
+    m = kind == "neg_qty"
+    bad.loc[m, "quantity"] = -rng.integers(1, 5, m.sum())
+    bad.loc[kind == "zero_price", "unit_price"] = 0.0
+    bad.loc[kind == "missing_geo", "geo_id"] = ""
+    m = kind == "bad_date"
+    bad.loc[m, "order_date"] = ("2025" + pd.Series(rng.integers(13, 20, m.sum())).astype(str)
+                                + pd.Series(rng.integers(32, 40, m.sum())).astype(str)).to_numpy()
+    df = pd.concat([df, bad], ignore_index=True)
+    return df.iloc[rng.permutation(len(df))].reset_index(drop=True)[COLS]
+
+def write_day(rng, d, path, rows=None, dup_ratio=0.02, bad_ratio=0.05, chunk_rows=1_000_000):
+    """
+    Write one raw day; large days go out in chunks of chunk_rows good orders
+    (duplicates / bad rows / shuffle are per chunk) so memory stays bounded.
+    Returns the number of rows written.
+    """
+    if rows is None or rows <= chunk_rows:
+        df = gen_one_day(rng, d, rows, dup_ratio, bad_ratio, width=max(4, len(str(rows or 0))))
+        df.to_csv(path, index=False, encoding="utf-8", lineterminator="\n")
+        return len(df)
+    width, done, bad_done, total = len(str(rows)), 0, 0, 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        while done < rows:
+            n = min(chunk_rows, rows - done)
+            df = gen_one_day(rng, d, n, dup_ratio, bad_ratio, id_start=done, bad_start=bad_done, width=width)
+            df.to_csv(f, index=False, header=(done == 0), lineterminator="\n")
+            bad_done += int(df["order_id"].str.contains("-BAD", regex=False).sum())
+            done += n; total += len(df)
+    return total
 
-def main():
+def main(argv=None):
     import argparse
     ap=argparse.ArgumentParser()
     ap.add_argument("--days", type=int, default=7)
     ap.add_argument("--seed", type=int, default=42)
-    a=ap.parse_args()
+    ap.add_argument("--rows-per-day", type=int, help="good orders per day (default: random 80-140)")
+    ap.add_argument("--dup-ratio", type=float, default=0.02)
+    ap.add_argument("--bad-ratio", type=float, default=0.05)
+    ap.add_argument("--chunk-rows", type=int, default=1_000_000, help="generate/write large days in chunks")
+    a=ap.parse_args(argv)
     rng=np.random.default_rng(a.seed)
     out=Path("data/raw"); out.mkdir(parents=True, exist_ok=True)
     today=datetime.now(JST).replace(tzinfo=None); start=today - timedelta(days=a.days-1)
     for i in range(a.days):
         d = start + timedelta(days=i)
         fn = out / f"sales_{ymd(d)}.csv"
-        gen_one_day(rng, d).to_csv(fn, index=False, encoding="utf-8", lineterminator="\n")
-        print(f"Wrote {fn}")
+        n = write_day(rng, d, fn, a.rows_per_day, a.dup_ratio, a.bad_ratio, a.chunk_rows)
+        print(f"Wrote {fn} ({n:,} rows)")
 if __name__=="__main__": main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+DuckDB engine for to_gold (--engine duckdb).
+Reads the silver batch and the touched gold partitions straight from files,
+does the natural-key upsert / revenue derivation / ordering as SQL and COPYs
+each partition back; only the key columns come back to Python (nk index).
+Output matches the pandas engine row-for-row. CSV column types come from
+DuckDB's sniffer, so digit-only ids with leading zeros stay text here while
+pandas would read them as ints.
+"""
+from __future__ import annotations
+import os
+from pathlib import Path
+import duckdb
+import numpy as np
+import pandas as pd
+import cdc, dq_metrics, gold_store, nk_index, rollups, storage
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def _scan(path: str | Path) -> str:
+    p = str(path).replace("'", "''")
+    if str(path).endswith(storage.EXT["parquet"]):
+        return f"read_parquet('{p}')"
+    return f"read_csv('{p}', header=true)"
+
+def _part_expr(col: str) -> str:
+    return f"coalesce(CAST({_q(col)} AS VARCHAR), '{gold_store.NULL_PART}')"
+
+def _revenue_select(cols: list[str]) -> str:
+    """SQL version of to_gold.ensure_revenue"""
+    lowers = {c.lower(): c for c in cols}
+    if "revenue_jpy" in lowers:
+        return "*"
+    ucol = lowers.get("units") or lowers.get("quantity")
+    pcol = lowers.get("unit_price") or lowers.get("price_jpy") or lowers.get("price")
+    if ucol and pcol:
+        return f"*, coalesce({_q(ucol)}, 0) * coalesce({_q(pcol)}, 0) AS revenue_jpy"
+    raise SystemExit(f"Cannot calculate revenue_jpy. Found columns: {cols}")
+
+def connect(threads: int | None = None) -> duckdb.DuckDBPyConnection:
+    con = duckdb.connect()
+    con.execute(f"SET threads = {int(threads or os.cpu_count() or 1)}")
+    return con
+
+def _last_per_key(sql: str, keys: str) -> str:
+    """Last row (by _src, _rn) per natural key; arg_max beats a row_number() window here"""
+    return (f"SELECT unnest(r) FROM (SELECT arg_max(t, (t._src, t._rn)) AS r "
+            f"FROM ({sql}) t GROUP BY {', '.join('t.' + k for k in keys.split(', '))})")
+
+def upsert(paths, nk, idx: nk_index.NKIndex, threads: int | None = None, con=None):
+    """
+    Upsert silver files into the touched gold partitions.
+    Returns (partitions, rows_written, keys_updated); updates idx in place.
+    """
+    con = con or connect(threads)
+    part_col, fmt = nk[0], storage.current_format()
+    keys = ", ".join(_q(c) for c in nk)
+
+    # 以 _src/_rn 保留輸入順序（檔案順 → 檔內列順），先在批次內去重
+    cols = list(dict.fromkeys(c for p in paths for c in storage.columns(p)))
+    new_sql = " UNION ALL BY NAME ".join(
+        f"SELECT {_revenue_select(cols)}, {i + 1} AS _src, ordinality AS _rn FROM {_scan(p)} WITH ORDINALITY"
+        for i, p in enumerate(paths)
+    )
+    con.execute(f"CREATE OR REPLACE TEMP TABLE batch AS SELECT *, {_part_expr(part_col)} AS _part "
+                f"FROM ({_last_per_key(new_sql, keys)})")
+    touched = [r[0] for r in con.execute("SELECT DISTINCT _part FROM batch ORDER BY 1").fetchall()]
+
+    old_sql = []
+    for k in touched:
+        f = gold_store.part_file(gold_store.partition_dir(part_col, k))
+        if f is not None:
+            old_sql.append(f"SELECT *, 0 AS _src, ordinality AS _rn, '{k}' AS _part FROM {_scan(f)} WITH ORDINALITY")
+    # 覆寫前的列也用於 cdc 的 before-image，故只讀一次
+    con.execute("CREATE OR REPLACE TEMP TABLE old AS "
+                + (" UNION ALL BY NAME ".join(old_sql) if old_sql else "SELECT * FROM batch LIMIT 0"))
+    con.execute(f"CREATE OR REPLACE TEMP TABLE upserted AS "
+                f"{_last_per_key('SELECT * FROM old UNION ALL BY NAME SELECT * FROM batch', keys)}")
+    updated = 0
+    if old_sql:
+        old_rows = con.execute("SELECT count(*) FROM old").fetchone()[0]
+        updated = old_rows - con.execute("SELECT count(*) FROM upserted WHERE _src = 0").fetchone()[0]
+
+    out_cols = _data_cols(con, "upserted")
+    sel = []
+    for c in out_cols:
+        if fmt == "parquet" and c in storage.INT_DATE_COLS:
+            sel.append(f"CAST({_q(c)} AS INTEGER) AS {_q(c)}")
+        else:
+            sel.append(_q(c))
+    copy_opts = (f"FORMAT parquet, COMPRESSION {storage.COMPRESSION}" if fmt == "parquet"
+                 else "FORMAT csv, HEADER true")
+    for k in touched:
+        d = gold_store.partition_dir(part_col, k)
+        d.mkdir(parents=True, exist_ok=True)
+        out = storage.path_for(d / gold_store.PART_STEM)
+        tmp = out.with_name(out.name + ".tmp")
+        con.execute(f"""
+            COPY (SELECT {', '.join(sel)} FROM upserted WHERE _part = ? ORDER BY _src, _rn)
+            TO '{str(tmp).replace("'", "''")}' ({copy_opts})
+        """, [k])
+        os.replace(tmp, out)
+        for other in storage.FORMATS:
+            if other != fmt:
+                storage.path_for(d / gold_store.PART_STEM, other).unlink(missing_ok=True)
+
+    # nk index：只把鍵欄位傳回 Python
+    key_df = con.execute(f"SELECT _part, {keys} FROM upserted ORDER BY _part, _src, _rn").df()
+    if key_df.empty:
+        return 0, 0, 0
+    h = nk_index.nk_hash(key_df, nk)
+    part = key_df["_part"].to_numpy()
+    bounds = np.flatnonzero(part[1:] != part[:-1]) + 1
+    for k, rows in zip(part[np.r_[0, bounds]], np.split(h, bounds)):
+        idx.set_partition(str(k), rows)
+    return len(touched), len(key_df), int(updated)
+
+def _data_cols(con, table: str) -> list[str]:
+    return [c for c, *_ in con.execute(f"DESCRIBE {table}").fetchall() if c not in ("_src", "_rn", "_part", "ordinality")]
+
+def cdc_copy(con, nk, seq: int, d: Path) -> tuple[int, int, list[str]]:
+    """cdc after/before images of the last upsert() → d/*.parquet; returns (inserted, updated, partitions)"""
+    match = " AND ".join(f"o.{_q(c)} IS NOT DISTINCT FROM b.{_q(c)}" for c in nk)
+    hit = f"EXISTS (SELECT 1 FROM old o WHERE {match})"
+    for name, sql in (
+        ("after", f"SELECT {int(seq)}::BIGINT AS _seq, CASE WHEN {hit} THEN 'update' ELSE 'insert' END AS _op, "
+                  f"b._part, {', '.join('b.' + _q(c) for c in _data_cols(con, 'batch'))} "
+                  f"FROM batch b ORDER BY b._part, b._src, b._rn"),
+        ("before", f"SELECT {int(seq)}::BIGINT AS _seq, o._part, {', '.join('o.' + _q(c) for c in _data_cols(con, 'old'))} "
+                   f"FROM old o WHERE EXISTS (SELECT 1 FROM batch b WHERE {match}) ORDER BY o._part, o._rn"),
+    ):
+        r = con.execute(sql).arrow()   # 新版 duckdb 回傳 RecordBatchReader
+        cdc.write_image(r.read_all() if hasattr(r, "read_all") else r, d / f"{name}.parquet", name)
+    ins, upd = con.execute(f"SELECT count(*) FILTER (WHERE NOT {hit}), count(*) FILTER (WHERE {hit}) FROM batch b").fetchone()
+    parts = [r[0] for r in con.execute("SELECT DISTINCT _part FROM batch ORDER BY 1").fetchall()]
+    return int(ins), int(upd), parts
+
+def dq_counts(con) -> pd.DataFrame:
+    """dq_metrics.gold_counts for the partitions of the last upsert()"""
+    q = lambda dim, col: (f"SELECT 'gold' AS layer, _part AS day, '{dim}' AS dim, {col} AS key, '' AS reason, "
+                          f"count(*) AS rows, sum(revenue_jpy) AS revenue_jpy, 0 AS first FROM upserted "
+                          + (f"WHERE {col} IS NOT NULL " if dim != "total" else "") + "GROUP BY ALL")
+    df = con.execute(" UNION ALL ".join([q("total", "''"), q("geo", "CAST(geo_id AS VARCHAR)"),
+                                         q("product", "CAST(product_id AS VARCHAR)")])
+                     + " ORDER BY day, dim DESC, key").df()
+    return df.astype({"key": "str", "rows": "int64", "revenue_jpy": "float64", "first": "int64"})[dq_metrics.COLS]
+
+def rollup_rows(con) -> pd.DataFrame:
+    """rollups.day_rollup for the partitions of the last upsert()"""
+    df = con.execute(f"""
+        SELECT nullif(_part, '{gold_store.NULL_PART}') AS order_date, CAST(geo_id AS VARCHAR) AS geo_id,
+               CAST(product_id AS VARCHAR) AS product_id, count(*) AS orders, sum(revenue_jpy) AS revenue_jpy
+        FROM upserted GROUP BY ALL ORDER BY ALL
+    """).df()
+    return df.astype({"orders": "int64", "revenue_jpy": "float64"})[rollups.COLS]
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Hash-sharded pandas upsert for to_gold --shards N.
+  data/gold/_shards/plan.json                      : {"nk", "shards", "columns", "parts", "rows"}
+  data/gold/_shards/shard-NN/input.parquet         : _pos | _part | _h | silver columns (rows with nk hash % N == NN)
+  data/gold/_shards/shard-NN/<date_col>=KEY.parquet : same + _op, the surviving rows of one partition
+  data/gold/_shards/shard-NN/replaced.parquet      : _part | _row  old gold rows whose key this shard rewrites
+  data/gold/_shards/shard-NN/_done.json            : counts (written last)
+split streams the new silver rows into shards on their natural-key hash, so
+every write of a key lands in the same shard. work dedups one shard (last
+write wins) and matches it against the nk index; it reads gold only for
+partitions the index is out of date for. merge then takes the partitions in
+to_gold's order, drops the replaced rows, appends the surviving ones in input
+order (_pos) and date-merges them with to_gold.merge_partition, so gold, the nk
+index, dq metrics, rollups and the CDC run equal the single-process result.
+work only needs the shared data/ directory, so with --shard-workers 0
+to_gold waits for shards run elsewhere:
+
+  python scripts/gold_shards.py work --shard 3   # one shard of the current plan
+  python scripts/gold_shards.py show
+"""
+from __future__ import annotations
+import argparse, json, os, shutil, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import cdc, gold_store, nk_index, perf, storage, typed_frames
+
+SHARD_DIR = Path("data/gold/_shards")
+PLAN_PATH = SHARD_DIR / "plan.json"
+HELPERS = ["_pos", "_part", "_h"]
+WAIT_TIMEOUT = 6 * 3600   # 秒（--shard-workers 0 時等待外部 work 的上限）
+
+def shard_dir(i: int) -> Path:
+    return SHARD_DIR / f"shard-{i:02d}"
+
+def _write_json(path: Path, obj) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+def load_plan() -> dict:
+    if not PLAN_PATH.exists():
+        raise SystemExit(f"No shard plan at {PLAN_PATH}; to_gold --shards N writes it")
+    return json.loads(PLAN_PATH.read_text(encoding="utf-8"))
+
+def shard_of(h: np.ndarray, shards: int) -> np.ndarray:
+    return (h % np.uint64(shards)).astype(np.int64)
+
+def split(todo, shards: int, chunk_rows: int = 250_000) -> dict:
+    """Route the new silver rows to shard inputs chunk by chunk (never the whole batch in memory)"""
+    import to_gold   # to_gold 也 import 本模組，故延遲載入
+    shutil.rmtree(SHARD_DIR, ignore_errors=True)
+    cols = list(dict.fromkeys(c for p in todo for c in storage.columns(p)))
+    nk = to_gold.pick_natural_key(cols)
+    if not nk:
+        raise SystemExit(f"Cannot determine natural key from columns: {cols}")
+    writers = [storage.FrameWriter(shard_dir(i) / "input", "parquet") for i in range(shards)]
+    pos, parts, out_cols = 0, set(), cols
+    for p in todo:
+        for df in storage.iter_frame(p, dtype=typed_frames.csv_dtypes("silver"), chunk_rows=chunk_rows):
+            if list(df.columns) != cols:   # 與 read_many 的 concat 相同，先對齊欄位
+                df = df.reindex(columns=cols)
+            df = to_gold.ensure_revenue(typed_frames.apply(df, "silver"))
+            out_cols = list(df.columns)
+            h = nk_index.nk_hash(df, nk)
+            keys = gold_store.partition_keys(df[nk[0]])
+            df = df.assign(_pos=np.arange(pos, pos + len(df)), _part=keys.to_numpy(), _h=h)[HELPERS + out_cols]
+            s = shard_of(h, shards)
+            for i, rows in pd.Series(s).groupby(s).indices.items():
+                writers[i].write(df.iloc[rows])
+            parts.update(keys.unique()); pos += len(df)
+    for w in writers:
+        w.close()
+    plan = {"nk": nk, "shards": shards, "columns": out_cols, "parts": sorted(parts), "rows": pos}
+    _write_json(PLAN_PATH, plan)
+    return plan
+
+def _old_hashes(idx, nk, key: str):
+    """Index hashes of an old partition; rehashed from gold if the index does not match its row count"""
+    p = gold_store.part_file(gold_store.partition_dir(nk[0], key))
+    old_h = idx.hashes(key)
+    if p and (old_h is None or len(old_h) != storage.count_rows(p)):
+        old_h = nk_index.nk_hash(gold_store.read_partition(nk[0], key), nk)
+    return old_h if p else None
+
+def work(shard: int) -> dict:
+    """Dedup one shard and match it against old gold; writes its files and _done.json"""
+    plan = load_plan()
+    nk, d = plan["nk"], shard_dir(shard)
+    d.mkdir(parents=True, exist_ok=True)
+    src = storage.existing(d / "input")
+    idx = nk_index.NKIndex.load() or nk_index.NKIndex()
+    done = {"shard": shard, "rows_in": 0, "rows_kept": 0, "replaced": 0}
+    replaced = [pd.DataFrame({"_part": pd.Series(dtype="str"), "_row": np.empty(0, np.int64)})]
+    if src:
+        with perf.span("read_shard") as sp:
+            df = typed_frames.read(src, "silver"); sp.rows_out = len(df)
+        with perf.span("shard_upsert", rows_in=len(df)) as sp:
+            kept = df.loc[~df.duplicated(["_part", "_h"], keep="last").to_numpy()]
+            for key, rows in kept.groupby("_part", sort=True).indices.items():
+                new = kept.iloc[rows]; new_h = new["_h"].to_numpy(dtype=np.uint64)
+                old_h = _old_hashes(idx, nk, key)
+                hit = np.isin(new_h, old_h) if old_h is not None else np.zeros(len(new), dtype=bool)
+                storage.write_frame(new.assign(_op=np.where(hit, "update", "insert")), d / f"{nk[0]}={key}", "parquet")
+                if old_h is not None:
+                    replaced.append(pd.DataFrame({"_part": key, "_row": np.flatnonzero(np.isin(old_h, new_h))}))
+            sp.rows_out = len(kept)
+        done.update(rows_in=len(df), rows_kept=len(kept))
+    replaced = pd.concat(replaced, ignore_index=True)
+    done["replaced"] = len(replaced)
+    replaced.to_parquet(d / "replaced.parquet", index=False)
+    _write_json(d / "_done.json", done)
+    return done
+
+def _run_workers(shards: int, workers: int) -> list[dict]:
+    if workers <= 0:   # 由其他主機執行 gold_shards.py work
+        print(f"[gold_shards] Waiting for {shards} shard(s): python scripts/gold_shards.py work --shard N")
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while missing := [i for i in range(shards) if not (shard_dir(i) / "_done.json").exists()]:
+            if time.monotonic() > deadline:
+                raise SystemExit(f"[gold_shards] Timed out waiting for shard(s) {missing}")
+            time.sleep(1)
+        return [json.loads((shard_dir(i) / "_done.json").read_text(encoding="utf-8")) for i in range(shards)]
+    if workers == 1:
+        return [work(i) for i in range(shards)]
+    out = []
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        for res, stats in ex.map(perf.in_worker, [work] * shards, range(shards)):
+            perf.absorb(stats); out.append(res)
+    return out
+
+def merge(plan: dict, idx):
+    """Per partition in to_gold order: (key, rows, hashes, after, before, keys updated)"""
+    import to_gold
+    nk, part_col = plan["nk"], plan["nk"][0]
+    shards = range(plan["shards"])
+    replaced = pd.concat([pd.read_parquet(shard_dir(i) / "replaced.parquet") for i in shards], ignore_index=True)
+    gone_rows = {k: replaced["_row"].to_numpy()[r] for k, r in replaced.groupby("_part", sort=False).indices.items()}
+    for key in plan["parts"]:
+        with perf.span("read_shards") as sp:
+            pieces = [typed_frames.read(p, "silver") for p in
+                      (storage.existing(shard_dir(i) / f"{part_col}={key}") for i in shards) if p]
+            new = typed_frames.concat(pieces, "silver").sort_values("_pos", kind="stable"); sp.rows_out = len(new)
+        new_h, hit = new["_h"].to_numpy(dtype=np.uint64), new["_op"].to_numpy() == "update"
+        new = new[plan["columns"]].reset_index(drop=True)
+        with perf.span("read_partition") as sp:
+            old_df = gold_store.read_partition(part_col, key); sp.rows_out = 0 if old_df is None else len(old_df)
+        old_h = to_gold.partition_hashes(idx, nk, key, old_df)
+        gone = None
+        if old_df is not None:
+            gone = np.zeros(len(old_df), dtype=bool); gone[gone_rows.get(key, [])] = True
+        with perf.span("cdc"):
+            a, b = cdc.delta_frames(key, new, hit, old_df, gone, new.columns)
+        with perf.span("merge_partition", rows_in=len(new)) as sp:
+            out, out_h = to_gold.merge_partition(old_df, old_h, None if gone is None else ~gone, new, new_h); sp.rows_out = len(out)
+        yield key, out, out_h, a, b, len(b)
+
+def run(todo, shards: int, workers: int | None = None) -> None:
+    """to_gold's pandas upsert over shards (workers: processes, 0 = wait for external gold_shards.py work)"""
+    import to_gold
+    with perf.span("shard_split") as sp:
+        plan = split(todo, shards); sp.rows_out = plan["rows"]
+    nk = plan["nk"]
+    print(f"[to_gold] Using natural key: {nk} ({shards} shards)")
+    with perf.span("load_index"): idx = to_gold.load_index(nk)
+    if not nk_index.INDEX_PATH.exists():
+        idx.save()   # work 讀取磁碟上的索引
+    cdc.snapshot_if_missing(nk)
+    workers = min(shards, os.cpu_count() or 1) if workers is None else workers
+    with perf.span("shard_work"):
+        done = _run_workers(shards, workers)
+    print(f"[gold_shards] Rows per shard: {', '.join(str(r['rows_kept']) for r in done)}")
+    to_gold.commit_partitions(nk, idx, merge(plan, idx), plan["rows"], engine=f"pandas/{shards} shards")
+    shutil.rmtree(SHARD_DIR, ignore_errors=True)
+
+@perf.timed("gold_shards", run=True)
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    w = sub.add_parser("work", help="run one shard of the current plan")
+    w.add_argument("--shard", type=int, required=True)
+    sub.add_parser("show", help="plan and shard progress")
+    a = ap.parse_args()
+    plan = load_plan()
+    if a.cmd == "work":
+        if not 0 <= a.shard < plan["shards"]:
+            print(f"Shard {a.shard} out of range (plan has {plan['shards']})", file=sys.stderr); sys.exit(1)
+        r = work(a.shard)
+        print(f"[gold_shards] Shard {a.shard}: {r['rows_in']:,} rows in, {r['rows_kept']:,} kept, {r['replaced']:,} old rows replaced")
+    else:
+        print(f"natural key {plan['nk']}: {plan['rows']:,} rows, {len(plan['parts'])} partitions, {plan['shards']} shards")
+        for i in range(plan["shards"]):
+            p = shard_dir(i) / "_done.json"
+            if p.exists():
+                r = json.loads(p.read_text(encoding="utf-8"))
+                print(f"  shard-{i:02d}: {r['rows_in']:,} rows in, {r['rows_kept']:,} kept, {r['replaced']:,} replaced")
+            else:
+                print(f"  shard-{i:02d}: pending")
+
+if __name__ == "__main__":
+    main()
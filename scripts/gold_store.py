@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Date-partitioned gold store.
+  data/gold/fact_sales/<date_col>=YYYYMMDD/part-0.{csv,parquet}
+Partitions are ordered by date (unparseable last); rows keep their in-partition order.
+Reads come back with typed_frames' compact dtypes unless typed=False.
+
+  python scripts/gold_store.py count
+  python scripts/gold_store.py export [--out data/gold/fact_sales.csv]
+"""
+from __future__ import annotations
+import argparse, os, sys
+from pathlib import Path
+import pandas as pd
+import storage, typed_frames
+
+GOLD_DIR = Path("data/gold/fact_sales")
+LEGACY_PATH = Path("data/gold/fact_sales.csv")   # 舊的單一檔案 & CI 用匯出
+PART_STEM = "part-0"
+NULL_PART = "__null__"
+
+def partition_keys(sr: pd.Series) -> pd.Series:
+    """Partition value per row as string (YYYYMMDD ints stay without '.0')"""
+    if pd.api.types.is_float_dtype(sr) and (sr.dropna() % 1 == 0).all():
+        sr = sr.astype("Int64")
+    return sr.astype("string").fillna(NULL_PART)
+
+def partition_dir(col: str, key: str) -> Path:
+    return GOLD_DIR / f"{col}={key}"
+
+def key_order(key: str):
+    """Sort key for partition values: dates first, in date order"""
+    ts = pd.to_datetime(key, format="%Y%m%d", errors="coerce")
+    return (pd.isna(ts), ts if not pd.isna(ts) else pd.Timestamp.min, key)
+
+def _sort_key(d: Path):
+    return key_order(d.name.split("=", 1)[1])
+
+def part_file(d: Path) -> Path | None:
+    return storage.existing(d / PART_STEM)
+
+def list_partitions() -> list[Path]:
+    if not GOLD_DIR.exists():
+        return []
+    parts = [d for d in GOLD_DIR.iterdir() if d.is_dir() and "=" in d.name and part_file(d)]
+    return sorted(parts, key=_sort_key)
+
+def exists() -> bool:
+    return bool(list_partitions())
+
+def read_partition(col: str, key: str, typed: bool = True) -> pd.DataFrame | None:
+    p = part_file(partition_dir(col, key))
+    if not p:
+        return None
+    return typed_frames.read(p, "gold") if typed else storage.read_frame(p)
+
+def write_partition(col: str, key: str, df: pd.DataFrame) -> Path:
+    d = partition_dir(col, key)
+    storage.write_frame(df, d / PART_STEM)
+    return d
+
+def read_gold(columns=None, filters=None, keys=None, typed: bool = True) -> pd.DataFrame:
+    """
+    Whole gold table in date order (empty frame if the store is empty).
+    keys prunes partitions by value; columns/filters go to storage.read_frame.
+    """
+    parts = list_partitions()
+    if keys is not None:
+        keys = {str(k) for k in keys}
+        parts = [d for d in parts if d.name.split("=", 1)[1] in keys]
+    files = [part_file(d) for d in parts]
+    if typed:
+        return typed_frames.read_many(files, "gold", columns, filters)
+    return storage.read_frames(files, columns, filters)
+
+def count_rows() -> int:
+    return sum(storage.count_rows(part_file(d)) for d in list_partitions())
+
+def migrate_legacy(col: str) -> bool:
+    """Split an old single-file fact_sales.csv into partitions (once)"""
+    if exists() or not LEGACY_PATH.exists():
+        return False
+    old = pd.read_csv(LEGACY_PATH)
+    if col not in old.columns:
+        raise SystemExit(f"Existing gold missing partition column {col!r}; delete {LEGACY_PATH} once or migrate columns.")
+    for key, part in old.groupby(partition_keys(old[col]), sort=False):
+        write_partition(col, key, part)
+    print(f"[gold_store] Migrated {len(old):,} rows from {LEGACY_PATH} into {GOLD_DIR}/")
+    return True
+
+def export_csv(out: str | Path = LEGACY_PATH, df: pd.DataFrame | None = None) -> int:
+    """Always CSV, whatever PIPELINE_FORMAT is (df: gold already in memory); written to a temp file, then renamed"""
+    df = read_gold(typed=False) if df is None else storage.plain(df)
+    tmp = Path(out).with_name(Path(out).name + ".tmp")
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, out)
+    return len(df)
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("count", help="print gold row count")
+    e = sub.add_parser("export", help="write the whole table as one CSV (CI artifact)")
+    e.add_argument("--out", default=str(LEGACY_PATH))
+    a = ap.parse_args()
+    if not exists():
+        print(f"Gold not found: {GOLD_DIR}/", file=sys.stderr)
+        sys.exit(1)
+    if a.cmd == "count":
+        print(count_rows())
+    else:
+        n = export_csv(a.out)
+        print(f"[gold_store] Exported {n:,} rows to {a.out}")
+
+if __name__ == "__main__":
+    main()
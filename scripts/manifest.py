@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Processing manifest: input fingerprints and the outputs produced from them"""
+from __future__ import annotations
+import hashlib, json, os
+from pathlib import Path
+
+def file_sha256(path: str | Path, chunk: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            b = f.read(chunk)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+class Manifest:
+    """
+    JSON file keyed by input path:
+      {"<input>": {"size": int, "mtime_ns": int, "sha256": str, "outputs": [...]}}
+
+    An input is unchanged when its size matches and either its mtime matches or
+    (after a touch / identical rewrite) its content hash still matches, and all
+    outputs recorded for it still exist.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.entries: dict = {}
+        if self.path.exists():
+            self.entries = json.loads(self.path.read_text(encoding="utf-8"))
+        self._hashes: dict = {}
+
+    def _sha(self, src: Path, st: os.stat_result) -> str:
+        k = (str(src), st.st_size, st.st_mtime_ns)
+        if k not in self._hashes:
+            self._hashes[k] = file_sha256(src)
+        return self._hashes[k]
+
+    def changed(self, src: str | Path) -> bool:
+        src = Path(src)
+        e = self.entries.get(str(src))
+        if e is None:
+            return True
+        st = src.stat()
+        if st.st_size != e["size"]:
+            return True
+        if not all(Path(o).exists() for o in e.get("outputs", [])):
+            return True
+        if st.st_mtime_ns == e["mtime_ns"]:
+            return False
+        if self._sha(src, st) != e["sha256"]:
+            return True
+        e["mtime_ns"] = st.st_mtime_ns   # touched but identical
+        return False
+
+    def record(self, src: str | Path, outputs=(), sha256: str | None = None, **extra) -> None:
+        """sha256 may be precomputed (e.g. by a pool worker) to avoid re-hashing"""
+        src = Path(src)
+        st = src.stat()
+        if sha256 is not None:
+            self._hashes[(str(src), st.st_size, st.st_mtime_ns)] = sha256
+        self.entries[str(src)] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": self._sha(src, st),
+            "outputs": [str(o) for o in outputs],
+            **extra,
+        }
+
+    def prune(self, keep) -> None:
+        """Drop entries for inputs that no longer exist"""
+        keep = {str(k) for k in keep}
+        for k in [k for k in self.entries if k not in keep]:
+            del self.entries[k]
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(self.entries, indent=1, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, self.path)
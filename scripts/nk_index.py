@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Persistent natural-key index for the gold store.
+  data/gold/_nk_index.parquet : nk_hash (uint64) | partition (str) | row (int32)
+Each gold row's natural key is kept as a fixed-width 64-bit hash together with
+its partition and row position, so upserts find replaced rows without building
+string keys for old gold.
+
+  python scripts/nk_index.py check     # exit 1 if the index disagrees with gold
+  python scripts/nk_index.py rebuild
+"""
+from __future__ import annotations
+import os, sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import gold_store
+
+INDEX_PATH = Path("data/gold/_nk_index.parquet")
+
+def _normalize(sr: pd.Series) -> pd.Series:
+    """Same hash whatever width the ints were read with (int32/int64/Int64) and for str vs category"""
+    if isinstance(sr.dtype, pd.CategoricalDtype):
+        sr = sr.astype(sr.cat.categories.dtype)
+    if pd.api.types.is_bool_dtype(sr):
+        return sr
+    if pd.api.types.is_integer_dtype(sr):
+        return sr.astype("Int64") if sr.hasnans else sr.astype("int64")
+    if pd.api.types.is_float_dtype(sr) and (sr.dropna() % 1 == 0).all():
+        return sr.astype("Int64") if sr.hasnans else sr.astype("int64")
+    if pd.api.types.is_string_dtype(sr) or sr.dtype == object:
+        return sr.astype("string")
+    return sr
+
+def nk_hash(df: pd.DataFrame, key_cols) -> np.ndarray:
+    """uint64 hash of the natural key columns, stable across storage dtypes"""
+    parts = pd.DataFrame({c: _normalize(df[c]) for c in key_cols})
+    return pd.util.hash_pandas_object(parts, index=False).to_numpy(dtype=np.uint64)
+
+class NKIndex:
+    def __init__(self, frame: pd.DataFrame | None = None):
+        self.parts: dict[str, np.ndarray] = {}   # partition → hashes in row order
+        if frame is not None and len(frame):
+            frame = frame.sort_values(["partition", "row"], kind="stable")
+            for key, g in frame.groupby("partition", sort=False, observed=True):
+                self.parts[str(key)] = g["nk_hash"].to_numpy(dtype=np.uint64)
+
+    @classmethod
+    def load(cls, path: str | Path = INDEX_PATH) -> "NKIndex | None":
+        if not Path(path).exists():
+            return None
+        return cls(pd.read_parquet(path))
+
+    def save(self, path: str | Path = INDEX_PATH) -> None:
+        frames = [
+            pd.DataFrame({"nk_hash": h, "partition": key, "row": np.arange(len(h), dtype=np.int32)})
+            for key, h in sorted(self.parts.items())
+        ]
+        df = (pd.concat(frames, ignore_index=True) if frames
+              else pd.DataFrame({"nk_hash": np.empty(0, np.uint64), "partition": [], "row": np.empty(0, np.int32)}))
+        df["partition"] = df["partition"].astype("category")
+        path = Path(path); path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+    def hashes(self, key: str) -> np.ndarray | None:
+        return self.parts.get(key)
+
+    def set_partition(self, key: str, hashes: np.ndarray) -> None:
+        self.parts[key] = np.asarray(hashes, dtype=np.uint64)
+
+    def __len__(self) -> int:
+        return sum(len(h) for h in self.parts.values())
+
+def _gold_nk(key_cols=None):
+    parts = gold_store.list_partitions()
+    if key_cols is None and parts:
+        from to_gold import pick_natural_key   # to_gold 也 import 本模組，故延遲載入
+        key_cols = pick_natural_key(gold_store.storage.columns(gold_store.part_file(parts[0])))
+    return key_cols
+
+def rebuild(key_cols=None) -> NKIndex:
+    """Index from the gold partitions (reads key columns only)"""
+    key_cols = _gold_nk(key_cols)
+    idx = NKIndex()
+    for d in gold_store.list_partitions():
+        df = gold_store.typed_frames.read(gold_store.part_file(d), "gold", columns=key_cols)
+        idx.set_partition(d.name.split("=", 1)[1], nk_hash(df, key_cols))
+    return idx
+
+def check(key_cols=None, idx: NKIndex | None = None) -> list[str]:
+    """Differences between the stored index and gold (empty list = consistent)"""
+    idx = idx or NKIndex.load()
+    if idx is None:
+        return [f"{INDEX_PATH} not found"]
+    fresh = rebuild(key_cols)
+    errs = []
+    for key in sorted(set(idx.parts) | set(fresh.parts)):
+        a, b = idx.hashes(key), fresh.hashes(key)
+        if a is None or b is None:
+            errs.append(f"partition {key}: {'missing from index' if a is None else 'not in gold'}")
+        elif len(a) != len(b) or not np.array_equal(a, b):
+            errs.append(f"partition {key}: {int((a[:len(b)] != b[:len(a)]).sum()) + abs(len(a) - len(b))} rows differ")
+    for key, h in fresh.parts.items():
+        if len(np.unique(h)) != len(h):
+            errs.append(f"partition {key}: duplicate natural keys")
+    return errs
+
+def main():
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "rebuild":
+        idx = rebuild(); idx.save()
+        print(f"[nk_index] Rebuilt {len(idx):,} keys over {len(idx.parts)} partitions → {INDEX_PATH}")
+    elif cmd == "check":
+        errs = check()
+        for e in errs[:20]:
+            print(f"  ❌ {e}")
+        print("  ✅ nk index consistent" if not errs else f"  {len(errs)} problem(s)")
+        sys.exit(1 if errs else 0)
+    else:
+        print("Usage: python scripts/nk_index.py check|rebuild"); sys.exit(1)
+
+if __name__ == "__main__":
+    main()
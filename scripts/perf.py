@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Stage instrumentation: wall / CPU time, rows in/out, bytes read/written and
+peak RSS per stage and sub-step. Entry points open a run; it is written to
+reports/run_profile.json when it closes.
+
+    @perf.timed("to_gold", run=True)
+    def main(argv=None):
+        with perf.span("read_silver") as r:
+            df = ...; r.rows_out = len(df)
+
+Spans are aggregated by path ("to_gold/upsert_partition": calls, totals).
+A span opened with no run open (a helper called from a test or another
+tool) records nothing; a run opened inside another run is a plain span.
+PIPELINE_PROFILE=cprofile | sample additionally profiles every outermost
+run → reports/profile_<name>.pstats/.txt or .folded (collapsed stacks for
+flamegraph.pl / speedscope).
+"""
+from __future__ import annotations
+import functools, json, os, resource, sys, threading, time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+
+PROFILE_PATH = Path("reports/run_profile.json")
+SAMPLE_INTERVAL = 0.005   # 秒
+
+_stack: list["Span"] = []
+_stats: dict[str, dict] = {}
+_detached = False   # pool worker: collect only, the parent writes the profile
+
+def _io() -> tuple[int, int]:
+    """(bytes read, bytes written) by this process so far; zeros where /proc is unavailable"""
+    try:
+        with open("/proc/self/io") as f:
+            kv = dict(line.split(": ") for line in f.read().splitlines())
+        return int(kv["rchar"]), int(kv["wchar"])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+def _peak_mb() -> float:
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / 2**20 if sys.platform == "darwin" else r / 1024
+
+class Span:
+    def __init__(self, name: str, rows_in=None, rows_out=None):
+        self.name, self.rows_in, self.rows_out = name, rows_in, rows_out
+
+def _path() -> str:
+    return "/".join(sp.name for sp in _stack)
+
+def annotate(rows_in=None, rows_out=None) -> None:
+    """Add row counts to the innermost open span (e.g. from a @timed main)"""
+    if _stack:
+        sp = _stack[-1]
+        if rows_in is not None: sp.rows_in = (sp.rows_in or 0) + rows_in
+        if rows_out is not None: sp.rows_out = (sp.rows_out or 0) + rows_out
+
+def _add(path: str, wall, cpu, rd, wr, peak, rows_in, rows_out, calls=1) -> None:
+    s = _stats.setdefault(path, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "rows_in": 0, "rows_out": 0,
+                                 "bytes_read": 0, "bytes_written": 0, "peak_rss_mb": 0.0})
+    s["calls"] += calls; s["wall_s"] += wall; s["cpu_s"] += cpu
+    s["bytes_read"] += rd; s["bytes_written"] += wr
+    s["rows_in"] += rows_in or 0; s["rows_out"] += rows_out or 0
+    s["peak_rss_mb"] = max(s["peak_rss_mb"], peak)
+
+@contextmanager
+def _open(sp: Span, outer: bool):
+    _stack.append(sp)
+    path = _path()
+    prof = _start_profiler() if outer else None
+    t0, c0, (r0, w0) = time.perf_counter(), time.process_time(), _io()
+    try:
+        yield sp
+    finally:
+        r1, w1 = _io()
+        _add(path, time.perf_counter() - t0, time.process_time() - c0, r1 - r0, w1 - w0,
+             _peak_mb(), sp.rows_in, sp.rows_out)
+        _stack.pop()
+        if outer:
+            _stop_profiler(prof, sp.name)
+            write_profile(sp.name)
+
+def span(name: str, rows_in=None, rows_out=None):
+    """Sub-step of the open run; a no-op when no run is open"""
+    sp = Span(name, rows_in, rows_out)
+    return _open(sp, False) if _stack or _detached else nullcontext(sp)
+
+def run(name: str, rows_in=None, rows_out=None):
+    """An entry point's run: the outermost one is profiled and written to PROFILE_PATH"""
+    return _open(Span(name, rows_in, rows_out), not _stack and not _detached)
+
+def timed(name: str | None = None, run: bool = False):
+    """Decorator form of span(), or of run() for an entry point's main"""
+    open_ = _run if run else span
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*a, **kw):
+            with open_(name or fn.__name__):
+                return fn(*a, **kw)
+        return wrapper
+    return deco
+
+_run = run
+
+def in_worker(fn, *args, **kw):
+    """Run fn in a pool worker; returns (result, span stats) for absorb() in the parent"""
+    global _detached
+    _detached = True; _stack.clear(); _stats.clear()   # 不沿用 fork 自父行程的堆疊
+    out = fn(*args, **kw)
+    stats = dict(_stats); _stats.clear()
+    return out, stats
+
+def absorb(stats: dict) -> None:
+    """Merge a worker's stats under the current span path"""
+    prefix = _path()
+    for path, s in stats.items():
+        _add(f"{prefix}/{path}" if prefix else path, s["wall_s"], s["cpu_s"], s["bytes_read"],
+             s["bytes_written"], s["peak_rss_mb"], s["rows_in"], s["rows_out"], s["calls"])
+
+def write_profile(name: str, path: Path = PROFILE_PATH) -> None:
+    """Replace this run's entry (keyed by run name) in the profile file"""
+    spans = [{"path": p, **{k: round(v, 4) if isinstance(v, float) else v for k, v in s.items()}}
+             for p, s in sorted(_stats.items())]
+    _stats.clear()
+    doc = {"runs": {}}
+    if path.exists():
+        try:
+            doc = json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            pass
+    doc.setdefault("runs", {})[name] = {
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "pid": os.getpid(),
+        "argv": sys.argv,
+        "spans": spans,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(doc, indent=1, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+# ===== optional profilers (PIPELINE_PROFILE) =====
+
+class _Sampler(threading.Thread):
+    """Samples the main thread's stack every SAMPLE_INTERVAL seconds"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.target = threading.main_thread().ident
+        self.counts: Counter = Counter()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(SAMPLE_INTERVAL):
+            f = sys._current_frames().get(self.target)
+            stack = []
+            while f is not None:
+                stack.append(f"{Path(f.f_code.co_filename).stem}:{f.f_code.co_name}")
+                f = f.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+def _start_profiler():
+    mode = os.environ.get("PIPELINE_PROFILE", "").lower()
+    if mode == "cprofile":
+        import cProfile
+        p = cProfile.Profile(); p.enable()
+        return p
+    if mode == "sample":
+        s = _Sampler(); s.start()
+        return s
+    return None
+
+def _stop_profiler(prof, name: str) -> None:
+    if prof is None:
+        return
+    out = PROFILE_PATH.parent / f"profile_{name}"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    if isinstance(prof, _Sampler):
+        prof.done.set(); prof.join()
+        Path(f"{out}.folded").write_text("".join(f"{k} {v}\n" for k, v in prof.counts.most_common()),
+                                         encoding="utf-8")
+        return
+    import io, pstats
+    prof.disable()
+    prof.dump_stats(f"{out}.pstats")
+    buf = io.StringIO()
+    pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(30)
+    Path(f"{out}.txt").write_text(buf.getvalue(), encoding="utf-8")
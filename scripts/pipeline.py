@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+In-process pipeline runner: one Python process runs the stage DAG and shares
+loaded frames between stages (gold / DQ totals are read at most
+once per run). A stage is skipped when the fingerprint of its inputs
+(parameters + size/mtime of its input files) matches the last successful run
+and its outputs still exist. Per-stage timings go to reports/run_profile.json
+under the "pipeline" run (see perf.py).
+  data/_pipeline_state.json : {stage: {"fingerprint": str, "outputs": [...]}}
+
+  python scripts/pipeline.py everything          # ingest silver gold digests validate demo
+  python scripts/pipeline.py dashboard --force   # ignore the cache and the silver / gold manifests
+"""
+from __future__ import annotations
+import argparse, contextlib, hashlib, json, os, time
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+import perf, storage
+
+STATE_PATH = Path("data/_pipeline_state.json")
+GOLD_FILES = "data/gold/fact_sales/*/part-*"
+SILVER_FILES = "data/silver/sales_clean_*"
+QUAR_FILES = "data/silver/quarantine/sales_bad_*"
+QUAR_INDEX = "data/silver/quarantine/_store/_index.json"
+
+class Context:
+    """Run parameters + frames shared between stages (loaded lazily, once)"""
+
+    def __init__(self, args):
+        self.args = args
+        self._frames: dict[str, pd.DataFrame] = {}
+
+    def frame(self, name: str) -> pd.DataFrame:
+        if name not in self._frames:
+            if name == "gold":
+                import gold_store
+                self._frames[name] = gold_store.read_gold()
+            elif name == "dq_totals":
+                import dq_metrics
+                self._frames[name] = dq_metrics.load_totals()
+        return self._frames[name]
+
+    def invalidate(self, *names: str) -> None:
+        for n in names:
+            self._frames.pop(n, None)
+
+def _exit_code(fn, *args, **kw) -> int:
+    """Call a script main() that may sys.exit()"""
+    try:
+        fn(*args, **kw)
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    return 0
+
+# ===== stages =====
+
+def run_ingest(ctx):
+    import generate_sales
+    generate_sales.main(["--days", str(ctx.args.gen_days), "--seed", str(ctx.args.gen_seed)])
+
+def _refresh(ctx) -> list[str]:
+    """--force also bypasses the silver / gold manifests"""
+    return ["--full-refresh"] if ctx.args.force else []
+
+def run_silver(ctx):
+    import to_silver
+    Path("data/silver/quarantine").mkdir(parents=True, exist_ok=True)
+    if _exit_code(to_silver.main, ["--workers", str(ctx.args.workers), *_refresh(ctx)]):
+        raise SystemExit("silver failed")
+    ctx.invalidate("dq_totals")
+
+def run_gold(ctx):
+    import to_gold
+    to_gold.main(["--engine", ctx.args.engine, "--shards", str(ctx.args.shards), *_refresh(ctx)])
+    ctx.invalidate("gold", "dq_totals")
+
+def run_validate(ctx):
+    import validate_silver, validate_gold
+    Path("reports").mkdir(exist_ok=True)
+    _exit_code(validate_silver.main)   # silver 的違規僅視為警告（同 make validate 的 `|| true`）
+    if _exit_code(validate_gold.main, ctx.frame("gold")):
+        raise SystemExit("gold validation failed")
+
+def run_demo(ctx):
+    import run_sql
+    run_sql.main(["sql/demo_queries.sql"])
+
+def run_dashboard(ctx):
+    import dq_dashboard
+    Path("reports").mkdir(exist_ok=True)
+    with open("reports/dq_dashboard.txt", "w", encoding="utf-8") as f, contextlib.redirect_stdout(f):
+        dq_dashboard.main(ctx.frame("dq_totals"))
+
+def run_trends(ctx):
+    import update_trends
+    update_trends.update_trends(ctx.frame("dq_totals"))
+    print("✅ Trends updated in reports/quarantine_trends.csv")
+
+def run_returns(ctx):
+    import quarantine_store
+    returns = quarantine_store.returns()   # 只讀有 neg_or_zero_qty 的日期的 segment
+    returns.to_csv("data/gold/fact_returns.csv", index=False)
+    print(f"Extracted {len(returns)} potential returns")
+
+def run_digests(ctx):
+    import digests
+    doc = digests.update()
+    print(f"[digests] {sum(t['partitions'] for t in doc['totals'].values())} partitions → {digests.DIGEST_PATH}")
+
+def run_export(ctx):
+    import gold_store
+    n = gold_store.export_csv(gold_store.LEGACY_PATH, ctx.frame("gold"))
+    print(f"[gold_store] Exported {n:,} rows → {gold_store.LEGACY_PATH}")
+
+def _today(ctx):
+    return datetime.now().strftime("%Y-%m-%d")
+
+# name: (deps, input globs, output globs, params(ctx), run); outputs=None → never cached
+STAGES = {
+    "ingest":    ([], [], ["data/raw/sales_*.csv"],
+                  lambda c: [c.args.gen_days, c.args.gen_seed, _today(c)], run_ingest),
+    "silver":    (["ingest"], ["data/raw/sales_*.csv"], [SILVER_FILES, "data/silver/_manifest.json"],
+                  lambda c: [c.args.workers, storage.current_format()], run_silver),
+    "gold":      (["silver"], [SILVER_FILES], [GOLD_FILES, "data/gold/_manifest.json"],
+                  lambda c: [c.args.engine, c.args.shards, storage.current_format()], run_gold),
+    "validate":  (["gold"], [SILVER_FILES, GOLD_FILES, "schemas/*.json"], ["reports/dq_report.md"],
+                  lambda c: [], run_validate),
+    "demo":      (["gold"], [], None, lambda c: [], run_demo),
+    "dashboard": (["validate"], ["data/gold/_dq_metrics/totals.parquet", "data/gold/fact_returns.csv",
+                                 "data/silver/_sketches/*.npz"],
+                  ["reports/dq_dashboard.txt"], lambda c: [], run_dashboard),
+    "trends":    (["validate"], ["data/gold/_dq_metrics/totals.parquet"], ["reports/quarantine_trends.csv"],
+                  lambda c: [_today(c)], run_trends),
+    "returns":   (["gold"], [QUAR_INDEX], ["data/gold/fact_returns.csv"], lambda c: [], run_returns),
+    "export":    (["gold"], [GOLD_FILES], ["data/gold/fact_sales.csv"], lambda c: [], run_export),
+    "digests":   (["gold"], [SILVER_FILES, QUAR_FILES, GOLD_FILES], ["data/_digests.json"], lambda c: [], run_digests),
+}
+TARGETS = {"everything": ["ingest", "silver", "gold", "digests", "validate", "demo"]}
+
+def plan(targets) -> list[str]:
+    """Stages needed for targets, dependencies first"""
+    order: list[str] = []
+    def visit(s):
+        if s in order:
+            return
+        for d in STAGES[s][0]:
+            visit(d)
+        order.append(s)
+    for t in targets:
+        for s in TARGETS.get(t, [t]):
+            visit(s)
+    return order
+
+def _files(globs) -> list[str]:
+    import glob
+    return sorted(p for g in globs for p in glob.glob(g))
+
+def fingerprint(stage: str, ctx) -> str:
+    _, inputs, _, params, _ = STAGES[stage]
+    h = hashlib.sha256(json.dumps([stage, params(ctx)], default=str).encode())
+    for p in _files(inputs):
+        st = os.stat(p)
+        h.update(f"{p}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+def _load_state() -> dict:
+    return json.loads(STATE_PATH.read_text(encoding="utf-8")) if STATE_PATH.exists() else {}
+
+def _save_state(state: dict) -> None:
+    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_PATH.with_name(STATE_PATH.name + ".tmp")
+    tmp.write_text(json.dumps(state, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, STATE_PATH)
+
+@perf.timed("pipeline", run=True)
+def run(targets, ctx, force=False) -> None:
+    state = _load_state()
+    for stage in plan(targets):
+        outputs = STAGES[stage][2]
+        fp = fingerprint(stage, ctx)
+        prev = state.get(stage, {})
+        if (not force and outputs is not None and prev.get("fingerprint") == fp
+                and all(_files([o]) for o in prev.get("outputs", outputs))):
+            print(f"[pipeline] {stage}: inputs unchanged, skipped")
+            continue
+        print(f"[pipeline] {stage} ...")
+        t0 = time.perf_counter()
+        with perf.span(stage):
+            STAGES[stage][4](ctx)
+        print(f"[pipeline] {stage} done in {time.perf_counter() - t0:.2f}s")
+        if outputs is not None:
+            state[stage] = {"fingerprint": fp, "outputs": [o for o in outputs if _files([o])]}
+            _save_state(state)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("targets", nargs="+", choices=[*STAGES, *TARGETS])
+    ap.add_argument("--gen-days", type=int, default=7)
+    ap.add_argument("--gen-seed", type=int, default=42)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--engine", choices=["pandas", "duckdb"], default="pandas")
+    ap.add_argument("--shards", type=int, default=1, help="gold upsert shards (pandas engine)")
+    ap.add_argument("--force", action="store_true", help="run every stage, ignoring the cache and the silver / gold manifests")
+    a = ap.parse_args(argv)
+    run(a.targets, Context(a), a.force)
+
+if __name__ == "__main__":
+    main()
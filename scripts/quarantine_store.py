@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Quarantine store: every quarantined row once, with its reasons as an integer
+bitmask, plus an index of row counts by day and reason.
+  data/silver/quarantine/_store/day=YYYYMMDD.parquet : quarantine columns + _reason_code (uint8)
+  data/silver/quarantine/_store/_index.json          : {"reasons": [...], "days": {day: {"rows", "reasons"}}}
+to_silver writes a day's segment next to sales_bad_<day> (the readable copy)
+and the parent process updates the index once per run. Counts come from the
+index alone; row queries open only the segments of days that have a matching
+reason and filter on the bitmask instead of matching the reason text.
+
+  python scripts/quarantine_store.py rebuild   # from sales_bad_* files
+  python scripts/quarantine_store.py show
+  python scripts/quarantine_store.py count     # rows, from the index
+"""
+from __future__ import annotations
+import json, os, sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import storage
+
+STORE = Path("data/silver/quarantine/_store")
+INDEX_PATH = STORE / "_index.json"
+QUAR_GLOB = "data/silver/quarantine/sales_bad_*"
+
+# 隔離原因：bit i ↔ REASONS[i]（字串只展開到隔離列）
+REASONS = ["bad_date", "missing_geo", "neg_or_zero_qty", "neg_or_zero_price", "dup_order_id", "outlier"]
+REASON_TEXT = np.array(
+    [",".join(r for i, r in enumerate(REASONS) if code >> i & 1) for code in range(1 << len(REASONS))],
+    dtype=object,
+)
+REASON_CODE = {t: code for code, t in enumerate(REASON_TEXT)}
+
+def segment_stem(day: str) -> Path:
+    return STORE / f"day={day}"
+
+def reason_mask(reasons) -> int:
+    return sum(1 << REASONS.index(r) for r in reasons)
+
+class SegmentWriter:
+    """One day's segment, written chunk by chunk (storage.FrameWriter, always Parquet)"""
+
+    def __init__(self, day: str):
+        self.day = day
+        self.w = storage.FrameWriter(segment_stem(day), fmt="parquet", typed=False)
+        self.reasons = np.zeros(len(REASONS), dtype=np.int64)
+
+    def write(self, bad: pd.DataFrame) -> None:
+        code = bad["_bad_reason"].map(REASON_CODE).fillna(0).to_numpy(dtype=np.uint8)
+        bits = (code[:, None] >> np.arange(len(REASONS), dtype=np.uint8)) & 1
+        self.reasons += bits.sum(axis=0, dtype=np.int64)
+        self.w.write(bad.assign(_reason_code=code))
+
+    def close(self) -> dict:
+        """Index entry for the day; a day without rows drops its old segment"""
+        if self.w.close() is None:
+            storage.path_for(segment_stem(self.day), "parquet").unlink(missing_ok=True)
+        return {"rows": self.w.rows, "reasons": {r: int(n) for r, n in zip(REASONS, self.reasons) if n}}
+
+    def abort(self) -> None:
+        self.w.abort()
+
+def write_day(day: str, bad: pd.DataFrame) -> dict:
+    w = SegmentWriter(day)
+    if not bad.empty:
+        w.write(bad)
+    return w.close()
+
+def _save_index(idx: dict) -> None:
+    STORE.mkdir(parents=True, exist_ok=True)
+    tmp = INDEX_PATH.with_name(INDEX_PATH.name + ".tmp")
+    tmp.write_text(json.dumps(idx, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, INDEX_PATH)
+
+def commit(entries: dict) -> None:
+    """Record {day: entry} from SegmentWriter.close() (days with no rows drop out)"""
+    if not INDEX_PATH.exists():
+        rebuild()   # 首次：由既有隔離檔（含本次）建立
+        return
+    idx = load_index()
+    for day, e in entries.items():
+        if e["rows"]: idx["days"][str(day)] = e
+        else: idx["days"].pop(str(day), None)
+    _save_index(idx)
+
+def rebuild() -> dict:
+    """Segments + index from the sales_bad_* files"""
+    idx = {"reasons": REASONS, "days": {}}
+    for p in storage.glob_frames(QUAR_GLOB):
+        day = Path(p).stem.rsplit("_", 1)[1]
+        bad = pd.read_csv(p, dtype=str) if p.endswith(storage.EXT["csv"]) else storage.read_frame(p)
+        e = write_day(day, bad)
+        if e["rows"]: idx["days"][day] = e
+    _save_index(idx)
+    return idx
+
+def load_index() -> dict:
+    if not INDEX_PATH.exists():
+        return rebuild()
+    idx = json.loads(INDEX_PATH.read_text(encoding="utf-8"))
+    old = idx.get("reasons") or []
+    if old != REASONS and old == REASONS[:len(old)]:   # 只是在尾端新增原因 → 既有 bit 不變
+        idx["reasons"] = REASONS
+    if idx.get("reasons") != REASONS:
+        raise SystemExit(f"{INDEX_PATH} was written with reasons {idx.get('reasons')}; run `rebuild`")
+    return idx
+
+def rows_per_day(reason: str | None = None) -> dict[str, int]:
+    """{day: rows}, or rows having reason (index only, no data read)"""
+    days = load_index()["days"]
+    out = {d: e["reasons"].get(reason, 0) if reason else e["rows"] for d, e in sorted(days.items())}
+    return {d: n for d, n in out.items() if n}
+
+def count(reason: str | None = None) -> int:
+    return sum(rows_per_day(reason).values())
+
+def read(reasons=None, days=None, columns=None) -> pd.DataFrame:
+    """Rows with any of reasons (all rows if None) for days (all if None), in day order"""
+    idx = load_index()["days"]
+    want = sorted(d for d, e in idx.items()
+                  if (days is None or d in days) and (reasons is None or any(r in e["reasons"] for r in reasons)))
+    cols = None if columns is None else list(dict.fromkeys([*columns, "_reason_code"]))
+    frames = [storage.read_frame(storage.path_for(segment_stem(d), "parquet"), columns=cols) for d in want]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(frames, ignore_index=True)
+    if reasons is not None:
+        df = df.loc[(df["_reason_code"].to_numpy() & reason_mask(reasons)) != 0].reset_index(drop=True)
+    return df.drop(columns=[] if columns and "_reason_code" in columns else ["_reason_code"])
+
+def returns() -> pd.DataFrame:
+    """Potential returns (neg_or_zero_qty), see data/silver/quarantine/README.md"""
+    return read(["neg_or_zero_qty"])
+
+def main():
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "rebuild":
+        idx = rebuild()
+        print(f"[quarantine_store] Rebuilt {sum(e['rows'] for e in idx['days'].values()):,} rows "
+              f"over {len(idx['days'])} days → {STORE}/")
+    elif cmd == "show":
+        days = load_index()["days"]
+        df = pd.DataFrame({d: {"rows": e["rows"], **e["reasons"]} for d, e in sorted(days.items())}).T
+        print(df.reindex(columns=["rows", *REASONS]).fillna(0).astype(int).rename_axis("day").to_string())
+    elif cmd == "count":
+        print(count())
+    else:
+        print("Usage: python scripts/quarantine_store.py rebuild|show|count"); sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Sales rollup at day × geo × product grain, kept up to date by to_gold.
+  data/gold/_rollups/sales_daily.parquet : order_date | geo_id | product_id | orders | revenue_jpy
+to_gold rewrites whole gold partitions, so the rollup rows of each touched day
+are recomputed from the rewritten partition and swapped in: overwritten
+natural keys drop their old revenue, nothing is double counted.
+run_sql registers it as the view sales_daily (sql/demo_queries.sql and
+sql/dq_dashboard.sql read it instead of scanning fact_sales).
+
+  python scripts/rollups.py rebuild   # from the gold store
+  python scripts/rollups.py check     # exit 1 if the rollup disagrees with gold
+"""
+from __future__ import annotations
+import os, sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import gold_store, typed_frames
+
+STORE = Path("data/gold/_rollups")
+DAILY_PATH = STORE / "sales_daily.parquet"
+DIMS = ["order_date", "geo_id", "product_id"]
+COLS = [*DIMS, "orders", "revenue_jpy"]
+
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame({c: pd.Series(dtype="str") for c in DIMS}
+                        | {"orders": np.empty(0, np.int64), "revenue_jpy": np.empty(0, float)})[COLS]
+
+def day_rollup(df: pd.DataFrame, part_col: str = "order_date") -> pd.DataFrame:
+    """Rollup rows for gold rows (order_date = partition value, NA for the null partition)"""
+    if df.empty:
+        return _empty()
+    rev = pd.Series(df["revenue_jpy"].astype(float).to_numpy())
+    keys = [df[c].reset_index(drop=True) for c in (part_col, "geo_id", "product_id")]
+    # 保持型別（類別、int 日期）彙總，只把結果列的鍵轉成字串
+    g = rev.groupby(keys, sort=True, dropna=False, observed=True).agg(["size", "sum"])
+    g = pd.DataFrame({d: g.index.get_level_values(i).astype("string") for i, d in enumerate(DIMS)}
+                     | {"orders": g["size"].to_numpy(), "revenue_jpy": g["sum"].to_numpy()})
+    return g.astype({"orders": "int64"})[COLS]
+
+def _save(df: pd.DataFrame) -> pd.DataFrame:
+    df = (df.astype({c: "str" for c in DIMS})
+          .sort_values(DIMS, kind="stable", na_position="last").reset_index(drop=True))
+    DAILY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = DAILY_PATH.with_name(DAILY_PATH.name + ".tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, DAILY_PATH)
+    return df
+
+def update(rows: pd.DataFrame, days) -> None:
+    """Replace the rollup rows of the given partition keys (days)"""
+    if not DAILY_PATH.exists():
+        rebuild()   # 首次：由 gold（含本次）建立
+        return
+    old = pd.read_parquet(DAILY_PATH)
+    drop = gold_store.partition_keys(old["order_date"]).isin([str(d) for d in days])
+    _save(pd.concat([old.loc[~drop], rows], ignore_index=True))
+
+def _from_gold() -> pd.DataFrame:
+    out = [_empty()]
+    for d in gold_store.list_partitions():
+        part_col = d.name.split("=", 1)[0]
+        df = typed_frames.read(gold_store.part_file(d), "gold", columns=[part_col, "geo_id", "product_id", "revenue_jpy"])
+        out.append(day_rollup(df, part_col))
+    return pd.concat(out, ignore_index=True)
+
+def rebuild() -> pd.DataFrame:
+    return _save(_from_gold())
+
+def check() -> list[str]:
+    """Differences between the stored rollup and gold (empty list = consistent)"""
+    if not DAILY_PATH.exists():
+        return [f"{DAILY_PATH} not found"]
+    stored = pd.read_parquet(DAILY_PATH).set_index(DIMS)
+    fresh = _from_gold().astype({c: "str" for c in DIMS}).set_index(DIMS)
+    both = stored.join(fresh, how="outer", lsuffix="_stored", rsuffix="_gold")
+    bad = both[(both["orders_stored"] != both["orders_gold"])
+               | ~np.isclose(both["revenue_jpy_stored"], both["revenue_jpy_gold"])]
+    return [f"{'/'.join(map(str, k))}: stored {r.orders_stored}/{r.revenue_jpy_stored}, gold {r.orders_gold}/{r.revenue_jpy_gold}"
+            for k, r in bad.iterrows()]
+
+def main():
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "rebuild":
+        df = rebuild()
+        print(f"[rollups] Rebuilt {len(df):,} day × geo × product rows → {DAILY_PATH}")
+    elif cmd == "check":
+        errs = check()
+        for e in errs[:20]:
+            print(f"  ❌ {e}")
+        print("  ✅ rollup consistent" if not errs else f"  {len(errs)} problem(s)")
+        sys.exit(1 if errs else 0)
+    else:
+        print("Usage: python scripts/rollups.py rebuild|check"); sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,183 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import sys, duckdb, pathlib
-def main():
-    if len(sys.argv)<2:
+"""
+Run a .sql script on a fresh in-memory DuckDB connection, with the pipeline's
+catalog (data/_catalog.duckdb) attached for its views and result cache only:
+tables the script creates are gone when it ends. Views over gold / silver /
+quarantine / rollup files are recreated only when their file list, sizes or
+mtimes change. A SELECT is cached keyed by statement text + fingerprints of
+the views it reads, and only when it reads nothing but those views (no other
+tables, files, clock or random functions).
+Dot commands: .print [text] (others are reported and skipped).
+
+  python scripts/run_sql.py sql/dq_dashboard.sql
+  python scripts/run_sql.py sql/demo_queries.sql --no-cache
+"""
+import argparse, hashlib, json, os, re, sys, duckdb, pathlib
+sys.path.insert(0, str(pathlib.Path(__file__).parent))
+import perf, storage
+
+CATALOG_PATH = pathlib.Path("data/_catalog.duckdb")
+CATALOG = "pipeline"   # 附加的 catalog 名稱
+CACHEABLE = re.compile(r"^\s*(select|with|from|values|table|pivot|unpivot)\b", re.I)
+# 每次結果可能不同的函式（current_date 等不加括號時被解析成欄位參照）
+VOLATILE = {"now", "today", "current_date", "current_time", "current_timestamp", "localtime", "localtimestamp",
+            "get_current_time", "get_current_timestamp", "random", "setseed", "uuid", "gen_random_uuid", "nextval", "currval"}
+
+# view → 檔案群（csv / parquet 皆可）
+VIEWS = {
+    "fact_sales": "data/gold/fact_sales/*/part-*",
+    "silver_sales": "data/silver/sales_clean_*",
+    "quarantine": "data/silver/quarantine/sales_bad_*",
+    "sales_daily": "data/gold/_rollups/sales_daily",   # rollups.py（day × geo × product）
+}
+
+def _fingerprint(files) -> str:
+    h = hashlib.sha256()
+    for p in files:
+        st = os.stat(p); h.update(f"{p}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+def split_script(text: str):
+    """[("dot", line) | ("sql", statement, code)]; ; inside quotes / comments does not split, code = comments stripped"""
+    items, buf, code, quote, block = [], [], [], None, False
+    def flush():
+        k = " ".join("".join(code).split())
+        if k: items.append(("sql", "".join(buf).strip(), k))
+        buf.clear(); code.clear()
+    for line in text.splitlines(keepends=True):
+        if quote is None and not block and not "".join(code).strip() and line.lstrip().startswith("."):
+            buf.clear(); items.append(("dot", line.strip())); continue
+        i = 0
+        while i < len(line):
+            c, two = line[i], line[i:i+2]
+            if block:
+                if two == "*/": buf.append(two); i += 2; block = False; continue
+                buf.append(c)
+            elif quote:
+                buf.append(c); code.append(c)
+                if c == quote: quote = None
+            elif two == "--":
+                buf.append(line[i:]); code.append(" "); break
+            elif two == "/*":
+                buf.append(two); code.append(" "); i += 2; block = True; continue
+            elif c == ";":
+                flush()
+            else:
+                if c in "'\"": quote = c
+                buf.append(c); code.append(c)
+            i += 1
+    flush()
+    return items
+
+def _connect(db):
+    """In-memory connection + the catalog attached as CATALOG; no catalog (no cache) when it is locked by another process"""
+    con = duckdb.connect()
+    if db is None: return con, False
+    db = pathlib.Path(db); db.parent.mkdir(parents=True, exist_ok=True)
+    try: con.execute(f"ATTACH '{db}' AS {CATALOG}")
+    except duckdb.IOException as e:
+        print(f"[run_sql] {db} unavailable ({e}); using an in-memory catalog"); return con, False
+    con.execute(f"CREATE SCHEMA IF NOT EXISTS {CATALOG}._cache")
+    con.execute(f"CREATE TABLE IF NOT EXISTS {CATALOG}._catalog(name VARCHAR PRIMARY KEY, fingerprint VARCHAR)")
+    con.execute(f"CREATE TABLE IF NOT EXISTS {CATALOG}._cache_index(key VARCHAR PRIMARY KEY, views VARCHAR[], created_at TIMESTAMP)")
+    return con, True
+
+def _drop_cached(con, view):
+    for (k,) in con.execute(f"SELECT key FROM {CATALOG}._cache_index WHERE list_contains(views, ?)", [view]).fetchall():
+        con.execute(f'DROP TABLE IF EXISTS {CATALOG}._cache."r_{k}"')
+    con.execute(f"DELETE FROM {CATALOG}._cache_index WHERE list_contains(views, ?)", [view])
+
+def register_views(con, persistent=False) -> dict:
+    """(Re)create views whose files changed (in the catalog when persistent, exposed to the script by name); returns {view: fingerprint}"""
+    fps = {}
+    known = dict(con.execute(f"SELECT name, fingerprint FROM {CATALOG}._catalog").fetchall()) if persistent else {}
+    for name, pattern in VIEWS.items():
+        files = storage.glob_frames(pattern); fps[name] = fp = _fingerprint(files)
+        target = f"{CATALOG}.main.{name}" if persistent else name
+        if known.get(name) != fp:
+            srcs = []
+            pq = [p for p in files if p.endswith(storage.EXT["parquet"])]
+            csv = [p for p in files if p.endswith(storage.EXT["csv"])]
+            if pq: srcs.append(f"SELECT * FROM read_parquet({pq!r}, union_by_name=true)")
+            if csv: srcs.append(f"SELECT * FROM read_csv_auto({csv!r}, union_by_name=true)")
+            if srcs: con.execute(f"CREATE OR REPLACE VIEW {target} AS " + " UNION ALL BY NAME ".join(srcs))
+            else: con.execute(f"DROP VIEW IF EXISTS {target}")
+            if persistent:
+                _drop_cached(con, name)
+                con.execute(f"INSERT OR REPLACE INTO {CATALOG}._catalog VALUES (?, ?)", [name, fp])
+        if persistent and files:
+            con.execute(f"CREATE VIEW {name} AS SELECT * FROM {target}")
+    return fps
+
+def views_read(con, s, code):
+    """
+    Registered views the statement reads, or None when it also reads anything
+    else (tables, files, table functions) or calls a VOLATILE function: then
+    it is not cached
+    """
+    if not CACHEABLE.match(code): return None
+    try: tree = json.loads(con.execute("SELECT json_serialize_sql(?)", [s]).fetchone()[0])
+    except duckdb.Error: return None
+    if tree.get("error"): return None
+    names, ctes, todo = set(), set(), [tree]
+    while todo:
+        n = todo.pop()
+        if isinstance(n, list): todo.extend(n); continue
+        if not isinstance(n, dict): continue
+        t = n.get("type")
+        if t == "BASE_TABLE":
+            names.add(".".join(x for x in (n.get("catalog_name"), n.get("schema_name"), n["table_name"]) if x).lower())
+        elif t == "TABLE_FUNCTION":
+            return None
+        elif str(n.get("function_name", "")).lower() in VOLATILE:
+            return None
+        elif t == "COLUMN_REF" and len(n.get("column_names", [])) == 1 and n["column_names"][0].lower() in VOLATILE:
+            return None
+        ctes.update(m["key"].lower() for m in (n.get("cte_map") or {}).get("map", []))
+        todo.extend(n.values())
+    names -= ctes
+    return sorted(names) if names and names <= set(VIEWS) else None
+
+def _cache_key(code, fps, views):
+    return hashlib.sha256(json.dumps([code, {v: fps[v] for v in views}]).encode()).hexdigest()[:32]
+
+def execute(con, s, code, fps, cache):
+    """Result frame of one statement, from / into the result cache when cache is on; (df, hit)"""
+    views = views_read(con, s, code) if cache else None
+    if not views: return con.execute(s).df(), False
+    key = _cache_key(code, fps, views); t = f'{CATALOG}._cache."r_{key}"'
+    if con.execute(f"SELECT count(*) FROM {CATALOG}._cache_index WHERE key = ?", [key]).fetchone()[0]:
+        return con.execute(f"SELECT * FROM {t}").df(), True
+    con.execute(f"CREATE OR REPLACE TABLE {t} AS {s}")
+    con.execute(f"INSERT OR REPLACE INTO {CATALOG}._cache_index VALUES (?, ?, now())", [key, views])
+    return con.execute(f"SELECT * FROM {t}").df(), False
+
+def dot_command(line):
+    cmd, _, arg = line.partition(" ")
+    if cmd == ".print": print(arg)
+    else: print(f"[WARN] unsupported dot command skipped: {cmd}")
+
+@perf.timed("run_sql", run=True)
+def main(argv=None):
+    ap=argparse.ArgumentParser(usage="python scripts/run_sql.py sql/demo_queries.sql")
+    ap.add_argument("sql", nargs="?")
+    ap.add_argument("--db", default=str(CATALOG_PATH), help="catalog file (default: %(default)s)")
+    ap.add_argument("--memory", action="store_true", help="fresh in-memory catalog, no result cache")
+    ap.add_argument("--no-cache", action="store_true", help="always run statements (views are still reused)")
+    a=ap.parse_args(sys.argv[1:] if argv is None else argv)
+    if not a.sql:
         print("Usage: python scripts/run_sql.py sql/demo_queries.sql"); return
-    p=pathlib.Path(sys.argv[1]); con=duckdb.connect()
-    with open(p,"r",encoding="utf-8") as f: sql=f.read()
-    for i,s in enumerate([x.strip() for x in sql.split(";") if x.strip()],1):
-        print(f"\n-- Statement {i} --")
-        try: print(con.execute(s).df().head(50).to_string(index=False))
-        except Exception as e: print(f"[ERROR] {e}")
+    con,persistent=_connect(None if a.memory else a.db)
+    with perf.span("register_views"): fps=register_views(con, persistent)
+    with open(a.sql,"r",encoding="utf-8") as f: items=split_script(f.read())
+    i=hits=0
+    for item in items:
+        if item[0]=="dot": dot_command(item[1]); continue
+        i+=1; print(f"\n-- Statement {i} --")
+        with perf.span(f"statement_{i}") as sp:
+            try: df,hit=execute(con,item[1],item[2],fps,persistent and not a.no_cache); hits+=hit; sp.rows_out=len(df); print(df.head(50).to_string(index=False))
+            except Exception as e: print(f"[ERROR] {e}")
+    if hits: print(f"\n[run_sql] {hits}/{i} statements served from the result cache")
     con.close()
 if __name__=="__main__": main()
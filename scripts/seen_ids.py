@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Seen order_id store: which days already delivered an order_id, for the
+cross-day duplicate check in to_silver.
+  data/silver/_seen_ids/_meta.json        : {"capacity", "bits", "hashes", "next_batch",
+                                             "days": {day: {"batch", "rows"}}, "runs": [{"name", "rows"}]}
+  data/silver/_seen_ids/bloom.npy         : Bloom filter over every recorded id (uint8 bit array)
+  data/silver/_seen_ids/run-NNNNNN.h.npy  : sorted uint64 order_id hashes (the exact backing set)
+  data/silver/_seen_ids/run-NNNNNN.b.npy  : uint32 batch of each hash
+Every recorded day is one batch; re-recording a day gives it a new batch and
+the old entries are dead (dropped at the next compaction). A lookup asks the
+Bloom filter first and binary-searches the memory-mapped runs only for its
+hits, so a day costs O(new ids · log history) and never reads old silver.
+Each day adds one run; compact() merges the newest runs while the one before
+is less than GROWTH times larger (all of them once half the entries are dead). Ids are compared as 64-bit hashes
+(collision odds ~n²/2⁶⁵, like SeenKeys in to_silver).
+
+  python scripts/seen_ids.py show
+  python scripts/seen_ids.py rebuild   # from the silver files (first file per id wins)
+"""
+from __future__ import annotations
+import json, os, shutil, sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+STORE = Path("data/silver/_seen_ids")
+META_PATH = STORE / "_meta.json"
+BLOOM_PATH = STORE / "bloom.npy"
+SILVER_GLOB = "data/silver/sales_clean_*"
+BITS_PER_KEY = 10      # k=7 時偽陽性 ~1%
+HASHES = 7
+MIN_CAPACITY = 1 << 16
+GROWTH = 4
+
+def id_hashes(sr: pd.Series) -> np.ndarray:
+    """uint64 hash per order_id (read as str, like to_silver)"""
+    return pd.util.hash_pandas_object(sr.astype("string"), index=False).to_numpy(dtype=np.uint64)
+
+def _empty_meta() -> dict:
+    return {"capacity": MIN_CAPACITY, "bits": MIN_CAPACITY * BITS_PER_KEY, "hashes": HASHES,
+            "next_batch": 1, "days": {}, "runs": []}
+
+def _positions(h: np.ndarray, bits: int, k: int) -> np.ndarray:
+    """(n, k) bit positions by double hashing the two 32-bit halves"""
+    h1, h2 = h & np.uint64(0xFFFFFFFF), (h >> np.uint64(32)) | np.uint64(1)
+    return (h1[:, None] + np.arange(k, dtype=np.uint64) * h2[:, None]) % np.uint64(bits)
+
+def _save_npy(arr: np.ndarray, path: Path) -> None:
+    tmp = path.with_name(path.name + ".tmp.npy")
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+class SeenIds:
+    def __init__(self, meta: dict):
+        self.meta = meta
+        self._runs: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._bloom = None
+
+    @classmethod
+    def open(cls) -> "SeenIds":
+        return cls(json.loads(META_PATH.read_text(encoding="utf-8")) if META_PATH.exists() else _empty_meta())
+
+    def _run(self, name: str):
+        if name not in self._runs:
+            self._runs[name] = (np.load(STORE / f"{name}.h.npy", mmap_mode="r"),
+                                np.load(STORE / f"{name}.b.npy", mmap_mode="r"))
+        return self._runs[name]
+
+    def bloom(self, writable: bool = False) -> np.ndarray:
+        if self._bloom is None or (writable and not self._bloom.flags.writeable):
+            self._bloom = (np.load(BLOOM_PATH, mmap_mode="r+" if writable else "r") if BLOOM_PATH.exists()
+                           else np.zeros(0, dtype=np.uint8))
+        return self._bloom
+
+    def __len__(self) -> int:
+        return sum(d["rows"] for d in self.meta["days"].values())
+
+    def maybe(self, h: np.ndarray) -> np.ndarray:
+        """Bloom filter test: False = certainly never recorded"""
+        bits = self.bloom()
+        if not len(bits) or not len(h):
+            return np.zeros(len(h), dtype=bool)
+        pos = _positions(np.asarray(h, dtype=np.uint64), self.meta["bits"], self.meta["hashes"])
+        return ((bits[(pos >> np.uint64(3)).astype(np.intp)] >> (pos & np.uint64(7)).astype(np.uint8)) & 1).all(axis=1)
+
+    def elsewhere(self, h: np.ndarray, day: str) -> np.ndarray:
+        """Mask of hashes recorded by a live batch of a day other than day"""
+        h = np.asarray(h, dtype=np.uint64)
+        out = np.zeros(len(h), dtype=bool)
+        cand = np.flatnonzero(self.maybe(h))
+        if not len(cand):
+            return out
+        live = np.array(sorted(d["batch"] for k, d in self.meta["days"].items() if k != str(day)), dtype=np.uint32)
+        q = h[cand]
+        for r in self.meta["runs"]:
+            rh, rb = self._run(r["name"])
+            lo, hi = np.searchsorted(rh, q, "left"), np.searchsorted(rh, q, "right")
+            one = np.flatnonzero(hi - lo == 1)   # 只對 Bloom 命中者以實際資料確認（通常 1 筆）
+            out[cand[one]] |= np.isin(rb[lo[one]], live)
+            for i in np.flatnonzero(hi - lo > 1):   # 同一 id 出現在多個 batch（重新記錄等）
+                out[cand[i]] |= bool(np.isin(rb[lo[i]:hi[i]], live).any())
+        return out
+
+    def add(self, day: str, h: np.ndarray) -> None:
+        """Record day's ids (replacing what the day recorded before)"""
+        h = np.sort(np.unique(np.asarray(h, dtype=np.uint64)))
+        m = self.meta
+        batch = m["next_batch"]; m["next_batch"] += 1
+        m["days"][str(day)] = {"batch": batch, "rows": len(h)}
+        STORE.mkdir(parents=True, exist_ok=True)
+        if len(h):   # 不建立空的 run（0 位元組無法 mmap）
+            name = f"run-{batch:06d}"
+            _save_npy(h, STORE / f"{name}.h.npy"); _save_npy(np.full(len(h), batch, dtype=np.uint32), STORE / f"{name}.b.npy")
+            m["runs"].append({"name": name, "rows": len(h)})
+        if len(self) > m["capacity"] or not BLOOM_PATH.exists():
+            self._rebuild_bloom()
+        else:
+            self._set_bits(self.bloom(writable=True), h)   # 只設定位元 → 中途中斷也只會增加偽陽性
+            self._bloom.flush()
+        self._save_meta()
+
+    def _set_bits(self, bits: np.ndarray, h: np.ndarray) -> None:
+        pos = _positions(h, self.meta["bits"], self.meta["hashes"]).ravel()
+        np.bitwise_or.at(bits, (pos >> np.uint64(3)).astype(np.intp), np.uint8(1) << (pos & np.uint64(7)).astype(np.uint8))
+
+    def _rebuild_bloom(self) -> None:
+        m = self.meta
+        while m["capacity"] < 2 * len(self):
+            m["capacity"] *= 2
+        m["bits"] = m["capacity"] * BITS_PER_KEY
+        bits = np.zeros((m["bits"] + 7) // 8, dtype=np.uint8)
+        live = [d["batch"] for d in m["days"].values()]
+        for r in m["runs"]:
+            rh, rb = self._run(r["name"])
+            self._set_bits(bits, np.asarray(rh)[np.isin(rb, live)])
+        _save_npy(bits, BLOOM_PATH)
+        self._bloom = None
+
+    def compact(self) -> None:
+        """
+        Merge the newest runs (dropping dead entries) while the previous one is
+        < GROWTH × larger; everything when more than half the entries are dead
+        """
+        runs = self.meta["runs"]
+        live = np.array([d["batch"] for d in self.meta["days"].values()], dtype=np.uint32)
+        full = sum(r["rows"] for r in runs) > 2 * len(self)
+        dead = []
+        while len(runs) > 1 and (full or runs[-2]["rows"] < GROWTH * runs[-1]["rows"]):
+            a, b = runs[-2], runs.pop()
+            (ah, ab), (bh, bb) = self._run(a["name"]), self._run(b["name"])
+            h, bt = np.concatenate([ah, bh]), np.concatenate([ab, bb])
+            keep = np.isin(bt, live)
+            o = np.argsort(h[keep], kind="stable")
+            h, bt = h[keep][o], bt[keep][o]
+            self._runs.pop(a["name"], None); self._runs.pop(b["name"], None)
+            dead.append(b["name"])
+            if len(h):
+                _save_npy(h, STORE / f"{a['name']}.h.npy"); _save_npy(bt, STORE / f"{a['name']}.b.npy")
+                a["rows"] = len(h)
+            else:
+                runs.pop(); dead.append(a["name"])
+        if dead:
+            self._save_meta()   # 先寫 meta → 不留下指向已刪檔案的狀態
+            for name in dead:
+                for ext in ("h", "b"):
+                    (STORE / f"{name}.{ext}.npy").unlink(missing_ok=True)
+
+    def _save_meta(self) -> None:
+        tmp = META_PATH.with_name(META_PATH.name + ".tmp")
+        tmp.write_text(json.dumps(self.meta, indent=1), encoding="utf-8")
+        os.replace(tmp, META_PATH)
+
+def reset() -> None:
+    shutil.rmtree(STORE, ignore_errors=True)
+
+def rebuild() -> SeenIds:
+    """Store from the silver files in day order (silver already holds only each id's first delivery)"""
+    import storage
+    reset()
+    s = SeenIds.open()
+    for p in storage.glob_frames(SILVER_GLOB):
+        ids = (pd.read_csv(p, dtype=str, usecols=["order_id"]) if p.endswith(storage.EXT["csv"])
+               else storage.read_frame(p, columns=["order_id"]))["order_id"]
+        s.add(Path(p).stem.rsplit("_", 1)[1], id_hashes(ids))
+        s.compact()
+    return s
+
+def main():
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "rebuild":
+        s = rebuild()
+        print(f"[seen_ids] Recorded {len(s):,} order_ids over {len(s.meta['days'])} days → {STORE}/")
+    elif cmd == "show":
+        m = SeenIds.open().meta
+        print(f"days={len(m['days'])} ids={sum(d['rows'] for d in m['days'].values()):,} "
+              f"runs={[r['rows'] for r in m['runs']]} bloom={m['bits'] // 8:,} bytes (capacity {m['capacity']:,})")
+    else:
+        print("Usage: python scripts/seen_ids.py rebuild|show"); sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Mergeable value sketches for the silver outlier / drift checks: per day, one
+set of statistics for all rows ("all", ""), per product and per geo.
+  data/silver/_sketches/day=YYYYMMDD.npz : dim, key (K,) | bins (K, 3, NBINS) int64 | moments (K, 3, 3)
+                                           | lo, hi (K, 3) | hll (K, 2**HLL_P) uint8
+over METRICS = quantity, unit_price, revenue_jpy as silver stores them:
+  bins     log-bucket counts (relative accuracy ALPHA, DDSketch style) → quantiles, KS distance
+  moments  n / mean / M2 (merged with Chan's formula) → running mean and variance
+  lo, hi   exact min / max
+  hll      HyperLogLog registers over the order_id hashes → distinct orders
+Sketches of different days merge by adding / maxing arrays, so a day is
+judged against the merge of all earlier days (its baseline) without reading
+their rows. A value is an outlier when it lies outside the log-scale Tukey
+fence q1 / s**FENCE … q3 * s**FENCE (s = max(q3 / q1, MIN_SPREAD)) of its
+product's baseline, or of all rows while the product has fewer than
+MIN_BASELINE earlier values; with no such baseline nothing is flagged.
+
+  python scripts/sketches.py show
+  python scripts/sketches.py drift [--last 7]
+  python scripts/sketches.py rebuild   # from the silver files (flags are not re-evaluated)
+"""
+from __future__ import annotations
+import argparse, os, shutil, sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+STORE = Path("data/silver/_sketches")
+SILVER_GLOB = "data/silver/sales_clean_*"
+METRICS = ["quantity", "unit_price", "revenue_jpy"]
+DIMS = {"product": "product_id", "geo": "geo_id"}
+ALPHA = 0.01
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+MIN_VALUE, MAX_VALUE = 1e-2, 1e10
+OFFSET = int(np.floor(np.log(MIN_VALUE) / np.log(GAMMA)))   # bucket 0 = ≤ MIN_VALUE（0 也在此）
+NBINS = int(np.ceil(np.log(MAX_VALUE) / np.log(GAMMA))) - OFFSET + 1
+HLL_P = 10             # 1024 個暫存器 → 相對誤差 ~3%
+FENCE = 3.0
+MIN_SPREAD = 2.0
+MIN_BASELINE = 200
+KS_C = 1.95            # KS 檢定的臨界係數（α = 0.001）
+
+def day_path(day: str) -> Path:
+    return STORE / f"day={day}.npz"
+
+def bucket(v: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        i = np.ceil(np.log(np.maximum(v, MIN_VALUE)) / np.log(GAMMA)) - OFFSET
+    return np.clip(i, 0, NBINS - 1).astype(np.intp)
+
+def bucket_value(i) -> np.ndarray:
+    return 2 * GAMMA ** (np.asarray(i) + OFFSET) / (GAMMA + 1)
+
+def _clz64(x: np.ndarray) -> np.ndarray:
+    n, x = np.zeros(len(x), dtype=np.uint8), x.copy()
+    for s in (32, 16, 8, 4, 2, 1):
+        m = x < (np.uint64(1) << np.uint64(64 - s))
+        n[m] += s; x[m] <<= np.uint64(s)
+    return n + (x == 0)
+
+def hll_estimate(reg: np.ndarray) -> np.ndarray:
+    """Distinct count per register row (with the small-range correction)"""
+    reg = np.atleast_2d(reg); m = reg.shape[1]
+    est = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(2.0 ** -reg.astype(float), axis=1)
+    zeros = (reg == 0).sum(axis=1)
+    small = (est <= 2.5 * m) & (zeros > 0)
+    est[small] = m * np.log(m / zeros[small])
+    return est
+
+class Sketch:
+    def __init__(self, keys, bins, moments, lo, hi, hll):
+        self.keys = [tuple(k) for k in keys]
+        self.index = {k: i for i, k in enumerate(self.keys)}
+        self.bins, self.moments, self.lo, self.hi, self.hll = bins, moments, lo, hi, hll
+
+    @classmethod
+    def empty(cls) -> "Sketch":
+        return cls([], np.zeros((0, len(METRICS), NBINS), np.int64), np.zeros((0, len(METRICS), 3)),
+                   np.zeros((0, len(METRICS))), np.zeros((0, len(METRICS))), np.zeros((0, 1 << HLL_P), np.uint8))
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, vals: np.ndarray, ids: np.ndarray) -> "Sketch":
+        """Sketch of rows: df for the DIMS labels, vals (n, 3) in METRICS order (NaN = not counted), ids uint64"""
+        groups = [("all", np.zeros(len(df), dtype=np.intp), [""])]
+        for dim, col in DIMS.items():
+            codes, uniq = pd.factorize(df[col].astype("string").fillna("").to_numpy(dtype=object), sort=True)
+            groups.append((dim, codes, list(uniq)))
+        vals = np.asarray(vals, dtype=float)
+        ids = np.asarray(ids, dtype=np.uint64)
+        slot = ids >> np.uint64(64 - HLL_P)
+        rank = np.minimum(_clz64(ids << np.uint64(HLL_P)), 64 - HLL_P) + 1
+        keys, parts = [], []
+        for dim, codes, uniq in groups:
+            k = len(uniq)
+            bins = np.zeros((k, len(METRICS), NBINS), np.int64)
+            mom = np.zeros((k, len(METRICS), 3)); lo = np.full((k, len(METRICS)), np.inf); hi = -lo.copy()
+            for j in range(len(METRICS)):
+                sel = ~np.isnan(vals[:, j]); c, v = codes[sel], vals[sel, j]
+                bins[:, j] = np.bincount(c * NBINS + bucket(v), minlength=k * NBINS).reshape(k, NBINS)
+                n = np.bincount(c, minlength=k).astype(float)
+                mean = np.divide(np.bincount(c, weights=v, minlength=k), n, out=np.zeros(k), where=n > 0)
+                mom[:, j] = np.column_stack([n, mean, np.bincount(c, weights=(v - mean[c]) ** 2, minlength=k)])
+                np.minimum.at(lo[:, j], c, v); np.maximum.at(hi[:, j], c, v)
+            hll = np.zeros((k, 1 << HLL_P), np.uint8)
+            np.maximum.at(hll, (codes, slot.astype(np.intp)), rank)
+            keys += [(dim, str(u)) for u in uniq]
+            parts.append((bins, mom, lo, hi, hll))
+        return cls(keys, *(np.concatenate(a) for a in zip(*parts)))
+
+    def merge(self, other: "Sketch") -> "Sketch":
+        keys = self.keys + [k for k in other.keys if k not in self.index]
+        a = self._aligned(keys); b = other._aligned(keys)
+        na, nb = a.moments[..., 0], b.moments[..., 0]
+        n = na + nb
+        delta = b.moments[..., 1] - a.moments[..., 1]
+        w = np.divide(nb, n, out=np.zeros_like(n), where=n > 0)
+        mom = np.stack([n, a.moments[..., 1] + delta * w,
+                        a.moments[..., 2] + b.moments[..., 2] + delta ** 2 * na * w], axis=-1)
+        return Sketch(keys, a.bins + b.bins, mom, np.minimum(a.lo, b.lo), np.maximum(a.hi, b.hi),
+                      np.maximum(a.hll, b.hll))
+
+    def _aligned(self, keys) -> "Sketch":
+        if keys == self.keys:
+            return self
+        out = Sketch.empty()
+        k = len(keys)
+        out.bins = np.zeros((k, *self.bins.shape[1:]), np.int64); out.moments = np.zeros((k, *self.moments.shape[1:]))
+        out.lo = np.full((k, len(METRICS)), np.inf); out.hi = -out.lo.copy()
+        out.hll = np.zeros((k, 1 << HLL_P), np.uint8)
+        at = [keys.index(key) for key in self.keys]
+        for name in ("bins", "moments", "lo", "hi", "hll"):
+            getattr(out, name)[at] = getattr(self, name)
+        out.keys, out.index = list(keys), {key: i for i, key in enumerate(keys)}
+        return out
+
+    def count(self, i: int, j: int) -> int:
+        return int(self.bins[i, j].sum())
+
+    def quantile(self, i: int, j: int, q: float) -> float:
+        c = np.cumsum(self.bins[i, j])
+        if not c[-1]:
+            return np.nan
+        return float(bucket_value(np.searchsorted(c, q * (c[-1] - 1), side="right")))
+
+    def orders(self) -> np.ndarray:
+        return hll_estimate(self.hll) if len(self.keys) else np.zeros(0)
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")   # 不可符合 day=*.npz，否則平行的 worker 會讀到寫到一半的檔
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, dim=np.array([k[0] for k in self.keys], dtype=str),
+                                key=np.array([k[1] for k in self.keys], dtype=str), bins=self.bins,
+                                moments=self.moments, lo=self.lo, hi=self.hi, hll=self.hll)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "Sketch":
+        with np.load(path) as z:
+            return cls(list(zip(z["dim"].tolist(), z["key"].tolist())), z["bins"], z["moments"],
+                       z["lo"], z["hi"], z["hll"])
+
+# ===== store =====
+
+def days() -> list[str]:
+    return sorted(p.stem.split("=", 1)[1] for p in STORE.glob("day=*.npz"))
+
+def days_before(day: str) -> list[str]:
+    return [d for d in days() if d < str(day)]
+
+def save_day(day: str, sk: Sketch) -> None:
+    sk.save(day_path(day))
+
+def reset() -> None:
+    shutil.rmtree(STORE, ignore_errors=True)
+
+_cache: dict = {}   # 上一個 baseline（依日期順處理時，下一天只需加入一天）
+
+def baseline(day: str) -> tuple[list[str], Sketch | None]:
+    """(days merged, merged sketch of every recorded day before day; None if there is none)"""
+    want = days_before(day)
+    stamp = {d: day_path(d).stat().st_mtime_ns for d in want}
+    have, sk = _cache.get("days", []), _cache.get("sketch")
+    if not (sk is not None and have == want[:len(have)] and all(_cache["stamp"][d] == stamp[d] for d in have)):
+        have, sk = [], None
+    for d in want[len(have):]:
+        part = Sketch.load(day_path(d))
+        sk = part if sk is None else sk.merge(part)
+    _cache.update(days=want, stamp=stamp, sketch=sk)
+    return want, sk
+
+def fences(base: Sketch | None, products) -> np.ndarray:
+    """(len(products), 2, 3) lower / upper fence per product and metric (±inf when there is no baseline)"""
+    out = np.empty((len(products), 2, len(METRICS))); out[:, 0], out[:, 1] = -np.inf, np.inf
+    if base is None:
+        return out
+    cache = {}
+    for p_i, p in enumerate(products):
+        for j in range(len(METRICS)):
+            i = next((i for i in (base.index.get(("product", p)), base.index.get(("all", "")))
+                      if i is not None and base.count(i, j) >= MIN_BASELINE), None)
+            if i is None:
+                continue
+            if (i, j) not in cache:
+                q1, q3 = base.quantile(i, j, 0.25), base.quantile(i, j, 0.75)
+                s = max(q3 / q1, MIN_SPREAD) ** FENCE
+                cache[i, j] = (q1 / s, q3 * s)
+            out[p_i, :, j] = cache[i, j]
+    return out
+
+def judge(products: pd.Series, vals: np.ndarray, base: Sketch | None) -> np.ndarray:
+    """Outlier mask per row (vals (n, 3) in METRICS order, NaN never flagged)"""
+    if base is None or not len(vals):
+        return np.zeros(len(vals), dtype=bool)
+    codes, uniq = pd.factorize(products.astype("string").fillna("").to_numpy(dtype=object))
+    f = fences(base, list(uniq))
+    return ((vals < f[codes, 0]) | (vals > f[codes, 1])).any(axis=1)
+
+def same_decision(day: str, base_days, kept: Sketch, flagged: pd.DataFrame) -> bool:
+    """
+    Would judging day against the current baseline keep / flag the same rows
+    as the baseline of base_days did? (a parallel worker may have run before
+    earlier days of the same run were recorded)
+    """
+    want, base = baseline(day)
+    if want == list(base_days):
+        return True
+    prods = [k for d, k in kept.keys if d == "product"]
+    f = fences(base, prods)
+    at = [kept.index[("product", p)] for p in prods]
+    inside = ((kept.lo[at] >= f[:, 0]) & (kept.hi[at] <= f[:, 1])).all()
+    return bool(inside and judge(flagged["product_id"], flagged[METRICS].to_numpy(dtype=float), base).all())
+
+def ks(a: np.ndarray, b: np.ndarray) -> float:
+    """Kolmogorov–Smirnov distance of two bucket-count vectors (same grid)"""
+    if not a.sum() or not b.sum():
+        return np.nan
+    return float(np.abs(np.cumsum(a) / a.sum() - np.cumsum(b) / b.sum()).max())
+
+def drift(last: int | None = None) -> pd.DataFrame:
+    """
+    Per day × dim × key: rows, distinct orders (HLL), mean revenue, KS distance of
+    each metric to the earlier days' baseline, revenue mean shift in standard
+    errors, and drift = any KS above KS_C·√((n+m)/(n·m))
+    """
+    cols = ["day", "dim", "key", "rows", "orders", "mean_revenue", *[f"ks_{m}" for m in METRICS], "mean_z", "drift"]
+    ds = days()
+    rows, base = [], None
+    for d in ds:
+        sk = Sketch.load(day_path(d))
+        if base is not None and (last is None or d in ds[-last:]):
+            b = base._aligned(base.keys + [k for k in sk.keys if k not in base.index])
+            orders = sk.orders()
+            for i, (dim, key) in enumerate(sk.keys):
+                bi = b.index[(dim, key)]
+                n, m = sk.moments[i, 2, 0], b.moments[bi, 2, 0]
+                dist = [ks(sk.bins[i, j], b.bins[bi, j]) for j in range(len(METRICS))]
+                crit = KS_C * np.sqrt((n + m) / (n * m)) if n and m else np.inf
+                se = np.sqrt(b.moments[bi, 2, 2] / max(m - 1, 1) / n) if n and m > 1 else np.nan
+                z = (sk.moments[i, 2, 1] - b.moments[bi, 2, 1]) / se if se else np.nan
+                rows.append([d, dim, key, int(n), int(round(orders[i])), sk.moments[i, 2, 1], *dist, z,
+                             bool(np.nan_to_num(dist).max() > crit)])
+        base = sk if base is None else base.merge(sk)
+    return pd.DataFrame(rows, columns=cols)
+
+def rebuild() -> int:
+    """Store from the silver files in day order"""
+    import seen_ids, storage
+    reset()
+    n = 0
+    for p in storage.glob_frames(SILVER_GLOB):
+        df = storage.read_frame(p)
+        vals = df[METRICS].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        save_day(Path(p).stem.rsplit("_", 1)[1], Sketch.build(df, vals, seen_ids.id_hashes(df["order_id"])))
+        n += 1
+    return n
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("show", help="rows / distinct orders / quantiles per key over all days")
+    d = sub.add_parser("drift", help="per-day drift against the earlier days")
+    d.add_argument("--last", type=int, default=7, help="days to report (0 = all)")
+    sub.add_parser("rebuild", help="recompute the day sketches from silver")
+    a = ap.parse_args()
+    if a.cmd == "rebuild":
+        print(f"[sketches] Rebuilt {rebuild()} day(s) → {STORE}/")
+    elif a.cmd == "show":
+        ds = days()
+        if not ds:
+            print(f"No sketches under {STORE}/", file=sys.stderr); sys.exit(1)
+        _, sk = baseline("99999999")
+        out = pd.DataFrame(sk.keys, columns=["dim", "key"]).assign(rows=sk.moments[:, 2, 0].astype(int),
+                                                                    orders=sk.orders().round().astype(int))
+        for j, m in enumerate(METRICS):
+            out[f"{m}_p50"] = [sk.quantile(i, j, 0.5) for i in range(len(sk.keys))]
+            out[f"{m}_mean"] = sk.moments[:, j, 1]
+        print(f"{len(ds)} day(s) {ds[0]}..{ds[-1]}")
+        print(out.round(2).to_string(index=False))
+    else:
+        print(drift(a.last or None).round(3).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Layer storage format: csv (default) or parquet, selected by PIPELINE_FORMAT.
+Paths are handled as stems (no extension); readers accept either format so a
+tree can be migrated with --full-refresh.
+
+  python scripts/storage.py count 'data/silver/quarantine/sales_bad_*'
+"""
+from __future__ import annotations
+import glob, os, sys
+from pathlib import Path
+import pandas as pd
+
+FORMATS = ("csv", "parquet")
+EXT = {"csv": ".csv", "parquet": ".parquet"}
+DICT_COLS = ["geo_id", "product_id"]            # 低基數 → dictionary encoding
+INT_DATE_COLS = ["order_date", "processed_at"]  # YYYYMMDD → int32
+COMPRESSION = "zstd"
+
+def current_format() -> str:
+    fmt = os.environ.get("PIPELINE_FORMAT", "csv").lower()
+    if fmt not in FORMATS:
+        raise SystemExit(f"PIPELINE_FORMAT must be one of {FORMATS}, got {fmt!r}")
+    return fmt
+
+def path_for(stem: str | Path, fmt: str | None = None) -> Path:
+    return Path(str(stem) + EXT[fmt or current_format()])
+
+def existing(stem: str | Path) -> Path | None:
+    """File for a stem in the current format, else any other format"""
+    cur = current_format()
+    for fmt in (cur, *[f for f in FORMATS if f != cur]):
+        p = path_for(stem, fmt)
+        if p.exists():
+            return p
+    return None
+
+def glob_frames(pattern: str) -> list[str]:
+    """Files matching a stem glob in any format (sorted)"""
+    return sorted(p for ext in EXT.values() for p in glob.glob(pattern + ext))
+
+def plain(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Undo typed_frames' in-memory narrowing before a write: category → its
+    values, float32 → float64, narrow ints → int64 (YYYYMMDD columns keep
+    int32, which _to_arrow writes anyway). The values are unchanged,
+    so files come out the same as from a plainly read frame.
+    """
+    casts = {}
+    for c, t in df.dtypes.items():
+        if isinstance(t, pd.CategoricalDtype):
+            casts[c] = df[c].astype(t.categories.dtype)
+        elif t == "float32":
+            casts[c] = df[c].astype("float64")
+        elif t in ("int8", "int16", "int32") and c not in INT_DATE_COLS:
+            casts[c] = df[c].astype("int64")
+    return df.assign(**casts) if casts else df
+
+def _to_arrow(df: pd.DataFrame, typed: bool):
+    import pyarrow as pa
+    if typed:
+        casts = {}
+        for c in INT_DATE_COLS:
+            if c not in df.columns:
+                continue
+            s = df[c]
+            if pd.api.types.is_integer_dtype(s) or (
+                pd.api.types.is_string_dtype(s) and s.notna().all() and s.str.fullmatch(r"\d{1,9}").all()
+            ):
+                casts[c] = s.astype("int32")
+        if casts:
+            df = df.assign(**casts)
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+def write_frame(df: pd.DataFrame, stem: str | Path, fmt: str | None = None, typed: bool = True, **csv_kw) -> Path:
+    """
+    Write df to stem+ext and drop the same stem in other formats.
+    typed=False keeps raw string columns as-is (quarantine rows).
+    The file is written to a temp name and renamed, so a crash never leaves a torn one.
+    """
+    fmt = fmt or current_format()
+    out = path_for(stem, fmt)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + ".tmp")
+    df = plain(df)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        table = _to_arrow(df, typed)
+        pq.write_table(table, tmp, compression=COMPRESSION,
+                       use_dictionary=[c for c in DICT_COLS if c in table.column_names])
+    else:
+        df.to_csv(tmp, index=False, **csv_kw)
+    os.replace(tmp, out)
+    for other in FORMATS:
+        if other != fmt:
+            path_for(stem, other).unlink(missing_ok=True)
+    return out
+
+class FrameWriter:
+    """
+    Append frames to one output (CSV header once / one Parquet row group per
+    write). Data goes to a temp file that replaces the target on close(), so
+    readers never see a half-written day. Nothing is created if write() is
+    never called.
+    """
+
+    def __init__(self, stem: str | Path, fmt: str | None = None, typed: bool = True, **csv_kw):
+        self.fmt = fmt or current_format()
+        self.stem, self.typed, self.csv_kw = Path(stem), typed, csv_kw
+        self.path = path_for(stem, self.fmt)
+        self.tmp = self.path.with_name(self.path.name + ".tmp")
+        self._pq = None
+        self.rows = 0
+        self.started = False
+
+    def write(self, df: pd.DataFrame) -> None:
+        if not self.started:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        df = plain(df)
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+            table = _to_arrow(df, self.typed)
+            if self._pq is None:
+                self._pq = pq.ParquetWriter(self.tmp, table.schema, compression=COMPRESSION,
+                                            use_dictionary=[c for c in DICT_COLS if c in table.column_names])
+            self._pq.write_table(table.cast(self._pq.schema))
+        else:
+            df.to_csv(self.tmp, index=False, header=not self.started, mode="a" if self.started else "w", **self.csv_kw)
+        self.started = True
+        self.rows += len(df)
+
+    def close(self) -> Path | None:
+        if self._pq is not None:
+            self._pq.close()
+        if not self.started:
+            return None
+        os.replace(self.tmp, self.path)
+        for other in FORMATS:
+            if other != self.fmt:
+                path_for(self.stem, other).unlink(missing_ok=True)
+        return self.path
+
+    def abort(self) -> None:
+        if self._pq is not None:
+            self._pq.close()
+        self.tmp.unlink(missing_ok=True)
+
+_OPS = {
+    "=": lambda s, v: s == v, "==": lambda s, v: s == v, "!=": lambda s, v: s != v,
+    "<": lambda s, v: s < v, "<=": lambda s, v: s <= v, ">": lambda s, v: s > v, ">=": lambda s, v: s >= v,
+    "in": lambda s, v: s.isin(v), "not in": lambda s, v: ~s.isin(v),
+}
+
+def _apply_filters(df: pd.DataFrame, filters) -> pd.DataFrame:
+    mask = pd.Series(True, index=df.index)
+    for col, op, val in filters:
+        mask &= _OPS[op](df[col], val).fillna(False)
+    return df.loc[mask].reset_index(drop=True)
+
+def read_frame(path: str | Path, columns=None, filters=None, dtype=None) -> pd.DataFrame:
+    """
+    Read one file. columns → projection; filters → [(col, op, value), ...]
+    (AND-ed, pyarrow style). Parquet pushes both into the scan; CSV reads the
+    needed columns and filters in memory. dtype goes to read_csv (Parquet
+    files carry their own types).
+    """
+    path = Path(path)
+    if path.suffix == EXT["parquet"]:
+        import pyarrow.parquet as pq
+        return pq.read_table(path, columns=columns, filters=filters or None).to_pandas()
+    if not filters:
+        return pd.read_csv(path, usecols=columns, dtype=dtype)
+    need = None if columns is None else list(dict.fromkeys([*columns, *(f[0] for f in filters)]))
+    df = _apply_filters(pd.read_csv(path, usecols=need, dtype=dtype), filters)
+    return df if columns is None else df[columns]
+
+def iter_frame(path: str | Path, columns=None, filters=None, dtype=None, chunk_rows: int = 250_000):
+    """
+    read_frame in pieces of ≤ chunk_rows rows, so a caller that narrows each
+    piece never holds the whole file at full width. Parquet with filters is
+    read in one go (the scan prunes row groups).
+    """
+    path = Path(path)
+    if path.suffix == EXT["parquet"] and filters:
+        yield read_frame(path, columns, filters)
+        return
+    need = None if columns is None or not filters else list(dict.fromkeys([*columns, *(f[0] for f in filters)]))
+    if path.suffix == EXT["parquet"]:
+        import pyarrow.parquet as pq
+        pieces = (b.to_pandas() for b in pq.ParquetFile(path).iter_batches(chunk_rows, columns=columns))
+    else:
+        pieces = pd.read_csv(path, usecols=need or columns, dtype=dtype, chunksize=chunk_rows)
+    n = 0
+    for df in pieces:
+        if filters:
+            df = _apply_filters(df, filters)
+            df = df if columns is None else df[columns]
+        n += 1
+        yield df
+    if not n:   # 只有標頭的檔案 → 只有欄位的空 frame
+        yield read_frame(path, columns, filters, dtype)
+
+def read_frames(paths, columns=None, filters=None) -> pd.DataFrame:
+    dfs = [read_frame(p, columns, filters) for p in paths]
+    return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame(columns=columns)
+
+def columns(path: str | Path) -> list[str]:
+    """Column names without reading data"""
+    path = Path(path)
+    if path.suffix == EXT["parquet"]:
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+def count_rows(path: str | Path) -> int:
+    path = Path(path)
+    if path.suffix == EXT["parquet"]:
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    with open(path, "rb") as f:
+        return max(0, sum(1 for _ in f) - 1)
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] != "count":
+        print("Usage: python scripts/storage.py count '<stem glob>' [...]"); sys.exit(1)
+    print(sum(count_rows(p) for pat in sys.argv[2:] for p in glob_frames(pat)))
+
+if __name__ == "__main__":
+    main()
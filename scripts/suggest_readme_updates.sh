@@ -48,8 +48,7 @@ fi
 echo
 
 # Gold/Returns 行數（不含表頭）
-if [[ -f data/gold/fact_sales.csv ]]; then
-  sales_rows=$(awk 'NR>1' data/gold/fact_sales.csv   | wc -l)
+if sales_rows=$(python3 scripts/gold_store.py count 2>/dev/null); then
   echo "Gold tables:"
   echo "  - fact_sales:   $sales_rows rows"
 fi
@@ -1,8 +1,12 @@
-import os, glob
+import os, argparse
+import numpy as np
 import pandas as pd
+import cdc, dq_metrics, gold_store, nk_index, perf, rollups, storage, typed_frames
+from manifest import Manifest
 
 SILVER_DIR = "data/silver"
-GOLD_PATH = "data/gold/fact_sales.csv"
+GOLD_DIR = gold_store.GOLD_DIR
+MANIFEST_PATH = "data/gold/_manifest.json"
 
 # 自然鍵候選（加入實際 schema）
 NATURAL_KEY_CANDIDATES = [
@@ -22,18 +26,23 @@ def pick_natural_key(cols):
             return [lower[c.lower()] for c in cand]
     return None
 
-def read_silver_df():
+def silver_paths():
     candidates = [
         os.path.join(SILVER_DIR, "fact_sales_clean.csv"),
         os.path.join(SILVER_DIR, "fact_sales.csv"),
     ]
     paths = [p for p in candidates if os.path.exists(p)]
     if not paths:
-        paths = [p for p in glob.glob(os.path.join(SILVER_DIR, "*.csv")) if "quarantine" not in p]
+        paths = [
+            p for p in storage.glob_frames(os.path.join(SILVER_DIR, "*"))
+            if "quarantine" not in p and not os.path.basename(p).startswith("_")
+        ]
     if not paths:
-        raise SystemExit("No silver CSV found under data/silver/")
-    dfs = [pd.read_csv(p) for p in paths]
-    return pd.concat(dfs, ignore_index=True)
+        raise SystemExit("No silver files found under data/silver/")
+    return paths
+
+def read_silver_df(paths=None):
+    return typed_frames.read_many(paths or silver_paths(), "silver")
 
 def ensure_revenue(df: pd.DataFrame) -> pd.DataFrame:
     lowers = {c.lower(): c for c in df.columns}
@@ -51,37 +60,148 @@ def ensure_revenue(df: pd.DataFrame) -> pd.DataFrame:
         f"Found columns: {list(df.columns)}"
     )
 
-def make_nk_series(df: pd.DataFrame, key_cols):
-    parts = [df[c].astype("string").fillna("") for c in key_cols]
-    out = parts[0]
-    for p in parts[1:]:
-        out = out.str.cat(p, sep="|")
-    return out
+DATE_SORT_CANDIDATES = ("date", "order_date", "date_id", "updated_at", "processed_at", "ts", "yyyymmdd")
 
-def sort_by_date_if_possible(df: pd.DataFrame) -> pd.DataFrame:
+def _date_col(df: pd.DataFrame):
     lowers = {c.lower(): c for c in df.columns}
     # 完整的日期欄位候選
-    for cand in ("date", "order_date", "date_id", "updated_at", "processed_at", "ts", "yyyymmdd"):
-        if cand in lowers:
-            col = lowers[cand]
-            try:
-                if cand in ("yyyymmdd", "date_id", "updated_at", "processed_at"):
-                    s = pd.to_datetime(df[col].astype("string"), format="%Y%m%d", errors="coerce")
-                elif cand == "ts" and pd.api.types.is_numeric_dtype(df[col]):
-                    unit = "ms" if pd.to_numeric(df[col], errors="coerce").max() > 1e12 else "s"
-                    s = pd.to_datetime(df[col], unit=unit, errors="coerce")
-                else:
-                    s = pd.to_datetime(df[col], errors="coerce")
-                df = df.assign(_sort=s).sort_values("_sort", kind="stable").drop(columns=["_sort"])
-                return df
-            except Exception:
-                return df
-    return df
-
-def main():
-    os.makedirs(os.path.dirname(GOLD_PATH), exist_ok=True)
-
-    new_df = read_silver_df()
+    return next(((cand, lowers[cand]) for cand in DATE_SORT_CANDIDATES if cand in lowers), (None, None))
+
+def _parse_dates(sr: pd.Series, cand: str) -> pd.Series:
+    if cand in ("yyyymmdd", "date_id", "updated_at", "processed_at"):
+        return pd.to_datetime(sr.astype("string"), format="%Y%m%d", errors="coerce")
+    if cand == "ts" and pd.api.types.is_numeric_dtype(sr):
+        unit = "ms" if pd.to_numeric(sr, errors="coerce").max() > 1e12 else "s"
+        return pd.to_datetime(sr, unit=unit, errors="coerce")
+    return pd.to_datetime(sr, errors="coerce")
+
+@perf.timed()
+def sort_by_date_if_possible(df: pd.DataFrame) -> pd.DataFrame:
+    cand, col = _date_col(df)
+    if col is None:
+        return df
+    try:
+        return df.assign(_sort=_parse_dates(df[col], cand)).sort_values("_sort", kind="stable").drop(columns=["_sort"])
+    except Exception:
+        return df
+
+def date_sort_key(df: pd.DataFrame) -> np.ndarray | None:
+    """
+    int64 key per row giving sort_by_date_if_possible's order (NaT last, all
+    equal when there is nothing to sort by). Each distinct value is parsed once.
+    None when the parsed dates are not a plain datetime array (left to
+    sort_by_date_if_possible).
+    """
+    cand, col = _date_col(df)
+    if col is None:
+        return np.zeros(len(df), dtype=np.int64)
+    try:
+        codes, uniq = pd.factorize(df[col], use_na_sentinel=False)
+        s = _parse_dates(pd.Series(uniq, dtype=df[col].dtype), cand)
+    except Exception:
+        return np.zeros(len(df), dtype=np.int64)
+    ints = getattr(s.array, "asi8", None)
+    if ints is None:
+        return None
+    return np.where(s.isna().to_numpy(), np.iinfo(np.int64).max, ints)[codes]
+
+@perf.timed()
+def merge_by_date(df: pd.DataFrame, n_sorted: int) -> pd.DataFrame:
+    """
+    Same order as sort_by_date_if_possible(df) when the first n_sorted rows
+    (old gold) are already in date order: only the appended rows are sorted,
+    then merged in after their equal keys.
+    """
+    key = date_sort_key(df)
+    if key is None:
+        return sort_by_date_if_possible(df)
+    old, new = key[:n_sorted], key[n_sorted:]
+    if (old[1:] < old[:-1]).any():   # 既有資料不是依日期排序（舊資料等）→ 整體排序
+        return df.iloc[np.argsort(key, kind="stable")]
+    o = np.argsort(new, kind="stable")
+    pos = np.searchsorted(old, new[o], side="right") + np.arange(len(new))
+    order = np.empty(len(key), dtype=np.int64)
+    is_new = np.zeros(len(key), dtype=bool); is_new[pos] = True
+    order[pos] = n_sorted + o; order[~is_new] = np.arange(n_sorted)
+    if (order[1:] > order[:-1]).all():   # 只有附加、順序不變（一般的每日批次）→ 不需複製
+        return df
+    return df.iloc[order]
+
+def upsert_partition(old_df, old_h, new_df, new_h):
+    """
+    Partition-local upsert on natural-key hashes: last write per key wins,
+    replaced old rows are dropped, then date order (old rows are already
+    sorted, so the new ones are merged in). Returns (rows, hashes).
+    """
+    keep_new = ~pd.Series(new_h).duplicated(keep="last").to_numpy()
+    new_df, new_h = new_df.loc[keep_new], new_h[keep_new]
+    return merge_partition(old_df, old_h, None if old_df is None else ~np.isin(old_h, new_h), new_df, new_h)
+
+def merge_partition(old_df, old_h, keep_old, new_df, new_h):
+    """
+    The old rows where keep_old (in their order), then the already deduplicated
+    new rows, merged into date order. Returns (rows, hashes).
+    """
+    if old_df is not None:
+        combined = pd.concat([old_df.loc[keep_old], new_df], ignore_index=True)
+        hashes = np.concatenate([old_h[keep_old], new_h])
+        n_old = int(keep_old.sum())
+    else:
+        combined, hashes, n_old = new_df.reset_index(drop=True), new_h, 0
+    combined = merge_by_date(combined.assign(_h=hashes), n_old)
+    return combined.drop(columns=["_h"]), combined["_h"].to_numpy(dtype=np.uint64)
+
+def load_index(nk):
+    part_col = nk[0]
+    if gold_store.migrate_legacy(part_col):
+        nk_index.rebuild(nk).save()
+    idx = nk_index.NKIndex.load()
+    if idx is None:
+        idx = nk_index.rebuild(nk)
+    return idx
+
+def partition_hashes(idx, nk, key, old_df):
+    """Index hashes of an old gold partition, rehashed when the index is out of date for it"""
+    old_h = idx.hashes(key)
+    if old_df is not None and (old_h is None or len(old_h) != len(old_df)):
+        print(f"[to_gold] nk index out of date for {nk[0]}={key}; rehashing partition")
+        old_h = nk_index.nk_hash(old_df, nk)
+    return old_h
+
+def run_duckdb(todo, threads=None):
+    import gold_duckdb
+    cols = list(dict.fromkeys(c for p in todo for c in storage.columns(p)))
+    nk = pick_natural_key(cols)
+    if not nk:
+        raise SystemExit(f"Cannot determine natural key from columns: {cols}")
+    # 日期排序欄位 = 分割欄位時，分割內順序維持輸入順序
+    lowers = {c.lower(): c for c in cols}
+    sort_col = next((lowers[c] for c in DATE_SORT_CANDIDATES if c in lowers), None)
+    if sort_col not in (None, nk[0]):
+        raise SystemExit(f"--engine duckdb needs the sort column to be the partition column {nk[0]!r}; use --engine pandas")
+    print(f"[to_gold] Using natural key: {nk} (engine=duckdb)")
+    with perf.span("load_index"): idx = load_index(nk)
+    cdc.snapshot_if_missing(nk)
+    con = gold_duckdb.connect(threads)
+    with perf.span("duckdb_upsert") as sp:
+        parts, written, updated = gold_duckdb.upsert(todo, nk, idx, con=con); sp.rows_out = written
+    with perf.span("nk_index_save"): idx.save()
+    if parts:
+        with perf.span("dq_metrics"):
+            dq = gold_duckdb.dq_counts(con)
+            dq_metrics.update("gold", dq, dq["day"].unique())
+        with perf.span("rollups"): rollups.update(gold_duckdb.rollup_rows(con), dq["day"].unique())
+        with perf.span("cdc"):
+            seq, d = cdc.begin()
+            ins, upd, touched = gold_duckdb.cdc_copy(con, nk, seq, d)
+            cdc.commit(seq, nk, "duckdb", ins, upd, touched)
+        print(f"[to_gold] CDC run {seq}: {ins:,} inserted, {upd:,} updated → {d}/")
+    perf.annotate(rows_out=written)
+    print(f"[to_gold] Rewrote {parts} partitions ({written:,} rows, {updated:,} keys updated) under {GOLD_DIR}/")
+
+def run_pandas(todo):
+    with perf.span("read_silver") as sp:
+        new_df = read_silver_df(todo); sp.rows_out = len(new_df)
     new_df = ensure_revenue(new_df)
 
     nk = pick_natural_key(list(new_df.columns))
@@ -89,28 +209,93 @@ def main():
         raise SystemExit(f"Cannot determine natural key from columns: {list(new_df.columns)}")
     print(f"[to_gold] Using natural key: {nk}")
 
-    new_df["_nk"] = make_nk_series(new_df, nk)
-
-    if os.path.exists(GOLD_PATH):
-        old_df = pd.read_csv(GOLD_PATH)
-        if "_nk" not in old_df.columns:
-            missing = [c for c in nk if c not in old_df.columns]
-            if missing:
-                raise SystemExit(
-                    f"Existing gold missing natural key columns {missing}; "
-                    f"delete {GOLD_PATH} once or migrate columns."
-                )
-            old_df["_nk"] = make_nk_series(old_df, nk)
-        combined = pd.concat([old_df, new_df], ignore_index=True).drop_duplicates("_nk", keep="last")
-    else:
-        combined = new_df.drop_duplicates("_nk", keep="last")
+    part_col = nk[0]
+    with perf.span("load_index"): idx = load_index(nk)
+    cdc.snapshot_if_missing(nk)
+    with perf.span("nk_hash", rows_in=len(new_df)): new_h = nk_index.nk_hash(new_df, nk)
+
+    # 自然鍵含日期，故 upsert 只涉及輸入中出現的分割
+    def upserts():
+        for key, rows in new_df.groupby(gold_store.partition_keys(new_df[part_col]), sort=True).indices.items():
+            with perf.span("read_partition") as sp:
+                old_df = gold_store.read_partition(part_col, key); sp.rows_out = 0 if old_df is None else len(old_df)
+            old_h = partition_hashes(idx, nk, key, old_df)
+            with perf.span("cdc"):
+                a, b = cdc.partition_delta(key, old_df, old_h, new_df.iloc[rows], new_h[rows])
+            with perf.span("upsert_partition", rows_in=len(rows)) as sp:
+                out, out_h = upsert_partition(old_df, old_h, new_df.iloc[rows], new_h[rows]); sp.rows_out = len(out)
+            yield key, out, out_h, a, b, len(b)
+    commit_partitions(nk, idx, upserts(), len(new_df))
+
+def commit_partitions(nk, idx, results, rows_in: int, engine: str = "pandas") -> None:
+    """
+    Write upserted partitions and what is derived from them (nk index, dq
+    metrics, rollups, one CDC run). results yields (key, rows, hashes, after
+    image, before image, keys updated) in partition order.
+    """
+    part_col = nk[0]
+    written = parts = updated = 0; dq = []; roll = []; afters = []; befores = []
+    for key, out, out_h, a, b, n_upd in results:
+        with perf.span("write_partition", rows_out=len(out)): gold_store.write_partition(part_col, key, out)
+        idx.set_partition(key, out_h)
+        with perf.span("dq_metrics"): dq.append(dq_metrics.gold_counts(out, part_col))
+        with perf.span("rollups"): roll.append(rollups.day_rollup(out, part_col))
+        afters.append(a); befores.append(b)
+        written += len(out); parts += 1; updated += n_upd
+    with perf.span("nk_index_save"): idx.save()
+    if dq:
+        with perf.span("dq_metrics"):
+            dq = pd.concat(dq, ignore_index=True)
+            dq_metrics.update("gold", dq, dq["day"].unique())
+        with perf.span("rollups"): rollups.update(pd.concat(roll, ignore_index=True), dq["day"].unique())
+        with perf.span("cdc"): run = cdc.record(nk, engine, afters, befores)
+        print(f"[to_gold] CDC run {run['seq']}: {run['inserted']:,} inserted, {run['updated']:,} updated "
+              f"→ {cdc.run_dir(run['seq'])}/")
+    perf.annotate(rows_in=rows_in, rows_out=written)
+    print(f"[to_gold] Rewrote {parts} partitions ({written:,} rows, {updated:,} keys updated) under {GOLD_DIR}/")
 
-    if "_nk" in combined.columns:
-        combined = combined.drop(columns=["_nk"])
+@perf.timed("to_gold", run=True)
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--full-refresh", action="store_true", help="ignore the manifest and re-read every silver file")
+    ap.add_argument("--engine", choices=["pandas", "duckdb"], default="pandas",
+                    help="duckdb: set-based upsert over the files (multi-threaded, see gold_duckdb.py)")
+    ap.add_argument("--threads", type=int, default=None, help="duckdb threads (default: all cores)")
+    ap.add_argument("--files", nargs="+", metavar="SILVER",
+                    help="upsert exactly these silver files, changed or not (backfill.py)")
+    ap.add_argument("--shards", type=int, default=1,
+                    help="pandas: hash-partition the upsert on the natural key into N shards (see gold_shards.py)")
+    ap.add_argument("--shard-workers", type=int, default=None,
+                    help="processes for the shards (default: min(N, cores); 0 = wait for gold_shards.py work runs)")
+    a = ap.parse_args(argv)
+    if a.shards > 1 and a.engine != "pandas":
+        ap.error("--shards needs --engine pandas")
+    GOLD_DIR.mkdir(parents=True, exist_ok=True)
+
+    paths = silver_paths()
+    man = Manifest(MANIFEST_PATH)
+    if a.files:
+        todo = [str(p) for p in a.files]
+        if missing := [p for p in todo if not os.path.exists(p)]:
+            raise SystemExit(f"Silver files not found: {', '.join(missing)}")
+    else:
+        todo = paths if a.full_refresh else [p for p in paths if man.changed(p)]
+    if not todo:
+        print(f"[to_gold] {len(paths)} silver files unchanged; gold is up to date")
+        return
+    print(f"[to_gold] Reading {len(todo)}/{len(paths)} silver files")
+    if a.engine == "duckdb":
+        run_duckdb(todo, a.threads)
+    elif a.shards > 1:
+        import gold_shards
+        gold_shards.run(todo, a.shards, a.shard_workers)
+    else:
+        run_pandas(todo)
 
-    combined = sort_by_date_if_possible(combined)
-    combined.to_csv(GOLD_PATH, index=False)
-    print(f"[to_gold] Wrote {len(combined):,} rows to {GOLD_PATH}")
+    with perf.span("manifest"):
+        for p in todo:
+            man.record(p, [GOLD_DIR])
+        man.prune(paths); man.save()
 
 if __name__ == "__main__":
     main()
@@ -1,66 +1,305 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import re
+import os, re, sys, argparse
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from manifest import Manifest, file_sha256
+import dq_metrics, perf, quarantine_store, seen_ids, sketches, storage, typed_frames
+from quarantine_store import REASON_TEXT
 
 RAW = Path("data/raw")
 SILVER = Path("data/silver"); QUAR = SILVER/"quarantine"
 SILVER.mkdir(parents=True, exist_ok=True); QUAR.mkdir(parents=True, exist_ok=True)
 F = re.compile(r"sales_(\d{8})\.csv$")
+MANIFEST = SILVER/"_manifest.json"
+
+def silver_stem(day): return SILVER/f"sales_clean_{day}"
+def quarantine_stem(day): return QUAR/f"sales_bad_{day}"
+def silver_path(day): return storage.path_for(silver_stem(day))
+def quarantine_path(day): return storage.path_for(quarantine_stem(day))
 
 def parse_date8(s): 
     try: datetime.strptime(str(s), "%Y%m%d"); return True
     except: return False
 
-def clean_one(day, df):
-    need = ["order_id","order_date","geo_id","product_id","quantity","unit_price"]
-    for c in need:
-        if c not in df.columns: df[c]=pd.NA
-    df = df.drop_duplicates().copy()
+def _to_float(x):
+    try: return float(x)
+    except: return -1.0
 
+def _is_blank(x):
+    return pd.isna(x) or str(x).strip()==""
+
+def row_reasons(df):
+    """Reference row-by-row rules (spec for reason_codes; used by tests/bench)"""
     reasons=[]
     for _,r in df.iterrows():
         bad=[]
         if not parse_date8(r["order_date"]): bad.append("bad_date")
-        if pd.isna(r["geo_id"]) or str(r["geo_id"]).strip()=="": bad.append("missing_geo")
-        try: q=float(r["quantity"])
-        except: q=-1
-        try: p=float(r["unit_price"])
-        except: p=-1
-        if q<=0: bad.append("neg_or_zero_qty")
-        if p<=0: bad.append("neg_or_zero_price")
+        if _is_blank(r["geo_id"]): bad.append("missing_geo")
+        if _to_float(r["quantity"])<=0: bad.append("neg_or_zero_qty")
+        if _to_float(r["unit_price"])<=0: bad.append("neg_or_zero_price")
         reasons.append(",".join(bad))
-    df["_bad_reason"]=reasons
-    bad_mask=df["_bad_reason"].str.len()>0
-    bad=df.loc[bad_mask].copy(); good=df.loc[~bad_mask].copy()
+    return reasons
+
+def _distinct_mask(sr, rule):
+    """Evaluate a scalar rule once per distinct value and broadcast it back to the column"""
+    codes, uniq = pd.factorize(sr, use_na_sentinel=False)
+    return np.fromiter((rule(u) for u in uniq), dtype=bool, count=len(uniq))[codes]
+
+def _non_positive_mask(sr):
+    """Column version of `_to_float(x) <= 0` (missing passes, unparseable fails)"""
+    v = pd.to_numeric(sr, errors="coerce").astype("float64")
+    retry = v.isna() & sr.notna()
+    if retry.any():
+        v[retry] = sr[retry].map(_to_float).astype("float64")
+    return (v <= 0).to_numpy()
+
+def reason_codes(df):
+    """Evaluate all quarantine rules as column masks; returns uint8 bitmask per row"""
+    masks = [
+        ~_distinct_mask(df["order_date"], parse_date8),
+        _distinct_mask(df["geo_id"], _is_blank),
+        _non_positive_mask(df["quantity"]),
+        _non_positive_mask(df["unit_price"]),
+    ]
+    code = np.zeros(len(df), dtype=np.uint8)
+    for bit, m in enumerate(masks):
+        code |= m.astype(np.uint8) << bit
+    return code
 
+NEED = ["order_id","order_date","geo_id","product_id","quantity","unit_price"]
+COLS = ["order_id","order_date","geo_id","product_id","quantity","unit_price","revenue_jpy","processed_at"]
+CSV_KW = dict(encoding="utf-8", lineterminator="\n")
+STREAM_COPIES = 6   # chunk + dedup/good/bad copies + numeric columns + output buffer
+KEY_BYTES = 32      # 2 seen-key sets × uint64 (+ merge temporaries) per raw row
+
+def _ensure_cols(df):
+    for c in NEED:
+        if c not in df.columns: df[c]=pd.NA
+    return df
+
+def split_bad(day, df):
+    """Rows failing any rule → (good, bad with _bad_reason/source_file)"""
+    code = reason_codes(df)
+    bad_mask = code > 0
+    bad=df.loc[bad_mask].copy(); good=df.loc[~bad_mask].copy()
     if not bad.empty:
+        bad["_bad_reason"]=REASON_TEXT[code[bad_mask]]
         bad["source_file"]=f"sales_{day}.csv"
-        bad.to_csv(QUAR/f"sales_bad_{day}.csv", index=False, encoding="utf-8", lineterminator="\n")
+    return good, bad
 
-    good = good.drop_duplicates(subset=["order_id"], keep="first").copy()
-    good["quantity"]=pd.to_numeric(good["quantity"], errors="coerce").fillna(0).astype(int)
-    good["unit_price"]=pd.to_numeric(good["unit_price"], errors="coerce").fillna(0.0)
-    good["revenue_jpy"]=good["quantity"]*good["unit_price"]
+def amounts(good):
+    """quantity, unit_price, revenue_jpy as silver stores them"""
+    q=pd.to_numeric(good["quantity"], errors="coerce").fillna(0).astype(int)
+    p=pd.to_numeric(good["unit_price"], errors="coerce").fillna(0.0)
+    return q, p, q*p
+
+def finish_good(day, good):
+    good["quantity"], good["unit_price"], good["revenue_jpy"] = amounts(good)
     good["processed_at"]=day
-    cols=["order_id","order_date","geo_id","product_id","quantity","unit_price","revenue_jpy","processed_at"]
-    out=SILVER/f"sales_clean_{day}.csv"
-    good[cols].to_csv(out, index=False, encoding="utf-8", lineterminator="\n")
-    return len(good), len(bad)
-
-def main():
-    total_g=total_b=0; anyf=False
-    for p in sorted(RAW.glob("sales_*.csv")):
-        m=F.search(p.name); 
-        if not m: continue
-        anyf=True
-        day=m.group(1); df=pd.read_csv(p, dtype=str)
-        g,b=clean_one(day, df)
-        print(f"Processed {p.name}: good={g}, bad={b}")
-        total_g+=g; total_b+=b
-    print("No raw files found." if not anyf else f"Totals -> good={total_g}, bad={total_b}")
+    return good[COLS]
+
+def as_text(rows):
+    """typed_frames.apply'd good rows back to the text they were read as (quarantine keeps rows as delivered)"""
+    rows = storage.plain(rows)
+    return rows.assign(**{c: rows[c].astype(str) for c in rows.columns if pd.api.types.is_integer_dtype(rows[c])})
+
+def split_seen(day, good, ids, seen):
+    """Rows whose order_id another day already delivered → (good, dups with _bad_reason/source_file, ids of good)"""
+    dup = seen.elsewhere(ids, day) if seen is not None else np.zeros(len(good), dtype=bool)
+    dups = as_text(good.loc[dup])
+    dups["_bad_reason"]="dup_order_id"; dups["source_file"]=f"sales_{day}.csv"
+    return good.loc[~dup], dups, ids[~dup]
+
+def split_outliers(day, good, ids, base):
+    """
+    Rows outside the baseline's fences (sketches.judge) → (good, outliers with
+    _bad_reason/source_file, ids of good, sketch of good, outlier values for sketches.same_decision)
+    """
+    vals=np.column_stack([v.to_numpy(dtype=float) for v in amounts(good)])
+    out=sketches.judge(good["product_id"], vals, base)
+    outl=as_text(good.loc[out])
+    outl["_bad_reason"]="outlier"; outl["source_file"]=f"sales_{day}.csv"
+    flagged=pd.DataFrame(vals[out], columns=sketches.METRICS).assign(product_id=good["product_id"].to_numpy()[out])
+    return good.loc[~out], outl, ids[~out], sketches.Sketch.build(good.loc[~out], vals[~out], ids[~out]), flagged
+
+def clean_one(day, df, seen=None, base=None):
+    df = _ensure_cols(df).drop_duplicates().copy()
+    with perf.span("split_bad", rows_in=len(df)): good, bad = split_bad(day, df)
+    good = typed_frames.apply(good, "silver").drop_duplicates(subset=["order_id"], keep="first").copy()
+    with perf.span("seen_ids", rows_in=len(good)) as sp:
+        good, dups, ids = split_seen(day, good, seen_ids.id_hashes(good["order_id"]), seen); sp.rows_out=len(dups)
+    with perf.span("sketches", rows_in=len(good)) as sp:
+        good, outl, ids, sk, flagged = split_outliers(day, good, ids, base); sp.rows_out=len(outl)
+    for extra in (dups, outl):
+        if not extra.empty: bad = pd.concat([bad, extra]) if not bad.empty else extra
+    if not bad.empty:
+        with perf.span("write_quarantine", rows_out=len(bad)):
+            storage.write_frame(bad, quarantine_stem(day), typed=False, **CSV_KW)
+    with perf.span("quarantine_store"): qs = quarantine_store.write_day(day, bad)
+    with perf.span("write_silver", rows_out=len(good)):
+        storage.write_frame(finish_good(day, good), silver_stem(day), **CSV_KW)
+    return len(good), len(bad), dq_metrics.quarantine_counts(bad, day), qs, {"ids": ids, "sketch": sk, "outliers": flagged}
+
+class SeenKeys:
+    """Sorted uint64 row hashes (8 bytes/key): first-wins dedup across chunk boundaries"""
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.uint64)
+
+    def first_seen(self, h):
+        """Mask of hashes not seen in earlier chunks nor earlier in h; remembers them"""
+        h = np.asarray(h, dtype=np.uint64)
+        new = ~pd.Series(h).duplicated().to_numpy()
+        if len(self.keys):
+            pos = np.minimum(np.searchsorted(self.keys, h), len(self.keys) - 1)
+            new &= self.keys[pos] != h
+        # 既有鍵與新鍵皆已排序 → timsort 近乎線性合併
+        self.keys = np.sort(np.concatenate([self.keys, np.sort(h[new])]), kind="stable")
+        return new
+
+def _row_hash(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+def chunk_rows_for_budget(p, memory_mb, sample=10_000):
+    """
+    Rows per chunk so that ~STREAM_COPIES copies of a chunk plus the seen-key
+    sets fit in memory_mb (interpreter/library baseline not included)
+    """
+    df = pd.read_csv(p, dtype=str, nrows=sample)
+    n = max(1, len(df))
+    per_row = max(1, df.memory_usage(deep=True, index=False).sum() // n)
+    with open(p, "rb") as f:
+        head = sum(len(f.readline()) for _ in range(n + 1))
+    est_rows = os.path.getsize(p) * n // max(1, head)
+    budget = memory_mb * 2**20 - est_rows * KEY_BYTES
+    return max(1_000, int(budget // (per_row * STREAM_COPIES)))
+
+def clean_stream(day, p, chunk_rows, seen=None, base=None):
+    """
+    Bounded-memory clean_one: same outputs, read/written chunk by chunk.
+    drop_duplicates() and the first-wins order_id dedup carry across chunks
+    through 64-bit hash sets (collision odds ~n²/2⁶⁵). Cross-day duplicates
+    and outliers are quarantined chunk by chunk (same rows, possibly another
+    row order); the chunk sketches are merged.
+    """
+    rows, ids = SeenKeys(), SeenKeys()
+    dq = []; kept = []; sk = None; flagged = []
+    good_w = storage.FrameWriter(silver_stem(day), **CSV_KW)
+    bad_w = storage.FrameWriter(quarantine_stem(day), typed=False, **CSV_KW)
+    seg_w = quarantine_store.SegmentWriter(day)
+    try:
+        for df in pd.read_csv(p, dtype=str, chunksize=chunk_rows):
+            df = _ensure_cols(df)
+            df = df.loc[rows.first_seen(_row_hash(df))]
+            with perf.span("split_bad", rows_in=len(df)): good, bad = split_bad(day, df)
+            good = typed_frames.apply(good, "silver")
+            if not bad.empty:
+                dq.append(dq_metrics.quarantine_counts(bad, day, offset=bad_w.rows))
+                with perf.span("write_quarantine", rows_out=len(bad)): bad_w.write(bad); seg_w.write(bad)
+            h = seen_ids.id_hashes(good["order_id"]); first = ids.first_seen(h)
+            good, dups, h = split_seen(day, good.loc[first].copy(), h[first], seen)
+            good, outl, h, part, f = split_outliers(day, good, h, base)
+            for extra in (dups, outl):
+                if not extra.empty:
+                    dq.append(dq_metrics.quarantine_counts(extra, day, offset=bad_w.rows))
+                    with perf.span("write_quarantine", rows_out=len(extra)): bad_w.write(extra); seg_w.write(extra)
+            kept.append(h); flagged.append(f); sk = part if sk is None else sk.merge(part)
+            with perf.span("write_silver", rows_out=len(good)): good_w.write(finish_good(day, good))
+        if not good_w.started:   # 空檔也輸出標頭（與 clean_one 相同）
+            good_w.write(pd.DataFrame(columns=COLS))
+    except BaseException:
+        good_w.abort(); bad_w.abort(); seg_w.abort(); raise
+    good_w.close(); bad_w.close()
+    dq = dq_metrics.combine(dq) if dq else dq_metrics.quarantine_counts(pd.DataFrame(), day)
+    h = np.concatenate(kept) if kept else np.empty(0, np.uint64)
+    if sk is None:   # 沒有資料列的檔案
+        sk = sketches.Sketch.build(pd.DataFrame(columns=NEED), np.empty((0, 3)), h)
+    flagged = pd.concat(flagged, ignore_index=True) if flagged else pd.DataFrame(columns=[*sketches.METRICS, "product_id"])
+    return good_w.rows, bad_w.rows, dq, seg_w.close(), {"ids": h, "sketch": sk, "outliers": flagged}
+
+@perf.timed("process_file")
+def process_file(p, chunk_rows=None, memory_mb=None):
+    """Clean one raw day; runs in the parent or in a pool worker"""
+    day=F.search(p.name).group(1)
+    with perf.span("sha256"): sha=file_sha256(p)
+    if memory_mb and not chunk_rows: chunk_rows=chunk_rows_for_budget(p, memory_mb)
+    seen=seen_ids.SeenIds.open()
+    with perf.span("sketch_baseline"): base_days,base=sketches.baseline(day)
+    if chunk_rows:
+        with perf.span("clean_stream") as sp: g,b,dq,qs,kept=clean_stream(day, p, chunk_rows, seen, base); sp.rows_out=g+b
+    else:
+        with perf.span("read_csv") as sp: df=pd.read_csv(p, dtype=str); sp.rows_out=len(df)
+        with perf.span("clean_one", rows_in=len(df)) as sp: g,b,dq,qs,kept=clean_one(day, df, seen, base); sp.rows_out=g+b
+    outputs=[silver_path(day)]
+    if b: outputs.append(quarantine_path(day))
+    else:   # 不留下上次的隔離檔
+        for fmt in storage.FORMATS: storage.path_for(quarantine_stem(day), fmt).unlink(missing_ok=True)
+    return {"good": g, "bad": b, "outputs": outputs, "sha256": sha, "day": day, "dq": dq, "quarantine": qs,
+            "base_days": base_days, **kept}
+
+def run_days(paths, workers=1, **opts):
+    """Yield (path, result, error) in path order; one failing day never drops the others"""
+    if workers<=1:
+        for p in paths:
+            try: yield p, process_file(p, **opts), None
+            except Exception as e: yield p, None, e
+        return
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futs=[(p, ex.submit(perf.in_worker, process_file, p, **opts)) for p in paths]
+        for p,fut in futs:
+            try: res,stats=fut.result()
+            except Exception as e: yield p, None, e; continue
+            perf.absorb(stats); yield p, res, None
+
+def process(todo, man, workers=1, **opts):
+    """Clean raw files, record them in man, commit DQ counters + quarantine index → ({path: result}, failed names)"""
+    done={}; failed=[]; seen=seen_ids.SeenIds.open()
+    for p,res,err in run_days(todo, workers, **opts):
+        if err is None and (seen.elsewhere(res["ids"], res["day"]).any()
+                            or not sketches.same_decision(res["day"], res["base_days"], res["sketch"], res["outliers"])):
+            # 平行執行時與同一回合較早日期重複 / 較早日期的 sketch 改變判定 → 由父行程在已記錄的狀態下重做
+            try: res=process_file(p, **opts)
+            except Exception as e: err=e
+        if err is not None:
+            print(f"Failed {p.name}: {type(err).__name__}: {err}", file=sys.stderr)
+            failed.append(p.name); continue
+        with perf.span("seen_ids"): seen.add(res["day"], res["ids"])
+        with perf.span("sketches"): sketches.save_day(res["day"], res["sketch"])
+        man.record(p, res["outputs"], sha256=res["sha256"])
+        print(f"Processed {p.name}: good={res['good']}, bad={res['bad']}")
+        done[p]=res
+    if done:
+        with perf.span("seen_ids"): seen.compact()
+        days=[r["day"] for r in done.values()]
+        with perf.span("dq_metrics"): dq_metrics.update("quarantine", pd.concat([r["dq"] for r in done.values()], ignore_index=True), days)
+        with perf.span("quarantine_index"): quarantine_store.commit({r["day"]: r["quarantine"] for r in done.values()})
+    return done, failed
+
+@perf.timed("to_silver", run=True)
+def main(argv=None):
+    ap=argparse.ArgumentParser()
+    ap.add_argument("--full-refresh", action="store_true", help="ignore the manifest and reprocess every raw file")
+    ap.add_argument("--workers", type=int, default=1, help="process days in a pool of N processes")
+    ap.add_argument("--chunk-rows", type=int, help="stream each raw file in chunks of N rows")
+    ap.add_argument("--memory-mb", type=float, help="stream with chunks sized to this per-worker memory budget")
+    a=ap.parse_args(argv)
+    man=Manifest(MANIFEST)
+    seen=[p for p in sorted(RAW.glob("sales_*.csv")) if F.search(p.name)]
+    todo=[p for p in seen if a.full_refresh or man.changed(p)]
+    if a.full_refresh: seen_ids.reset(); sketches.reset()   # 全部重新處理 → 重複判定與離群值基準也從頭開始
+    done,failed=process(todo, man, a.workers, chunk_rows=a.chunk_rows, memory_mb=a.memory_mb)
+    total_g=sum(r["good"] for r in done.values()); total_b=sum(r["bad"] for r in done.values())
+    with perf.span("manifest"): man.prune(seen); man.save()
+    perf.annotate(rows_out=total_g+total_b)
+    if not seen: print("No raw files found.")
+    else: print(f"Totals -> good={total_g}, bad={total_b}, skipped={len(seen)-len(todo)}")
+    if failed:
+        print(f"{len(failed)} file(s) failed: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
 
 if __name__=="__main__":
     main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Compact in-memory dtypes for silver / gold frames, from schemas/*.schema.json:
+  string + "category": true   → category (geo_id, product_id)
+  date (%Y%m%d)               → int32 YYYYMMDD (orders like the date, writes back unchanged)
+  int                         → smallest integer type holding the values
+  float                       → float32 when every value survives the round trip, else float64
+A column is only converted when that loses nothing; values a validator should
+flag (text in an int column, a 7-digit date, ...) stay as read. Writers widen
+back to the plain types (storage.plain), so files are the same either way.
+
+  df = typed_frames.read(path, "gold")
+  python scripts/typed_frames.py data/gold/fact_sales/order_date=20261012/part-0.csv
+"""
+from __future__ import annotations
+import functools, sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import storage
+
+SCHEMAS = {
+    "silver": "schemas/sales_silver.schema.json",
+    "gold": "schemas/fact_sales_gold.schema.json",
+}
+SCHEMA_DIR = Path(__file__).resolve().parents[1]   # 不依賴 cwd（digests verify 在工作目錄中重新執行）
+
+@functools.lru_cache(maxsize=None)
+def kinds(layer: str) -> dict[str, str]:
+    """{column: category | string | date8 | int | float} for a layer's schema"""
+    from validate_utils import _fields, load_schema
+    out = {}
+    for f in _fields(load_schema(SCHEMA_DIR / SCHEMAS[layer])):
+        t = f.get("dtype")
+        if t == "string":
+            out[f["name"]] = "category" if f.get("category") else "string"
+        elif t == "date" and f.get("format", "%Y%m%d") == "%Y%m%d":
+            out[f["name"]] = "date8"
+        elif t in ("int", "float"):
+            out[f["name"]] = t
+    return out
+
+def csv_dtypes(layer: str, columns=None) -> dict:
+    """read_csv dtype= for the categorical columns (parsed straight into codes)"""
+    return {c: "category" for c, k in kinds(layer).items() if k == "category" and (columns is None or c in columns)}
+
+def _int(sr: pd.Series):
+    if pd.api.types.is_float_dtype(sr):
+        if sr.hasnans or not (sr % 1 == 0).all():
+            return None
+    elif not pd.api.types.is_integer_dtype(sr):
+        return None
+    return pd.to_numeric(sr, downcast="integer")
+
+def _date8(sr: pd.Series):
+    if pd.api.types.is_string_dtype(sr) and not isinstance(sr.dtype, pd.CategoricalDtype):
+        if sr.hasnans or not sr.str.fullmatch(r"\d{8}").all():
+            return None
+        sr = sr.astype(np.int64)
+    v = _int(sr)
+    if v is None or (len(v) and not v.between(10_000_101, 99_991_231).all()):
+        return None
+    return v.astype(np.int32)
+
+def _float(sr: pd.Series):
+    if not pd.api.types.is_float_dtype(sr) or sr.dtype == np.float32:
+        return None
+    f = sr.astype(np.float32)
+    same = (f.astype(np.float64) == sr) | sr.isna()
+    return f if same.all() else None
+
+def _category(sr: pd.Series):
+    if isinstance(sr.dtype, pd.CategoricalDtype) or not (pd.api.types.is_string_dtype(sr) or sr.dtype == object):
+        return None
+    return sr.astype("category")
+
+CAST = {"category": _category, "date8": _date8, "int": _int, "float": _float}
+
+def apply(df: pd.DataFrame, layer: str) -> pd.DataFrame:
+    """df with the layer's compact dtypes (columns that do not convert cleanly are left alone)"""
+    casts = {}
+    for c, k in kinds(layer).items():
+        if c in df.columns and k in CAST:
+            v = CAST[k](df[c])
+            if v is not None and v.dtype != df[c].dtype:
+                casts[c] = v
+    return df.assign(**casts) if casts else df
+
+def concat(dfs, layer: str, columns=None) -> pd.DataFrame:
+    """pd.concat with categories unified first (pd.concat alone falls back to object)"""
+    if not dfs:
+        return pd.DataFrame(columns=columns)
+    for c in dfs[0].columns:
+        if len(dfs) > 1 and all(isinstance(d[c].dtype, pd.CategoricalDtype) for d in dfs):
+            u = pd.api.types.union_categoricals([d[c] for d in dfs], sort_categories=True).categories
+            dfs = [d.assign(**{c: d[c].cat.set_categories(u)}) for d in dfs]
+    return apply(pd.concat(dfs, ignore_index=True) if len(dfs) > 1 else dfs[0], layer)
+
+def read(path, layer: str, columns=None, filters=None) -> pd.DataFrame:
+    """One file, narrowed chunk by chunk (peak ≈ typed frame + one chunk at full width)"""
+    return concat([apply(df, layer) for df in storage.iter_frame(path, columns, filters, csv_dtypes(layer, columns))],
+                  layer, columns)
+
+def read_many(paths, layer: str, columns=None, filters=None) -> pd.DataFrame:
+    return concat([read(p, layer, columns, filters) for p in paths], layer, columns)
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python scripts/typed_frames.py <file> [silver|gold]"); sys.exit(1)
+    layer = sys.argv[2] if len(sys.argv) > 2 else "gold"
+    plain, typed = storage.read_frame(sys.argv[1]), read(sys.argv[1], layer)
+    mb = lambda df: df.memory_usage(deep=True, index=False)
+    print(pd.DataFrame({"plain": plain.dtypes.astype(str), "typed": typed.dtypes.astype(str),
+                        "plain_MB": mb(plain) / 2**20, "typed_MB": mb(typed) / 2**20}).round(3).to_string())
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,21 @@
 #!/usr/bin/env python3
 """Update quarantine trend tracking"""
 import pandas as pd
-import glob
 from datetime import datetime
 from pathlib import Path
+import dq_metrics
 
-def update_trends():
+def update_trends(tot=None):
     trends_file = Path('reports/quarantine_trends.csv')
     
-    # Load current data
-    gold = pd.read_csv('data/gold/fact_sales.csv')
-    quar_files = glob.glob('data/silver/quarantine/*.csv')
-    quarantine = pd.concat([pd.read_csv(f) for f in quar_files]) if quar_files else pd.DataFrame()
+    # Load current counts from the DQ metrics store
+    if tot is None:
+        tot = dq_metrics.load_totals()
+    tot = tot[tot["dim"] == "total"].groupby("layer")["rows"].sum()
     
-    total = len(gold) + len(quarantine)
-    good = len(gold)
-    bad = len(quarantine)
+    good = int(tot.get("gold", 0))
+    bad = int(tot.get("quarantine", 0))
+    total = good + bad
     rate = (bad / total * 100) if total > 0 else 0
     
     # Create or append to trends file
@@ -2,22 +2,26 @@ from __future__ import annotations
 from pathlib import Path
 import sys, pandas as pd
 from validate_utils import load_schema, validate_df, write_markdown
+import gold_store, perf
 
-def main():
-    p = Path("data/gold/fact_sales.csv")
-    if not p.exists():
-        print("Gold not found: data/gold/fact_sales.csv", file=sys.stderr)
-        sys.exit(1)
-
-    df = pd.read_csv(p)
+@perf.timed("validate_gold", run=True)
+def main(df=None):
+    """df: gold already in memory (pipeline.py); read from the store otherwise"""
+    if df is None:
+        if not gold_store.exists():
+            print(f"Gold not found: {gold_store.GOLD_DIR}/", file=sys.stderr)
+            sys.exit(1)
+        df = gold_store.read_gold()
     schema = load_schema("schemas/fact_sales_gold.schema.json")
     rep = validate_df(df, schema)
+    perf.annotate(rows_in=len(df))
 
     ok = (len(rep["errors"]) == 0)
     summary = {
         "gold_rows": rep["counts"].get("rows", 0),
         "pk_duplicates": rep.get("pk_duplicates", 0),
-        "errors": 0 if ok else len(rep["errors"])
+        "errors": 0 if ok else len(rep["errors"]),
+        "rule_violations": rep["violations"],
     }
     if not ok:
         summary["error_samples"] = rep["errors"][:10]
@@ -1,30 +1,28 @@
 from __future__ import annotations
 from pathlib import Path
 import sys, pandas as pd
-from validate_utils import load_schema, validate_df, write_markdown
+from validate_utils import load_schema, validate_frames, write_markdown
+import perf, storage
 
+@perf.timed("validate_silver", run=True)
 def main():
-    files = sorted(Path("data/silver").glob("sales_clean_*.csv"))
+    files = [Path(p) for p in storage.glob_frames("data/silver/sales_clean_*")]
     if not files:
         print("No silver files found.", file=sys.stderr)
         sys.exit(1)
 
     schema = load_schema("schemas/sales_silver.schema.json")
-    total_rows = 0
-    errs = []
-
-    for f in files:
-        df = pd.read_csv(f)
-        rep = validate_df(df, schema)
-        total_rows += len(df)
-        if rep["errors"]:
-            errs.append(f"{f.name}: " + "; ".join(rep["errors"]))
+    # 一次驗證全部檔案（跨檔偵測 order_id 重複）
+    rep = validate_frames(files, schema, layer="silver")
+    perf.annotate(rows_in=rep["counts"]["rows"])
+    errs = rep["errors"]
 
     ok = (len(errs) == 0)
     summary = {
         "silver_files": len(files),
-        "silver_rows_total": total_rows,
-        "silver_errors": 0 if ok else len(errs)
+        "silver_rows_total": rep["counts"]["rows"],
+        "silver_errors": 0 if ok else len(errs),
+        "rule_violations": rep["violations"],
     }
     if not ok:
         summary["error_samples"] = errs[:10]
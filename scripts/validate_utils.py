@@ -3,28 +3,114 @@
 from __future__ import annotations
 import json
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from typing import Dict, Any
+import storage, typed_frames
+
+def _as_text(sr: pd.Series) -> pd.Series:
+    """String view of a column; float-read YYYYMMDD ints lose the '.0'"""
+    if pd.api.types.is_float_dtype(sr) and (sr.dropna() % 1 == 0).all():
+        sr = sr.astype("Int64")
+    return sr.astype("string")
 
 def _coerce_dtype(sr: pd.Series, spec: dict):
-    """Convert series to expected dtype"""
+    """Convert series to expected dtype (values that do not convert → NA)"""
     t = spec.get("dtype")
     if t == "string":
         return sr.astype("string")
     if t == "int":
-        return pd.to_numeric(sr, errors="coerce").astype("Int64")
+        v = pd.to_numeric(sr, errors="coerce")
+        return v.where(v % 1 == 0).astype("Int64")
     if t == "float":
         return pd.to_numeric(sr, errors="coerce")
     if t == "date":
+        # 日期種類少 → 只解析唯一值再展開
         fmt = spec.get("format", "%Y%m%d")
-        return pd.to_datetime(sr, errors="coerce", format=fmt).dt.date
+        codes, uniq = pd.factorize(sr)
+        parsed = pd.to_datetime(_as_text(pd.Series(uniq)), errors="coerce", format=fmt).to_numpy()
+        out = np.where(codes >= 0, parsed[np.maximum(codes, 0)], np.datetime64("NaT"))
+        return pd.Series(out, index=sr.index)
     return sr
 
 def load_schema(path: str | Path) -> dict:
     """Load JSON schema from file"""
     return json.loads(Path(path).read_text(encoding="utf-8"))
 
-def validate_df(df: pd.DataFrame, schema: dict) -> dict:
+def _fields(schema: dict) -> list[dict]:
+    """Field specs as a list; accepts both the list form and the {name: spec} form"""
+    fields = schema.get("fields", [])
+    if isinstance(fields, dict):
+        return [{"name": k, **v} for k, v in fields.items()]
+    return fields
+
+def compile_plan(schema: dict) -> list[tuple[str, str, dict]]:
+    """
+    Schema → list of (rule, column, spec) checks, each evaluated as one
+    vectorized mask over the whole frame:
+      null         required column is NA (counted, not an error)
+      dtype        int/float value that does not convert
+      date_format  date value not in spec["format"]
+      range        converted value outside spec["min"] / spec["exclusiveMinimum"] / spec["max"]
+      pk           duplicated primary key (column = "a,b,...")
+    Ranges should only reject what to_silver quarantines, so that a row which
+    passed silver also passes validation.
+    """
+    plan = [("null", c, {}) for c in schema.get("required", [])]
+    for f in _fields(schema):
+        t = f.get("dtype")
+        if t in ("int", "float"):
+            plan.append(("dtype", f["name"], f))
+        elif t == "date":
+            plan.append(("date_format", f["name"], f))
+        if {"min", "exclusiveMinimum", "max"} & f.keys():
+            plan.append(("range", f["name"], f))
+    if schema.get("primaryKey"):
+        plan.append(("pk", ",".join(schema["primaryKey"]), {}))
+    return plan
+
+def run_plan(df: pd.DataFrame, plan, sample: int = 5) -> dict:
+    """
+    Evaluate a compiled plan. Returns {"rule:column": (violations, sample row
+    positions)} for every check whose columns are present.
+    """
+    coerced: dict[str, pd.Series] = {}
+    out = {}
+    for rule, col, spec in plan:
+        cols = col.split(",")
+        if not all(c in df.columns for c in cols):
+            continue
+        if rule == "null":
+            mask = df[col].isna()
+        elif rule == "pk":
+            mask = df.duplicated(subset=cols, keep=False)
+        else:
+            if col not in coerced:
+                coerced[col] = _coerce_dtype(df[col], spec)
+            v = coerced[col]
+            if rule in ("dtype", "date_format"):
+                mask = df[col].notna() & v.isna()
+            else:
+                mask = pd.Series(False, index=df.index)
+                if "min" in spec:
+                    mask |= (v < spec["min"]).fillna(False)
+                if "exclusiveMinimum" in spec:
+                    mask |= (v <= spec["exclusiveMinimum"]).fillna(False)
+                if "max" in spec:
+                    mask |= (v > spec["max"]).fillna(False)
+        mask = mask.to_numpy(dtype=bool)
+        out[f"{rule}:{col}"] = (int(mask.sum()), np.flatnonzero(mask)[:sample])
+    return out
+
+def row_ids(df: pd.DataFrame, schema: dict, rows) -> list[str]:
+    """Primary key value of the given rows ("a|b" for composite keys), else the row position"""
+    pk = [c for c in schema.get("primaryKey", []) if c in df.columns]
+    if not pk:
+        return [str(r) for r in rows]
+    sub = df.iloc[rows]
+    return ["|".join("" if pd.isna(v) else str(v) for v in t) for t in zip(*(sub[c] for c in pk))]
+
+def validate_df(df: pd.DataFrame, schema: dict, plan=None, sample: int = 5) -> dict:
     """
     Validate DataFrame against schema.
     
@@ -32,23 +118,26 @@ def validate_df(df: pd.DataFrame, schema: dict) -> dict:
     {
         "fields": [
             {"name": "col1", "dtype": "string"},
-            {"name": "col2", "dtype": "int"},
+            {"name": "col2", "dtype": "int", "exclusiveMinimum": 0, "max": 100},
+            {"name": "col3", "dtype": "date", "format": "%Y%m%d"},
             ...
         ],
         "required": ["col1", "col2"],
         "primaryKey": ["col1"]
     }
+
+    report["violations"] / report["samples"] hold per-rule counts and sample
+    row ids (see compile_plan for the rules).
     """
-    fields = schema.get("fields", [])
-    required = set(schema.get("required", []))
-    pk = schema.get("primaryKey", [])
-    
+    required = schema.get("required", [])
     report = {
         "errors": [],
         "counts": {
             "rows": len(df)
         },
-        "pk_duplicates": 0
+        "pk_duplicates": 0,
+        "violations": {},
+        "samples": {},
     }
     
     # Check required columns exist
@@ -59,32 +148,46 @@ def validate_df(df: pd.DataFrame, schema: dict) -> dict:
     if report["errors"]:
         return report
     
-    # Validate each field
-    for field_spec in fields:
-        col_name = field_spec.get("name")
-        if col_name not in df.columns:
+    results = run_plan(df, plan or compile_plan(schema), sample)
+    for name, (n, rows) in results.items():
+        report["violations"][name] = n
+        if not n:
             continue
-            
-        # Check nulls
-        if col_name in required:
-            null_count = df[col_name].isna().sum()
-            if null_count > 0:
-                report["counts"][f"{col_name}_nulls"] = int(null_count)
-        
-        # Type coercion (optional, for future use)
-        # df[col_name] = _coerce_dtype(df[col_name], field_spec)
-    
-    # Check primary key duplicates
-    if pk:
-        pk_cols = [c for c in pk if c in df.columns]
-        if pk_cols:
-            duplicates = df.duplicated(subset=pk_cols, keep=False).sum()
-            report["pk_duplicates"] = int(duplicates)
-            if duplicates > 0:
-                report["errors"].append(f"Primary key duplicates: {duplicates}")
+        rule, col = name.split(":", 1)
+        ids = row_ids(df, schema, rows)
+        report["samples"][name] = ids
+        if rule == "null":   # 必填欄位的空值只計數，不算錯誤
+            report["counts"][f"{col}_nulls"] = n
+            continue
+        if rule == "pk":
+            report["pk_duplicates"] = n
+            report["errors"].append(f"Primary key duplicates: {n}")
+            continue
+        report["errors"].append(f"{name}: {n} rows (e.g. {', '.join(ids)})")
     
     return report
 
+def validate_frames(paths, schema: dict, sample: int = 5, layer: str | None = None) -> dict:
+    """
+    One pass over several files: read the schema columns of every file, then
+    run the compiled plan once, so primary keys are checked across files.
+    layer ("silver" / "gold") reads them with typed_frames' compact dtypes.
+    """
+    names = list(dict.fromkeys([f["name"] for f in _fields(schema)] + schema.get("required", [])))
+    frames, missing = [], []
+    for p in paths:
+        cols = storage.columns(p)
+        missing += [f"{Path(p).name}: Missing required column: {c}" for c in schema.get("required", []) if c not in cols]
+        use = [c for c in cols if c in names]
+        frames.append(typed_frames.read(p, layer, columns=use) if layer else storage.read_frame(p, columns=use))
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=names)
+    if layer:
+        df = typed_frames.apply(df, layer)   # 類別不一致的欄位在 concat 後會變回 object
+    report = validate_df(df, schema, sample=sample)
+    report["errors"][:0] = [e for e in missing if e.split(": ", 1)[1] not in report["errors"]]
+    report["counts"]["files"] = len(frames)
+    return report
+
 def write_markdown(report_path: str | Path, title: str, items: dict, mode: str = "w") -> None:
     """Write validation report as markdown"""
     p = Path(report_path)
@@ -92,7 +195,11 @@ def write_markdown(report_path: str | Path, title: str, items: dict, mode: str =
     
     lines = [f"## {title}\n"]
     for k, v in items.items():
-        lines.append(f"- **{k}**: {v}")
+        if isinstance(v, dict):
+            lines.append(f"- **{k}**:")
+            lines.extend(f"  - `{kk}`: {vv}" for kk, vv in v.items())
+        else:
+            lines.append(f"- **{k}**: {v}")
     lines.append("")  # Empty line after section
     
     with p.open(mode, encoding="utf-8") as f:
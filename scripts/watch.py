@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Watch mode: poll data/raw for new or modified sales_*.csv and push them
+through silver and gold as micro-batches.
+A file is queued once its size and mtime have not changed for --settle seconds
+(writers still appending are left alone) and the silver manifest says it is
+new or changed; a file whose batch failed is retried when it changes again. Polling runs on the event loop while a single worker thread
+processes the queued files (to_silver.process, then the to_gold upsert of the
+silver files that changed), so detection keeps going during a batch.
+Per-file latency is appended to reports/watch_latency.csv:
+  file | day | good | bad | mtime | detected_at | gold_at | detect_s | e2e_s
+(detect_s: mtime → seen stable by the poller, e2e_s: mtime → gold committed)
+
+  python scripts/watch.py                       # until Ctrl-C / SIGTERM
+  python scripts/watch.py --once --settle 0     # process what is there, then exit
+"""
+from __future__ import annotations
+import argparse, asyncio, csv, signal, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+import perf, to_gold, to_silver
+from manifest import Manifest
+
+LATENCY_PATH = Path("reports/watch_latency.csv")
+LATENCY_COLS = ["file", "day", "good", "bad", "mtime", "detected_at", "gold_at", "detect_s", "e2e_s"]
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts).isoformat(timespec="milliseconds")
+
+class Watcher:
+    def __init__(self, interval: float = 1.0, settle: float = 2.0, max_batch: int = 8, engine: str = "pandas"):
+        self.interval, self.settle, self.max_batch, self.engine = interval, settle, max_batch, engine
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.pending: dict[Path, tuple] = {}   # path → ((size, mtime_ns), first seen with that stat)
+        self.handled: dict[Path, tuple] = {}   # path → (size, mtime_ns) last checked against the manifest
+        self.stop = asyncio.Event()
+
+    def scan(self) -> int:
+        """One poll: queue files that are stable and new / changed per the silver manifest; returns files still settling"""
+        man = Manifest(to_silver.MANIFEST)
+        now = time.time()
+        for p in sorted(to_silver.RAW.glob("sales_*.csv")):
+            if not to_silver.F.search(p.name):
+                continue
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            sig = (st.st_size, st.st_mtime_ns)
+            if self.handled.get(p) == sig:
+                continue
+            if self.pending.get(p, (None,))[0] != sig:
+                self.pending[p] = (sig, now)   # 新檔或寫入中 → 等到不再變動
+            if st.st_size == 0 or now - max(self.pending[p][1], st.st_mtime) < self.settle:
+                continue
+            del self.pending[p]
+            self.handled[p] = sig
+            if man.changed(p):
+                self.queue.put_nowait((p, st.st_mtime, now))
+        return len(self.pending)
+
+    async def poll(self, once: bool) -> None:
+        while not self.stop.is_set():
+            if not self.scan() and once:
+                break
+            try:
+                await asyncio.wait_for(self.stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+        await self.queue.put(None)   # 哨兵：處理完先前排入的項目後結束
+
+    async def process(self) -> None:
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="micro-batch") as pool:
+            done = False
+            while not done:
+                batch = []
+                item = await self.queue.get()
+                while item is not None:
+                    batch.append(item)
+                    if len(batch) >= self.max_batch or self.queue.empty():
+                        break
+                    item = self.queue.get_nowait()
+                done = item is None
+                if batch:
+                    await loop.run_in_executor(pool, self.micro_batch, batch)
+
+    def micro_batch(self, batch) -> None:
+        """silver for the batch's files, gold upsert, latency rows (runs in the worker thread)"""
+        paths = [p for p, _, _ in batch]
+        print(f"[watch] micro-batch of {len(paths)}: {', '.join(p.name for p in paths)}")
+        try:
+            with perf.run("micro_batch", rows_in=len(paths)):
+                man = Manifest(to_silver.MANIFEST)
+                done, failed = to_silver.process(paths, man)
+                man.save()
+                if done:
+                    to_gold.main(["--engine", self.engine])
+        except (Exception, SystemExit) as e:   # 不讓常駐程式停止：失敗的檔案在下次更新時重新處理
+            print(f"[watch] micro-batch failed: {type(e).__name__}: {e}", file=sys.stderr)
+            return
+        gold_at = time.time()
+        rows = []
+        for p, mtime, detected in batch:
+            if p not in done:
+                continue
+            r = done[p]
+            rows.append({"file": p.name, "day": r["day"], "good": r["good"], "bad": r["bad"],
+                         "mtime": _iso(mtime), "detected_at": _iso(detected), "gold_at": _iso(gold_at),
+                         "detect_s": round(detected - mtime, 3), "e2e_s": round(gold_at - mtime, 3)})
+            print(f"[watch] {p.name}: good={r['good']} bad={r['bad']} → gold in {gold_at - mtime:.2f}s "
+                  f"(detected after {detected - mtime:.2f}s)")
+        write_latency(rows)
+
+    async def run(self, once: bool = False) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        print(f"[watch] polling {to_silver.RAW}/ every {self.interval}s (settle {self.settle}s)")
+        await asyncio.gather(self.poll(once), self.process())
+
+def write_latency(rows) -> None:
+    if not rows:
+        return
+    LATENCY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    new = not LATENCY_PATH.exists()
+    with open(LATENCY_PATH, "a", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=LATENCY_COLS)
+        if new:
+            w.writeheader()
+        w.writerows(rows)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--interval", type=float, default=1.0, help="seconds between polls")
+    ap.add_argument("--settle", type=float, default=2.0, help="seconds a file must stay unchanged before it is read")
+    ap.add_argument("--max-batch", type=int, default=8, help="files per micro-batch")
+    ap.add_argument("--engine", choices=["pandas", "duckdb"], default="pandas")
+    ap.add_argument("--once", action="store_true", help="exit once the files present now are processed")
+    a = ap.parse_args(argv)
+    w = Watcher(a.interval, a.settle, a.max_batch, a.engine)
+    asyncio.run(w.run(a.once))
+
+if __name__ == "__main__":
+    main()
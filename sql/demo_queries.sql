@@ -1,9 +1,11 @@
+-- Run with: python3 scripts/run_sql.py sql/demo_queries.sql (registers views fact_sales / sales_daily)
+-- ②③ 由 to_gold 更新的 rollup（sales_daily: order_date × geo_id × product_id）彙總
 -- ① 看前 5 列
-SELECT * FROM read_csv_auto('data/gold/fact_sales.csv') LIMIT 5;
+SELECT * FROM fact_sales LIMIT 5;
 
 -- ② 依地區(geo_id)彙總營收 Top 5
 SELECT geo_id, SUM(revenue_jpy) AS rev_jpy
-FROM read_csv_auto('data/gold/fact_sales.csv')
+FROM sales_daily
 GROUP BY 1
 ORDER BY rev_jpy DESC
 LIMIT 5;
@@ -12,7 +14,7 @@ LIMIT 5;
 SELECT 
   strptime(CAST(order_date AS VARCHAR), '%Y%m%d') AS date,
   SUM(revenue_jpy) AS rev_jpy
-FROM read_csv_auto('data/gold/fact_sales.csv')
+FROM sales_daily
 GROUP BY 1
 ORDER BY date
 LIMIT 10;
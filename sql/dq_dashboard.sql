@@ -1,5 +1,7 @@
 -- Data Quality Dashboard
--- Run with: duckdb < sql/dq_dashboard.sql || python3 scripts/run_sql.py sql/dq_dashboard.sql
+-- Run with: python3 scripts/run_sql.py sql/dq_dashboard.sql
+-- (views fact_sales / silver_sales / quarantine / sales_daily are registered by run_sql.py,
+--  gold figures come from the sales_daily rollup, not a fact_sales scan)
 
 .print === DATA QUALITY DASHBOARD ===
 .print
@@ -7,19 +9,19 @@
 -- 1. Overall metrics
 .print --- Overall Metrics ---
 SELECT 
-    COUNT(*) as total_gold_records,
-    (SELECT COUNT(*) FROM read_csv('data/silver/quarantine/*.csv')) as quarantined_records,
-    ROUND(COUNT(*) * 100.0 / (COUNT(*) + (SELECT COUNT(*) FROM read_csv('data/silver/quarantine/*.csv'))), 2) as pass_rate_pct
-FROM 'data/gold/fact_sales.csv';
+    CAST(SUM(orders) AS BIGINT) as total_gold_records,
+    (SELECT COUNT(*) FROM quarantine) as quarantined_records,
+    ROUND(SUM(orders) * 100.0 / (SUM(orders) + (SELECT COUNT(*) FROM quarantine)), 2) as pass_rate_pct
+FROM sales_daily;
 
 .print
 .print --- Top Revenue Products ---
 SELECT 
     product_id,
     SUM(revenue_jpy) as total_revenue,
-    COUNT(*) as order_count,
-    ROUND(AVG(revenue_jpy), 2) as avg_revenue
-FROM 'data/gold/fact_sales.csv'
+    CAST(SUM(orders) AS BIGINT) as order_count,
+    ROUND(SUM(revenue_jpy) / SUM(orders), 2) as avg_revenue
+FROM sales_daily
 GROUP BY product_id
 ORDER BY total_revenue DESC
 LIMIT 5;
@@ -29,9 +31,9 @@ LIMIT 5;
 SELECT 
     geo_id,
     COUNT(DISTINCT order_date) as active_days,
-    COUNT(*) as total_orders,
+    CAST(SUM(orders) AS BIGINT) as total_orders,
     SUM(revenue_jpy) as total_revenue
-FROM 'data/gold/fact_sales.csv'
+FROM sales_daily
 GROUP BY geo_id
 ORDER BY total_revenue DESC;
 
@@ -41,6 +43,6 @@ SELECT
     product_id,
     COUNT(*) as issue_count,
     STRING_AGG(DISTINCT _bad_reason, ', ') as issue_types
-FROM read_csv('data/silver/quarantine/*.csv')
+FROM quarantine
 GROUP BY product_id
 ORDER BY issue_count DESC;
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# scripts/ 不是套件，故把它加入 import 路徑
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import cdc, gold_store, nk_index, rollups, to_gold
+
+NK = ["order_date", "geo_id", "product_id"]
+
+def gold_like(n, seed, day=20250101):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "order_id": [f"{seed}-{i}" for i in range(n)],
+        "order_date": day,
+        "geo_id": rng.choice(["GEO01", "GEO02", "GEO03"], n),
+        "product_id": rng.choice(["P001", "P002", "P003", "P004"], n),
+        "revenue_jpy": rng.integers(1, 10, n) * 100.0,
+    })
+
+def reference_upsert(old, new):
+    """Pre-index semantics: string keys, keep last, stable date sort"""
+    combined = pd.concat([old, new], ignore_index=True)
+    nk = combined[NK].astype("string").agg("|".join, axis=1)
+    return to_gold.sort_by_date_if_possible(combined.loc[~nk.duplicated(keep="last")]).reset_index(drop=True)
+
+def test_nk_hash_is_stable_across_storage_dtypes():
+    df = gold_like(20, 1)
+    typed = df.astype({"order_date": "int32", "geo_id": "category", "product_id": "string"})
+    assert np.array_equal(nk_index.nk_hash(df, NK), nk_index.nk_hash(typed, NK))
+    assert nk_index.nk_hash(df, NK).dtype == np.uint64
+
+def test_hash_upsert_matches_string_key_upsert():
+    old = reference_upsert(gold_like(0, 0), gold_like(40, 1))
+    new = gold_like(30, 2)
+    out, out_h = to_gold.upsert_partition(old, nk_index.nk_hash(old, NK), new, nk_index.nk_hash(new, NK))
+    pd.testing.assert_frame_equal(out.reset_index(drop=True), reference_upsert(old, new))
+    assert np.array_equal(out_h, nk_index.nk_hash(out, NK))
+
+def test_merge_matches_full_stable_sort():
+    rng = np.random.default_rng(5)
+    dates = np.array(["2025-01-02", "2025-01-01", "2025-01-03", "not-a-date", None, "2025-01-02"], dtype=object)
+    with_dates = lambda df: df.assign(date=rng.choice(dates, len(df)))   # "date" 是優先度最高的排序欄位
+    for old_sorted in (True, False):
+        old = with_dates(gold_like(60, 1))
+        old = reference_upsert(old.iloc[:0], old) if old_sorted else old.drop_duplicates(NK, keep="last")
+        new = with_dates(gold_like(40, 2))
+        out, _ = to_gold.upsert_partition(old, nk_index.nk_hash(old, NK), new, nk_index.nk_hash(new, NK))
+        pd.testing.assert_frame_equal(out.reset_index(drop=True), reference_upsert(old, new))
+
+def test_index_roundtrip(tmp_path):
+    idx = nk_index.NKIndex()
+    idx.set_partition("20250101", np.array([3, 1, 2], dtype=np.uint64))
+    idx.set_partition("20250102", np.array([9], dtype=np.uint64))
+    idx.save(tmp_path / "i.parquet")
+    back = nk_index.NKIndex.load(tmp_path / "i.parquet")
+    assert back.hashes("20250101").tolist() == [3, 1, 2] and len(back) == 4
+
+def _gold_files(root):
+    return {str(p.relative_to(root)): p.read_bytes() for p in sorted((root / gold_store.GOLD_DIR).rglob("part-*"))}
+
+def test_duckdb_engine_matches_pandas(tmp_path, monkeypatch):
+    batches = [
+        [gold_like(30, 1), gold_like(25, 2, day=20250102)],
+        [gold_like(20, 3), gold_like(10, 4, day=20250103)],   # 覆寫 20250101 + 新的日期
+    ]
+    deltas = []
+    for engine in ("pandas", "duckdb"):
+        root = tmp_path / engine; silver = root / "data" / "silver"; silver.mkdir(parents=True)
+        monkeypatch.chdir(root)
+        for step, frames in enumerate(batches):
+            for i, df in enumerate(frames):
+                df.to_csv(silver / f"sales_clean_{step}{i}.csv", index=False)
+            to_gold.main(["--engine", engine])
+        assert not nk_index.check(NK)
+        assert not rollups.check()   # 被覆寫的自然鍵銷售額不重複計算
+        assert not cdc.verify()      # 對空表套用所有 run 後與 gold 一致
+        runs = cdc.load_log()["runs"]
+        assert [r["seq"] for r in runs] == [1, 2] and runs[1]["updated"] > 0
+        assert sum(r["inserted"] for r in runs) == gold_store.count_rows()
+        deltas.append(cdc.changes())
+    assert _gold_files(tmp_path / "pandas") == _gold_files(tmp_path / "duckdb")
+    roll = [pd.read_parquet(tmp_path / e / rollups.DAILY_PATH) for e in ("pandas", "duckdb")]
+    pd.testing.assert_frame_equal(*roll)
+    assert roll[0]["orders"].sum() == gold_store.count_rows()
+    pd.testing.assert_frame_equal(*deltas)
+    import pyarrow.parquet as pq   # 兩個引擎的 delta 檔 schema 必須一致（含空的 before）
+    schemas = [[pq.read_schema(f) for f in sorted((tmp_path / e / cdc.CDC_DIR).glob("run-*/*.parquet"))]
+               for e in ("pandas", "duckdb")]
+    assert schemas[0] == schemas[1] and len(schemas[0]) == 4
+    assert str(schemas[0][1].field("order_date").type) == "int32" and str(schemas[0][1].field("geo_id").type) == "string"
+
+def test_sharded_upsert_matches_single_process(tmp_path, monkeypatch):
+    batches = [
+        [gold_like(30, 1), gold_like(25, 2, day=20250102)],
+        [gold_like(20, 3), gold_like(10, 4, day=20250103), gold_like(15, 5, day=20250102)],
+    ]
+    modes = {"single": [], "shards3": ["--shards", "3", "--shard-workers", "1"], "shards2": ["--shards", "2", "--shard-workers", "2"]}
+    deltas = {}
+    for mode, args in modes.items():
+        root = tmp_path / mode; silver = root / "data" / "silver"; silver.mkdir(parents=True)
+        monkeypatch.chdir(root)
+        for step, frames in enumerate(batches):
+            for i, df in enumerate(frames):
+                df.to_csv(silver / f"sales_clean_{step}{i}.csv", index=False)
+            to_gold.main(args)
+        assert not nk_index.check(NK) and not rollups.check() and not cdc.verify()
+        assert not (root / "data" / "gold" / "_shards").exists()
+        deltas[mode] = [cdc.changes(image=i) for i in ("after", "before")]
+    for mode in ("shards3", "shards2"):
+        assert _gold_files(tmp_path / mode) == _gold_files(tmp_path / "single")
+        for a, b in zip(deltas[mode], deltas["single"]):
+            pd.testing.assert_frame_equal(a, b)
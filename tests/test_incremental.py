@@ -0,0 +1,118 @@
+import os
+from manifest import Manifest
+
+def test_manifest_skips_unchanged_and_touched_inputs(tmp_path):
+    src, out = tmp_path / "sales_20250101.csv", tmp_path / "out.csv"
+    src.write_text("a\n1\n"); out.write_text("x")
+    man = Manifest(tmp_path / "_manifest.json")
+    assert man.changed(src)
+    man.record(src, [out]); man.save()
+
+    man = Manifest(tmp_path / "_manifest.json")
+    assert not man.changed(src)
+    st = src.stat()
+    os.utime(src, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))   # identical rewrite
+    assert not man.changed(src)
+
+    src.write_text("a\n2\n")
+    assert man.changed(src)
+
+def test_manifest_reprocesses_when_output_missing(tmp_path):
+    src, out = tmp_path / "in.csv", tmp_path / "out.csv"
+    src.write_text("a\n1\n"); out.write_text("x")
+    man = Manifest(tmp_path / "_manifest.json")
+    man.record(src, [out])
+    out.unlink()
+    assert man.changed(src)
+
+def test_pipeline_skips_stages_with_unchanged_inputs(tmp_path):
+    import subprocess, sys
+    from pathlib import Path
+    script = Path(__file__).resolve().parents[1] / "scripts" / "pipeline.py"
+    run = lambda: subprocess.run([sys.executable, str(script), "--gen-days", "2", "gold"],
+                                 cwd=tmp_path, capture_output=True, text=True, check=True).stdout
+    first = run()
+    assert "inputs unchanged" not in first and "[to_gold] Rewrote" in first
+    assert run().count("inputs unchanged, skipped") == 3
+    raw = sorted((tmp_path / "data" / "raw").glob("sales_*.csv"))[0]
+    raw.write_text(raw.read_text() + "x1,20250101,GEO01,P001,1,100.0\n")
+    third = run()
+    assert "ingest: inputs unchanged" in third and "silver ..." in third and "gold ..." in third
+
+def test_pipeline_writes_run_profile(tmp_path):
+    import json, subprocess, sys
+    from pathlib import Path
+    script = Path(__file__).resolve().parents[1] / "scripts" / "pipeline.py"
+    subprocess.run([sys.executable, str(script), "--gen-days", "2", "--workers", "2", "gold"],
+                   cwd=tmp_path, capture_output=True, text=True, check=True)
+    spans = {s["path"]: s for s in json.loads((tmp_path / "reports" / "run_profile.json").read_text())["runs"]["pipeline"]["spans"]}
+    clean = spans["pipeline/silver/to_silver/process_file/clean_one"]   # pool worker 端的 span
+    assert clean["calls"] == 2 and clean["rows_out"] > 0
+    assert spans["pipeline/gold/to_gold"]["rows_out"] == spans["pipeline/gold/to_gold/write_partition"]["rows_out"] > 0
+
+def test_run_sql_caches_results_until_inputs_change(tmp_path, monkeypatch, capsys):
+    import run_sql
+    items = run_sql.split_script(".print === X ===\n-- a; b\nSELECT 'x;y' AS s;\n/* ; */ SELECT 2;\n")
+    assert [i[0] for i in items] == ["dot", "sql", "sql"] and items[1][2] == "SELECT 'x;y' AS s"
+    monkeypatch.chdir(tmp_path)
+    q = tmp_path / "data" / "silver" / "quarantine"; q.mkdir(parents=True)
+    (q / "sales_bad_20250101.csv").write_text("order_id,_bad_reason\n1,bad_date\n")
+    (tmp_path / "q.sql").write_text(".print hello\nSELECT count(*) AS n FROM quarantine;\nSELECT 1 AS one;\n")
+    outs = []
+    for rows in ("", "2,missing_geo\n"):
+        with open(q / "sales_bad_20250101.csv", "a") as f: f.write(rows)
+        os.utime(q / "sales_bad_20250101.csv", ns=(1, len(outs) + 1))
+        run_sql.main(["q.sql"]); run_sql.main(["q.sql"]); outs.append(capsys.readouterr().out)
+    assert outs[0].startswith("hello") and "1/2 statements served" in outs[0]   # SELECT 1 不讀 view → 不快取
+    assert " 2\n" in outs[1] and outs[1].count("statements served") == 1
+
+def test_run_sql_script_tables_do_not_outlive_the_run(tmp_path, monkeypatch, capsys):
+    import duckdb, run_sql
+    monkeypatch.chdir(tmp_path)
+    q = tmp_path / "data" / "silver" / "quarantine"; q.mkdir(parents=True)
+    (q / "sales_bad_20250101.csv").write_text("order_id,_bad_reason\n1,bad_date\n2,neg_or_zero_qty\n")
+    (tmp_path / "r.sql").write_text("CREATE TABLE fact_returns AS SELECT * FROM quarantine WHERE _bad_reason LIKE '%qty%';\n"
+                                    "SELECT count(*) AS n FROM fact_returns;\n"
+                                    "SELECT count(*) AS n, random() < 1 AS r FROM quarantine;\n")
+    run_sql.main(["r.sql"]); run_sql.main(["r.sql"])
+    out = capsys.readouterr().out
+    assert "[ERROR]" not in out and "statements served" not in out
+    con = duckdb.connect(str(run_sql.CATALOG_PATH))
+    assert not con.execute("SELECT * FROM duckdb_tables() WHERE table_name = 'fact_returns'").fetchall()
+
+def test_watch_once_processes_new_raw_files(tmp_path):
+    import subprocess, sys
+    import pandas as pd
+    from pathlib import Path
+    scripts = Path(__file__).resolve().parents[1] / "scripts"
+    run = lambda *a: subprocess.run([sys.executable, str(scripts / a[0]), *a[1:]],
+                                    cwd=tmp_path, capture_output=True, text=True, check=True).stdout
+    run("generate_sales.py", "--days", "2")
+    first = run("watch.py", "--once", "--settle", "0")
+    assert "micro-batch of 2" in first and "[to_gold] Rewrote" in first
+    lat = pd.read_csv(tmp_path / "reports" / "watch_latency.csv")
+    assert len(lat) == 2 and (lat["e2e_s"] >= lat["detect_s"]).all()
+    assert "micro-batch" not in run("watch.py", "--once", "--settle", "0")   # 已處理的不再重新排入
+
+def test_backfill_resumes_after_failed_unit(tmp_path):
+    import json, subprocess, sys
+    from pathlib import Path
+    scripts = Path(__file__).resolve().parents[1] / "scripts"
+    run = lambda name, *args: subprocess.run([sys.executable, str(scripts / name), *args],
+                                             cwd=tmp_path, capture_output=True, text=True)
+    assert run("pipeline.py", "--gen-days", "4", "gold").returncode == 0
+    gold = lambda: {str(p.relative_to(tmp_path)): p.read_bytes() for p in sorted(tmp_path.glob("data/gold/fact_sales/*/part-*"))}
+    before = gold()
+    raws = sorted((tmp_path / "data" / "raw").glob("sales_*.csv"))
+    days = [p.stem.split("_")[1] for p in raws]
+    good = raws[2].read_bytes(); raws[2].write_bytes(b"\xff\xfe not a csv")
+    backfill = lambda: run("backfill.py", "--from", days[0], "--to", days[-1], "--days-in-flight", "2")
+    assert backfill().returncode == 1
+    st = json.loads((tmp_path / "data" / "_backfill_state.json").read_text())
+    assert (st["done"], st["current"], st["units"]) == (1, 1, [days[:2], days[2:]])
+    raws[2].write_bytes(good)
+    out = backfill()
+    assert out.returncode == 0 and "Resuming" in out.stdout and "Unit 1/2" not in out.stdout
+    assert gold() == before
+    assert "already complete" in backfill().stdout
+    assert run("cdc.py", "verify").returncode == 0
@@ -0,0 +1,147 @@
+import subprocess, sys
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import generate_sales
+
+SCRIPTS = Path(__file__).resolve().parents[1] / "scripts"
+
+def make_workspace(root, days=4, seed=7):
+    raw = root / "data" / "raw"; raw.mkdir(parents=True)
+    rng = np.random.default_rng(seed)
+    for i in range(days):
+        d = datetime(2025, 1, 1) + timedelta(days=i)
+        generate_sales.gen_one_day(rng, d).to_csv(raw / f"sales_{generate_sales.ymd(d)}.csv", index=False)
+    return root
+
+def run_silver(root, *args):
+    return subprocess.run([sys.executable, str(SCRIPTS / "to_silver.py"), *args],
+                          cwd=root, capture_output=True, text=True)
+
+def outputs(root):
+    silver = root / "data" / "silver"
+    return {str(p.relative_to(silver)): p.read_bytes() for p in sorted(silver.rglob("sales_*"))}
+
+def test_parallel_matches_serial(tmp_path):
+    a = make_workspace(tmp_path / "serial"); b = make_workspace(tmp_path / "parallel")
+    ra, rb = run_silver(a), run_silver(b, "--workers", "3")
+    assert ra.returncode == rb.returncode == 0
+    assert ra.stdout == rb.stdout
+    assert outputs(a) == outputs(b)
+
+def test_parallel_keeps_other_days_when_one_file_is_corrupt(tmp_path):
+    root = make_workspace(tmp_path)
+    (root / "data" / "raw" / "sales_20250102.csv").write_text("order_id,order_date\n1,2\n1,2,3,4\n")
+    r = run_silver(root, "--workers", "2")
+    assert r.returncode == 1
+    assert "Failed sales_20250102.csv" in r.stderr
+    assert r.stdout.count("Processed ") == 3
+    names = set(outputs(root))
+    assert "sales_clean_20250101.csv" in names and "sales_clean_20250104.csv" in names
+    assert "sales_clean_20250102.csv" not in names
+
+def test_streaming_matches_in_memory(tmp_path):
+    a = make_workspace(tmp_path / "full"); b = make_workspace(tmp_path / "stream")
+    ra, rb = run_silver(a), run_silver(b, "--chunk-rows", "9")   # 重複列跨越 chunk 邊界
+    assert ra.returncode == rb.returncode == 0
+    assert ra.stdout == rb.stdout
+    assert outputs(a) == outputs(b)
+
+def metrics(root, rebuild=False):
+    if rebuild:
+        subprocess.run([sys.executable, str(SCRIPTS / "dq_metrics.py"), "rebuild"], cwd=root, check=True)
+    df = pd.read_parquet(root / "data" / "gold" / "_dq_metrics" / "totals.parquet")
+    return df[df["rows"] > 0].reset_index(drop=True)
+
+def test_dq_metrics_follow_incremental_runs(tmp_path):
+    root = make_workspace(tmp_path)
+    raw = root / "data" / "raw" / "sales_20250103.csv"
+    for step, args in enumerate(([], ["--chunk-rows", "9"])):
+        if step:   # 只改一天（多一筆隔離列）→ 只更新那一天
+            raw.write_text(raw.read_text() + "x9,20250103,GEO01,P001,-1,100.0\n")
+        assert run_silver(root, *args).returncode == 0
+        subprocess.run([sys.executable, str(SCRIPTS / "to_gold.py")], cwd=root, check=True, capture_output=True)
+    incremental = metrics(root)
+    pd.testing.assert_frame_equal(incremental, metrics(root, rebuild=True))
+
+def test_generator_chunked_day_has_unique_ids_and_ratios(tmp_path):
+    rng = np.random.default_rng(3)
+    n = generate_sales.write_day(rng, datetime(2025, 1, 1), tmp_path / "d.csv", rows=5_000,
+                                 dup_ratio=0.1, bad_ratio=0.2, chunk_rows=1_500)
+    df = pd.read_csv(tmp_path / "d.csv", dtype=str)
+    assert len(df) == n
+    good = df[~df["order_id"].str.contains("BAD")]
+    assert good["order_id"].nunique() == 5_000 and len(good) == 5_000 + 500   # 重複只在 chunk 內
+    assert df["order_id"].str.contains("BAD").sum() == round(5_500 * 0.2)
+    assert not df.loc[df["order_id"].str.contains("BAD"), "order_id"].duplicated().any()
+
+def test_quarantine_store_index_and_returns(tmp_path, monkeypatch):
+    import quarantine_store
+    root = make_workspace(tmp_path)
+    raw = root / "data" / "raw" / "sales_20250103.csv"
+    assert run_silver(root).returncode == 0
+    raw.write_text(raw.read_text() + "x9,20250103,GEO01,P001,-1,100.0\n")
+    assert run_silver(root, "--chunk-rows", "9").returncode == 0
+    monkeypatch.chdir(root)
+    incremental = quarantine_store.load_index()
+    assert incremental == quarantine_store.rebuild()
+    files = sorted((root / "data" / "silver" / "quarantine").glob("sales_bad_*.csv"))
+    bad = pd.concat([pd.read_csv(p, dtype=str) for p in files], ignore_index=True)
+    assert quarantine_store.count() == len(bad)
+    expected = bad[bad["_bad_reason"].str.contains("neg_or_zero_qty")].reset_index(drop=True)
+    pd.testing.assert_frame_equal(quarantine_store.returns(), expected, check_dtype=False)
+    assert "x9" in set(quarantine_store.read(["neg_or_zero_qty"], days=["20250103"])["order_id"])
+
+def test_cross_day_duplicate_order_ids_are_quarantined(tmp_path):
+    roots = [make_workspace(tmp_path / m) for m in ("serial", "parallel", "stream")]
+    for root in roots:   # 把 1/1 的訂單在 1/3 重送（日期仍為 1/3）
+        raw = root / "data" / "raw"
+        first = pd.read_csv(raw / "sales_20250101.csv", dtype=str)
+        resent = first[~first["order_id"].str.contains("BAD")].head(3).assign(order_date="20250103")
+        with open(raw / "sales_20250103.csv", "a") as f: resent.to_csv(f, header=False, index=False)
+    for root, args in zip(roots, ([], ["--workers", "3"], ["--chunk-rows", "9"])):
+        assert run_silver(root, *args).returncode == 0
+    assert outputs(roots[0]) == outputs(roots[1])
+    silver = roots[0] / "data" / "silver"
+    bad = pd.read_csv(silver / "quarantine" / "sales_bad_20250103.csv", dtype=str)
+    dups = bad.loc[bad["_bad_reason"] == "dup_order_id", "order_id"]
+    assert sorted(dups) == sorted(resent["order_id"])
+    assert not set(dups) & set(pd.read_csv(silver / "sales_clean_20250103.csv", dtype=str)["order_id"])
+    streamed = pd.read_csv(roots[2] / "data" / "silver" / "quarantine" / "sales_bad_20250103.csv", dtype=str)
+    assert sorted(streamed["order_id"]) == sorted(bad["order_id"])
+    # 重新處理 1/1 時，不把自己那天的紀錄當成重複
+    raw1 = roots[0] / "data" / "raw" / "sales_20250101.csv"
+    raw1.write_text(raw1.read_text() + "x9,20250101,GEO01,P001,-1,100.0\n")
+    assert run_silver(roots[0]).returncode == 0
+    assert set(dups) <= set(pd.read_csv(silver / "sales_clean_20250101.csv", dtype=str)["order_id"])
+
+def test_outliers_are_quarantined_against_earlier_day_sketches(tmp_path):
+    roots = [make_workspace(tmp_path / m, days=5) for m in ("serial", "parallel", "stream")]
+    odd = pd.DataFrame({"order_id": ["X1", "X2", "X3"], "order_date": "20250105", "geo_id": "GEO01",
+                        "product_id": "P001", "quantity": ["2", "900", "3"], "unit_price": ["250000.0", "100.0", "150.0"]})
+    for root in roots:
+        with open(root / "data" / "raw" / "sales_20250105.csv", "a") as f: odd.to_csv(f, header=False, index=False)
+    for root, args in zip(roots, ([], ["--workers", "3"], ["--chunk-rows", "9"])):
+        assert run_silver(root, *args).returncode == 0
+    assert outputs(roots[0]) == outputs(roots[1])
+    for root in (roots[0], roots[2]):
+        bad = pd.read_csv(root / "data" / "silver" / "quarantine" / "sales_bad_20250105.csv", dtype=str)
+        assert sorted(bad.loc[bad["_bad_reason"] == "outlier", "order_id"]) == ["X1", "X2"]
+    assert sorted(p.name for p in (roots[0] / "data" / "silver" / "_sketches").iterdir())[-1] == "day=20250105.npz"
+
+def test_rows_that_pass_silver_pass_validation(tmp_path, monkeypatch):
+    import gold_store, validate_utils
+    schemas = Path(__file__).resolve().parents[1] / "schemas"
+    raw = tmp_path / "data" / "raw"; raw.mkdir(parents=True)
+    pd.DataFrame({"order_id": ["A1", "A2", "A3", "A4"], "order_date": "20261012", "geo_id": "GEO01",
+                  "product_id": ["P001", "", "P002", "P003"], "quantity": ["2", "1", "20000", "1"],
+                  "unit_price": ["100", "100", "100", "0.5"]}).to_csv(raw / "sales_20261012.csv", index=False)
+    assert run_silver(tmp_path).returncode == 0
+    assert subprocess.run([sys.executable, str(SCRIPTS / "to_gold.py")], cwd=tmp_path).returncode == 0
+    monkeypatch.chdir(tmp_path)
+    silver = validate_utils.validate_frames(sorted((tmp_path / "data" / "silver").glob("sales_clean_*")),
+                                            validate_utils.load_schema(schemas / "sales_silver.schema.json"), layer="silver")
+    gold = validate_utils.validate_df(gold_store.read_gold(), validate_utils.load_schema(schemas / "fact_sales_gold.schema.json"))
+    assert silver["counts"]["rows"] == 4 and silver["errors"] == [] and silver["counts"]["product_id_nulls"] == 1
+    assert gold["errors"] == [] and gold["samples"]["null:product_id"] == ["20261012|GEO01|"]
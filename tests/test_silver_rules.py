@@ -0,0 +1,28 @@
+import pandas as pd
+import quarantine_store, to_silver
+
+EDGE = pd.DataFrame({
+    "order_id":   ["a", "b", "c", "d", "e", "f", "g", "h", "i", "j"],
+    "order_date": ["20251012", "20251535", "2025101", "", None, "2025-10-12", "20250229", "20240229", " 2025101", "abc"],
+    "geo_id":     ["GEO01", "", "  ", None, "GEO02", "\t", "GEO03", "x", "GEO01", "GEO05"],
+    "product_id": ["P001"] * 10,
+    "quantity":   ["1", "-2", "0", "abc", None, "1_0", "inf", "nan", " 3 ", "1e2"],
+    "unit_price": ["100.0", "0", "-1.5", "x", "200", None, "-inf", "1,000", "300", "0.0"],
+}, dtype=str)
+
+def decode(codes):
+    return list(to_silver.REASON_TEXT[codes])
+
+def test_reason_codes_match_rowwise_rules():
+    assert decode(to_silver.reason_codes(EDGE)) == to_silver.row_reasons(EDGE)
+
+def test_reason_codes_match_rowwise_on_missing_columns():
+    df = EDGE[["order_id", "order_date"]].copy()
+    for c in ["geo_id", "product_id", "quantity", "unit_price"]:
+        df[c] = pd.NA
+    assert decode(to_silver.reason_codes(df)) == to_silver.row_reasons(df)
+
+def test_reason_text_covers_every_bitmask():
+    assert len(to_silver.REASON_TEXT) == 1 << len(quarantine_store.REASONS)
+    assert to_silver.REASON_TEXT[0] == ""
+    assert to_silver.REASON_TEXT[0b0101] == "bad_date,neg_or_zero_qty"
@@ -0,0 +1,46 @@
+import pandas as pd
+import storage
+
+DF = pd.DataFrame({
+    "order_id": ["a", "b", "c"],
+    "order_date": ["20250101", "20250102", "20250102"],
+    "geo_id": ["GEO01", "GEO02", "GEO01"],
+    "quantity": [1, 2, 3],
+    "revenue_jpy": [100.0, 200.0, 300.0],
+})
+
+def test_parquet_types_and_pushdown_match_csv(tmp_path):
+    pq = storage.write_frame(DF, tmp_path / "x", "parquet")
+    csv = storage.write_frame(DF, tmp_path / "y", "csv")
+    assert pq.suffix == ".parquet" and csv.suffix == ".csv"
+    assert str(storage.read_frame(pq)["order_date"].dtype) == "int32"
+
+    flt = [("order_date", "==", 20250102), ("geo_id", "in", ["GEO01"])]
+    a = storage.read_frame(pq, ["order_id", "revenue_jpy"], flt)
+    b = storage.read_frame(csv, ["order_id", "revenue_jpy"], flt)
+    assert list(a.columns) == ["order_id", "revenue_jpy"]
+    assert a["order_id"].tolist() == b["order_id"].tolist() == ["c"]
+
+def test_write_replaces_other_format(tmp_path):
+    storage.write_frame(DF, tmp_path / "x", "csv")
+    storage.write_frame(DF, tmp_path / "x", "parquet")
+    assert storage.glob_frames(str(tmp_path / "x")) == [str(tmp_path / "x.parquet")]
+    assert storage.count_rows(tmp_path / "x.parquet") == 3
+
+def test_untyped_write_keeps_raw_strings(tmp_path):
+    p = storage.write_frame(DF.assign(order_date=["2025x", "1", "2"]), tmp_path / "bad", "parquet", typed=False)
+    assert storage.read_frame(p)["order_date"].tolist() == ["2025x", "1", "2"]
+
+def test_typed_read_is_compact_and_writes_back_unchanged(tmp_path):
+    import typed_frames
+    src = DF.assign(product_id="P001", unit_price=[16777217.0, 1.5, 2.0], revenue_jpy=[100.0, 200.5, 300.0])
+    csv = storage.write_frame(src, tmp_path / "x", "csv")
+    for chunk_rows in (1, 250_000):
+        t = typed_frames.concat([typed_frames.apply(d, "gold") for d in storage.iter_frame(csv, chunk_rows=chunk_rows)], "gold")
+        assert t["geo_id"].dtype == "category" and t["geo_id"].cat.categories.tolist() == ["GEO01", "GEO02"]
+        assert (str(t["order_date"].dtype), str(t["quantity"].dtype), str(t["revenue_jpy"].dtype)) == ("int32", "int8", "float32")
+        assert str(t["unit_price"].dtype) == "float64"   # 16777217 無法以 float32 表示
+        assert storage.write_frame(t, tmp_path / "y", "csv").read_bytes() == csv.read_bytes()
+    bad = storage.write_frame(src.assign(order_date=["2025x", "20250102", "20250102"], quantity=[1.5, 2, 3]), tmp_path / "b", "csv")
+    t = typed_frames.read(bad, "gold")   # 無法轉換的欄位保持原樣 → 由驗證抓出
+    assert t["order_date"].tolist()[0] == "2025x" and t["quantity"].tolist()[0] == 1.5